@@ -50,10 +50,12 @@ FlaskConfig = TypedDict(
         'UPLOAD_DIR': str,
         'MIRROR_UPLOAD_DIR': str,
         'SHARED_TEMP_DIR': str,
+        'RESTORE_DIR': str,
         'MAX_NUMBER_OF_FILES': int,
         'MAX_FILE_SIZE': int,
         'MAX_NORMAL_UPLOAD_SIZE': int,
         'MAX_LARGE_UPLOAD_SIZE': int,
+        'BLACKBOARD_ZIP_WORKERS': int,
         'DEFAULT_ROLE': str,
         'EXTERNAL_URL': str,
         'JAVA_PATH': str,
@@ -73,7 +75,13 @@ FlaskConfig = TypedDict(
         'DONE_TEMPLATE': str,
         'MIN_PASSWORD_SCORE': int,
         'CHECKSTYLE_PROGRAM': t.List[str],
+        'CHECKSTYLE_DAEMON_PROGRAM': t.List[str],
+        'CHECKSTYLE_DAEMON_CLIENT_PROGRAM': t.List[str],
         'PMD_PROGRAM': t.List[str],
+        'PMD_DAEMON_PROGRAM': t.List[str],
+        'PMD_DAEMON_CLIENT_PROGRAM': t.List[str],
+        'LINTER_DAEMON_START_TIMEOUT': int,
+        'LINTER_WORKERS': int,
         'PYLINT_PROGRAM': t.List[str],
         'FLAKE8_PROGRAM': t.List[str],
         '_USING_SQLITE': str,
@@ -233,6 +241,12 @@ if not os.path.isdir(CONFIG['SHARED_TEMP_DIR']):
         ' does not exist'
     )
 
+set_str(CONFIG, backend_ops, 'RESTORE_DIR', tempfile.gettempdir())
+if not os.path.isdir(CONFIG['RESTORE_DIR']):
+    warnings.warn(
+        f'The given restore dir "{CONFIG["RESTORE_DIR"]}" does not exist'
+    )
+
 # Maximum size in bytes for single upload request
 set_int(CONFIG, backend_ops, 'MAX_FILE_SIZE', 50 * 2 ** 20)  # default: 50MB
 set_int(
@@ -243,6 +257,9 @@ set_int(
 )  # default: 128MB
 set_int(CONFIG, backend_ops, 'MAX_NUMBER_OF_FILES', 1 << 16)
 
+# The amount of threads used to process the submissions in a blackboard zip.
+set_int(CONFIG, backend_ops, 'BLACKBOARD_ZIP_WORKERS', 4, min=1)
+
 with open(
     os.path.join(CONFIG['BASE_DIR'], 'seed_data', 'course_roles.json'), 'r'
 ) as f:
@@ -340,6 +357,10 @@ href="{site_url}/courses/{course_id}">here</a>.</p>
 
 set_float(CONFIG, backend_ops, 'MIN_PASSWORD_SCORE', 3, min=0, max=4)
 
+# The amount of linter processes a single linter task may run at the same
+# time.
+set_int(CONFIG, backend_ops, 'LINTER_WORKERS', 4, min=1)
+
 set_list(
     CONFIG, backend_ops, 'CHECKSTYLE_PROGRAM', [
         'java',
@@ -368,6 +389,12 @@ set_list(
         '{config}',
     ]
 )
+# The Checkstyle and PMD daemons are disabled by default.
+set_list(CONFIG, backend_ops, 'CHECKSTYLE_DAEMON_PROGRAM', [])
+set_list(CONFIG, backend_ops, 'CHECKSTYLE_DAEMON_CLIENT_PROGRAM', [])
+set_list(CONFIG, backend_ops, 'PMD_DAEMON_PROGRAM', [])
+set_list(CONFIG, backend_ops, 'PMD_DAEMON_CLIENT_PROGRAM', [])
+set_int(CONFIG, backend_ops, 'LINTER_DAEMON_START_TIMEOUT', 30, min=1)
 set_list(
     CONFIG, backend_ops, 'PYLINT_PROGRAM', [
         'pylint',
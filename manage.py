@@ -201,14 +201,13 @@ def test_data(db=None):
                                     app.config['UPLOAD_DIR'], filename
                                 )
                             )
-                            f.children = [
-                                m.File(
-                                    work=work,
-                                    name='manage.py',
-                                    is_directory=False,
-                                    filename=filename
-                                )
-                            ]
+                            m.File(
+                                work=work,
+                                name='manage.py',
+                                is_directory=False,
+                                filename=filename,
+                                parent=f,
+                            )
                             db.session.add(work)
     db.session.commit()
     with open(
@@ -251,5 +250,21 @@ def test_data(db=None):
     db.session.commit()
 
 
+@manager.command
+def collect_blobs():
+    removed = psef.blob_store.collect_garbage()
+    print(f'Removed {removed} unreferenced blobs')
+
+
+@manager.command
+def clear_linter_cache(days=30):
+    before = datetime.datetime.utcnow() - datetime.timedelta(days=int(days))
+    removed = m.LinterResultCache.query.filter(
+        m.LinterResultCache.created_at < before
+    ).delete()
+    psef.models.db.session.commit()
+    print(f'Removed {removed} cached linter results')
+
+
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,34 @@
+"""Add size and digest to File and file totals to Work
+
+Revision ID: a7c2d5f8b1e4
+Revises: f6c9d4e1a8b3
+Create Date: 2026-10-17 01:12:44.230517
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a7c2d5f8b1e4'
+down_revision = 'f6c9d4e1a8b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('File', sa.Column('size', sa.Integer(), nullable=True))
+    op.add_column(
+        'File', sa.Column('digest', sa.String(length=64), nullable=True)
+    )
+    op.add_column(
+        'Work', sa.Column('total_file_size', sa.Integer(), nullable=True)
+    )
+    op.add_column('Work', sa.Column('file_count', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('Work', 'file_count')
+    op.drop_column('Work', 'total_file_size')
+    op.drop_column('File', 'digest')
+    op.drop_column('File', 'size')
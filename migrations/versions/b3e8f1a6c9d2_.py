@@ -0,0 +1,30 @@
+"""Add LinterResultCache table
+
+Revision ID: b3e8f1a6c9d2
+Revises: a7c2d5f8b1e4
+Create Date: 2026-10-17 02:04:51.873120
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8f1a6c9d2'
+down_revision = 'a7c2d5f8b1e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'LinterResultCache',
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('feedback', sa.Unicode(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('LinterResultCache')
@@ -0,0 +1,56 @@
+"""Add AssignmentExport table
+
+Revision ID: b5a0c5e3a7d1
+Revises: f05ffa6bcca6
+Create Date: 2026-10-16 21:40:12.324312
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b5a0c5e3a7d1'
+down_revision = 'f05ffa6bcca6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'AssignmentExport',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('submissions_total', sa.Integer(), nullable=False),
+        sa.Column('submissions_done', sa.Integer(), nullable=False),
+        sa.Column('include_feedback', sa.Boolean(), nullable=False),
+        sa.Column('filename', sa.Unicode(), nullable=True),
+        sa.Column('assignment_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ['assignment_id'], ['Assignment.id'], ondelete='CASCADE'
+        ),
+        sa.ForeignKeyConstraint(['user_id'], ['User.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    state_enum = sa.Enum(
+        'starting', 'running', 'done', 'crashed', name='exportstate'
+    )
+    state_enum.create(op.get_bind(), checkfirst=True)
+    op.add_column(
+        'AssignmentExport',
+        sa.Column('state', state_enum, nullable=False),
+    )
+
+    owner_enum = sa.Enum('student', 'teacher', 'both', name='fileowner')
+    owner_enum.create(op.get_bind(), checkfirst=True)
+    op.add_column(
+        'AssignmentExport',
+        sa.Column('exclude_owner', owner_enum, nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('AssignmentExport')
+    sa.Enum(name='exportstate').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,45 @@
+"""Add materialized path column to File
+
+Revision ID: c3e1f0a8d2b4
+Revises: b5a0c5e3a7d1
+Create Date: 2026-10-16 22:31:45.113208
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c3e1f0a8d2b4'
+down_revision = 'b5a0c5e3a7d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('File', sa.Column('path', sa.Unicode(), nullable=True))
+    conn = op.get_bind()
+    conn.execute(
+        sa.text(
+            """
+    WITH RECURSIVE paths(id, path) AS (
+        SELECT id, name FROM "File" WHERE parent_id IS NULL
+        UNION ALL
+        SELECT "File".id, paths.path || '/' || "File".name
+        FROM "File" JOIN paths ON "File".parent_id = paths.id
+    )
+    UPDATE "File" SET path = (
+        SELECT paths.path FROM paths WHERE paths.id = "File".id
+    )
+    """
+        )
+    )
+    op.alter_column('File', 'path', nullable=False)
+    op.create_index(
+        'ix_File_Work_id_path', 'File', ['Work_id', 'path'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('ix_File_Work_id_path', table_name='File')
+    op.drop_column('File', 'path')
@@ -0,0 +1,54 @@
+"""Add FileTreeCache table and a file tree version to Work
+
+Revision ID: d4a7b2c9e6f1
+Revises: c3e1f0a8d2b4
+Create Date: 2026-10-16 23:05:41.503982
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7b2c9e6f1'
+down_revision = 'c3e1f0a8d2b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing works simply get an empty version, as there are no cached trees
+    # yet.
+    op.add_column(
+        'Work',
+        sa.Column(
+            'file_tree_version',
+            sa.String(length=36),
+            nullable=False,
+            server_default='',
+        )
+    )
+    op.alter_column('Work', 'file_tree_version', server_default=None)
+
+    op.create_table(
+        'FileTreeCache',
+        sa.Column('Work_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.String(length=36), nullable=False),
+        sa.Column('tree', sa.Unicode(), nullable=False),
+        sa.ForeignKeyConstraint(['Work_id'], ['Work.id'], ondelete='CASCADE'),
+    )
+
+    owner_enum = sa.Enum('student', 'teacher', 'both', name='fileowner')
+    owner_enum.create(op.get_bind(), checkfirst=True)
+    op.add_column(
+        'FileTreeCache',
+        sa.Column('exclude_owner', owner_enum, nullable=False),
+    )
+    op.create_primary_key(
+        'FileTreeCache_pkey', 'FileTreeCache', ['Work_id', 'exclude_owner']
+    )
+
+
+def downgrade():
+    op.drop_table('FileTreeCache')
+    op.drop_column('Work', 'file_tree_version')
@@ -0,0 +1,67 @@
+"""Add SubmissionUpload table
+
+Revision ID: e5b8c3d0f7a2
+Revises: d4a7b2c9e6f1
+Create Date: 2026-10-16 23:52:41.118203
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e5b8c3d0f7a2'
+down_revision = 'd4a7b2c9e6f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'SubmissionUpload',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('upload_dir', sa.Unicode(), nullable=False),
+        sa.Column('filenames', sa.Unicode(), nullable=False),
+        sa.Column('error', sa.Unicode(), nullable=True),
+        sa.Column('assignment_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('author_id', sa.Integer(), nullable=False),
+        sa.Column('work_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ['assignment_id'], ['Assignment.id'], ondelete='CASCADE'
+        ),
+        sa.ForeignKeyConstraint(['user_id'], ['User.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(
+            ['author_id'], ['User.id'], ondelete='CASCADE'
+        ),
+        sa.ForeignKeyConstraint(['work_id'], ['Work.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    state_enum = sa.Enum(
+        'starting',
+        'running',
+        'done',
+        'failed',
+        'crashed',
+        name='uploadstate',
+    )
+    state_enum.create(op.get_bind(), checkfirst=True)
+    op.add_column(
+        'SubmissionUpload',
+        sa.Column('state', state_enum, nullable=False),
+    )
+
+    ignore_enum = sa.Enum('keep', 'delete', 'error', name='ignorehandling')
+    ignore_enum.create(op.get_bind(), checkfirst=True)
+    op.add_column(
+        'SubmissionUpload',
+        sa.Column('handle_ignore', ignore_enum, nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('SubmissionUpload')
+    sa.Enum(name='uploadstate').drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name='ignorehandling').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,34 @@
+"""Add ChunkedUpload table
+
+Revision ID: f6c9d4e1a8b3
+Revises: e5b8c3d0f7a2
+Create Date: 2026-10-17 00:31:07.512946
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'f6c9d4e1a8b3'
+down_revision = 'e5b8c3d0f7a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ChunkedUpload',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('filename', sa.Unicode(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('finalized', sa.Boolean(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['User.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('ChunkedUpload')
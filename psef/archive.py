@@ -30,6 +30,7 @@ SPDX-License-Identifier: MIT
 
 import os
 import abc
+import shutil
 import typing as t
 import tarfile
 import zipfile
@@ -57,17 +58,24 @@ class ArchiveMemberInfo(t.Generic[TT]):  # pylint: disable=unsubscriptable-objec
 
     :ivar name: The complete name of the member including previous directories.
     :ivar is_dir: Is the member a directory
+    :ivar link_target: The target of the member if it is a symbolic link,
+        otherwise ``None``.
     """
     name: str
     is_dir: bool
     size: FileSize
     orig_file: TT
+    link_target: t.Optional[str] = None
 
 
 def _safe_join(*args: str) -> str:
     return path.normpath(path.realpath(path.join(*args)))
 
 
+def _is_within(base: str, other: str) -> bool:
+    return other == base or other.startswith(base.rstrip(os.sep) + os.sep)
+
+
 class ArchiveException(Exception):
     """Base exception class for all archive errors."""
 
@@ -113,7 +121,6 @@ class Archive(t.Generic[TT]):  # pylint: disable=unsubscriptable-object
 
     def __init__(self, archive: '_BaseArchive[TT]') -> None:
         self.__archive = archive
-        self.__max_items_check_done = False
 
     @classmethod
     def is_archive(cls: t.Type['Archive'], filename: str) -> bool:
@@ -175,24 +182,25 @@ class Archive(t.Generic[TT]):  # pylint: disable=unsubscriptable-object
     def extract(self, to_path: str, max_size: FileSize) -> FileSize:
         """Safely extract the current archive.
 
+        The archive is read only once: every member is checked (see
+        :meth:`.Archive.check_files`) and its size is accounted for directly
+        before it is extracted, and symbolic links are replaced by a regular
+        file directly instead of being extracted. This means that the given
+        directory may contain some extracted files when an exception is
+        raised.
+
         :param to_path: The path were the archive should be extracted to.
-        :returns: Nothing
+        :param max_size: The maximum size of all extracted files combined.
+        :returns: The total size of the extracted files.
         """
         # Make sure we are passing a proper path as to_path
         assert to_path
         assert path.isabs(to_path)
         assert path.isdir(to_path)
 
-        self.check_files(to_path)
-        res = self.__extract_archive(to_path, max_size)
-        self._replace_symlinks(to_path)
-        return res
-
-    def __extract_archive(
-        self, base_to_path: str, max_size: FileSize
-    ) -> FileSize:
-        assert base_to_path
+        base_to_path = _safe_join(to_path)
         total_size = FileSize(0)
+        symlinks: t.List[t.Tuple[str, str]] = []
 
         def maybe_raise_too_large(extra: int = 0) -> None:
             if total_size + extra > max_size:
@@ -201,81 +209,47 @@ class Archive(t.Generic[TT]):  # pylint: disable=unsubscriptable-object
                 )
                 raise ArchiveTooLarge(max_size)
 
-        for member in self.get_members():
+        for member in self.__get_checked_members(base_to_path):
             if member.is_dir:
                 member_create_dir = _safe_join(base_to_path, member.name)
-                assert member_create_dir.startswith(base_to_path)
                 if not path.exists(member_create_dir):
                     os.makedirs(member_create_dir, mode=0o700)
-            else:
-                maybe_raise_too_large(member.size)
-
-                if member.size > app.max_single_file_size:
-                    logger.warning(
-                        'File exceeded size limit',
-                        max_size=max_size,
-                    )
-                    raise FileTooLarge(FileSize(app.max_single_file_size))
+                continue
 
-                member_to_path = _safe_join(base_to_path, member.name)
-                member_to_dir = path.dirname(member_to_path)
-                assert member_to_dir.startswith(base_to_path)
-                if not path.exists(member_to_dir):
-                    os.makedirs(member_to_dir, mode=0o700)
+            maybe_raise_too_large(member.size)
 
-                self.__archive.extract_member(member, base_to_path)
-
-                if path.islink(member_to_path):
-                    total_size = FileSize(total_size + member.size)
-                else:
-                    total_size = FileSize(
-                        total_size + path.getsize(member_to_path)
-                    )
-                maybe_raise_too_large()
+            if member.size > app.max_single_file_size:
+                logger.warning(
+                    'File exceeded size limit',
+                    max_size=max_size,
+                )
+                raise FileTooLarge(FileSize(app.max_single_file_size))
 
-        return total_size
+            member_to_path = _safe_join(base_to_path, member.name)
+            member_to_dir = path.dirname(member_to_path)
+            if not path.exists(member_to_dir):
+                os.makedirs(member_to_dir, mode=0o700)
 
-    def _replace_symlinks(self, to_path: str) -> None:
-        """Replace symlinks in the given directory with regular files
-        containing a notice that the symlink was replaced.
+            if member.link_target is None:
+                self.__archive.extract_member(member, base_to_path)
+                total_size = FileSize(
+                    total_size + path.getsize(member_to_path)
+                )
+            else:
+                self.__replace_symlink(member_to_path, member.link_target)
+                symlinks.append((member.name, member.link_target))
+                total_size = FileSize(total_size + member.size)
 
-        :param to_path: Directory to scan for symlinks.
-        :returns: Nothing
-        """
-        symlinks = []
-
-        for parent, _, files in os.walk(to_path):
-            for f in files:
-                file_path = path.join(parent, f)
-
-                if not path.islink(file_path):
-                    assert path.isfile(file_path) or path.isdir(file_path)
-                    # This cannot be covered, see:
-                    # https://bitbucket.org/ned/coveragepy/issues/198/continue-marked-as-not-covered
-                    continue  # pragma: no cover
-
-                rel_path = path.relpath(file_path, to_path)
-                link_target = os.readlink(file_path)
-
-                symlinks.append(rel_path)
-                os.remove(file_path)
-                with open(file_path, 'w') as new_file:
-                    new_file.write(
-                        (
-                            'This file was a symbolic link to "{}" when it '
-                            'was submitted, but CodeGrade does not support '
-                            'symbolic links.'
-                        ).format(link_target),
-                    )
+            maybe_raise_too_large()
 
+        if symlinks:
+            for name, link_target in symlinks:
                 logger.warning(
                     'Symlink detected in archive',
                     archive=self.__archive.filename,
-                    filename=rel_path,
+                    filename=name,
                     link_target=link_target,
                 )
-
-        if symlinks:
             add_warning(
                 (
                     'The archive contained symbolic links which are not '
@@ -284,32 +258,71 @@ class Archive(t.Generic[TT]):  # pylint: disable=unsubscriptable-object
                     'symbolic links, and the path they pointed to. Note: '
                     'This may break your submission when viewed by the '
                     'teacher.'
-                ).format(', '.join(symlinks)),
+                ).format(', '.join(name for name, _ in symlinks)),
                 APIWarnings.SYMLINK_IN_ARCHIVE,
             )
 
-    def get_members(self) -> t.Iterable[ArchiveMemberInfo[TT]]:
-        """Get the members of this archive.
+        return total_size
 
-        This function also makes sure the archive doesn't contain too many
-        members.
+    @staticmethod
+    def __replace_symlink(file_path: str, link_target: str) -> None:
+        """Create a regular file containing a notice that there was a symlink
+        at the given location.
 
+        :param file_path: The path at which the symlink should have been
+            created.
+        :param link_target: The target of the symlink.
+        :returns: Nothing
+        """
+        with open(file_path, 'w') as new_file:
+            new_file.write(
+                (
+                    'This file was a symbolic link to "{}" when it '
+                    'was submitted, but CodeGrade does not support '
+                    'symbolic links.'
+                ).format(link_target),
+            )
+
+    def __get_checked_members(self, target_path: str
+                              ) -> t.Iterator[ArchiveMemberInfo[TT]]:
+        """Get the members of this archive, while checking that they are safe
+        to extract.
+
+        Every member is checked before it is produced, so a member can be
+        extracted directly after it is produced without reading the archive
+        again.
+
+        :param target_path: The normalized path were the archive should be
+            extracted to.
         :returns: The members of the archive.
         """
         max_amount = app.config['MAX_NUMBER_OF_FILES']
-        if not self.__max_items_check_done:
-            if not self.__archive.has_less_items_than(max_amount):
+
+        for amount, member in enumerate(self.__archive.get_members(), 1):
+            if amount >= max_amount:
                 raise UnsafeArchive(
                     f'Archive contains too many files, maximum is {max_amount}'
                 )
-            self.__max_items_check_done = True
-        return self.__archive.get_members()
+
+            extract_path = _safe_join(target_path, member.name)
+            if not _is_within(target_path, extract_path):
+                raise UnsafeArchive(
+                    'Archive member destination is outside the target'
+                    ' directory', member
+                )
+
+            yield member
 
     def check_files(self, to_path: str) -> None:
         """
         Check that all of the files contained in the archive are within the
-        target directory.
+        target directory, that there are not too many of them and that they
+        all have a safe file type.
 
+        .. note::
+
+            This check is also done by :meth:`.Archive.extract`, so it is not
+            necessary to call this method before extracting.
 
         >>> from pprint import pprint
         >>> class Bunch: pass
@@ -330,19 +343,8 @@ class Archive(t.Generic[TT]):  # pylint: disable=unsubscriptable-object
         :param to_path: The path were the archive should be extracted to.
         :returns: Nothing
         """
-        target_path = _safe_join(to_path)
-
-        for member in self.get_members():
-            extract_path = _safe_join(target_path, member.name)
-
-            if not extract_path.startswith(target_path):
-                raise UnsafeArchive(
-                    'Archive member destination is outside the target'
-                    ' directory', member
-                )
-
-        if self.__archive.has_unsafe_filetypes():
-            raise UnsafeArchive('The archive contains unsafe filetypes')
+        for _ in self.__get_checked_members(_safe_join(to_path)):
+            pass
 
 
 class _BaseArchive(abc.ABC, t.Generic[TT]):
@@ -366,19 +368,16 @@ class _BaseArchive(abc.ABC, t.Generic[TT]):
     def get_members(self) -> t.Iterable[ArchiveMemberInfo[TT]]:
         """Get information of all the members of the archive.
 
+        The members may be read lazily from the archive, so a member should
+        be extracted before the next member is requested, and this method
+        should be called only once.
+
         :returns: An iterable containing an :class:`.ArchiveMemberInfo` for
             each member of the archive, including directories.
-        """
-        raise NotImplementedError
 
-    @abc.abstractmethod
-    def has_unsafe_filetypes(self) -> bool:
-        """Check if the archive contains files which are not safe.
-
-        All files that are not links, normal files or directories should be
-        considered unsafe.
-
-        :returns: True if any file is not safe.
+        :raises UnsafeArchive: If the archive contains a member that is not
+            safe to extract, i.e. that is not a link, normal file or
+            directory.
         """
         raise NotImplementedError
 
@@ -392,23 +391,6 @@ class _BaseArchive(abc.ABC, t.Generic[TT]):
         """
         raise NotImplementedError
 
-    @abc.abstractmethod
-    def has_less_items_than(self, max_items: int) -> bool:
-        """Check if an archive has less items than the given max amount.
-
-
-        .. warning::
-
-            This method is used for a security check. Take care when
-            calculating the size of the archive, as this could be an attack
-            vector for a DDOS attack. This method is always called **before**
-            :meth:`._BaseArchive.get_members`.
-
-        :param max_items: The maximum amount of items, exclusive.
-        :returns: True if the archive has less than ``max_items`` of items.
-        """
-        raise NotImplementedError
-
 
 @_archive_handlers.register_all(
     [
@@ -422,16 +404,31 @@ class _TarArchive(_BaseArchive[tarfile.TarInfo]):  # pylint: disable=unsubscript
 
     def __init__(self, filename: str) -> None:
         super().__init__(filename)
-        self._archive = tarfile.open(name=self.filename)
+        # Open the archive as a stream, this makes sure the archive is
+        # decompressed only once.
+        self._archive = tarfile.open(name=self.filename, mode='r|*')
 
     def extract_member(
         self, member: ArchiveMemberInfo[tarfile.TarInfo], to_path: str
     ) -> None:
         """Extract the given member.
 
+        Hard links are extracted as a copy of the file they link to, which
+        should be a regular file in the archive that is already extracted.
+
         :param member: The member to extract.
         :param to_path: The location to which it should be extracted.
         """
+        if member.orig_file.islnk():
+            src = _safe_join(to_path, member.orig_file.linkname)
+            if not _is_within(to_path, src) or not path.isfile(src):
+                raise UnsafeArchive(
+                    'Archive contains a hard link to a file outside the'
+                    ' archive', member
+                )
+            shutil.copyfile(src, _safe_join(to_path, member.name))
+            return
+
         # Make sure archives can be deleted later by fixing permissions
         if not member.orig_file.isdir():
             member.orig_file.mode = 0o600
@@ -443,10 +440,9 @@ class _TarArchive(_BaseArchive[tarfile.TarInfo]):  # pylint: disable=unsubscript
 
         .. note::
 
-            Only members returned by this function will be extracted. This
-            function can therefore be used to filter out some files, like
-            sparse files. Files that are symlinks should be kept, as special
-            error handling is in place for such files.
+            Only members returned by this function will be extracted. Files
+            that are symlinks are returned with their ``link_target`` set, as
+            special handling is in place for such files.
 
         >>> from pprint import pprint
         >>> zp = _TarArchive('test_data/test_submissions/multiple_dir_archive.tar.gz')
@@ -463,10 +459,14 @@ class _TarArchive(_BaseArchive[tarfile.TarInfo]):  # pylint: disable=unsubscript
 ('dir/dir2/', True, ..., ...), \
 ('dir/dir2/single_file_work', False, ..., ...), \
 ('dir/dir2/single_file_work_copy', False, ..., ...)]
+        >>> list(_TarArchive('test_data/test_submissions/non_normal_files.tar.gz').get_members())
+        Traceback (most recent call last):
+        ...
+        psef.archive.UnsafeArchive: The archive contains unsafe filetypes
         """
-        for member in self._archive.getmembers():
+        for member in self._archive:
             if not self._member_is_safe(member):
-                continue
+                raise UnsafeArchive('The archive contains unsafe filetypes')
 
             name = member.name
             if member.isdir():
@@ -476,6 +476,7 @@ class _TarArchive(_BaseArchive[tarfile.TarInfo]):  # pylint: disable=unsubscript
                 is_dir=member.isdir(),
                 size=FileSize(member.size),
                 orig_file=member,
+                link_target=member.linkname if member.issym() else None,
             )
 
     @staticmethod
@@ -485,25 +486,6 @@ class _TarArchive(_BaseArchive[tarfile.TarInfo]):  # pylint: disable=unsubscript
             member.islnk()
         )
 
-    def has_unsafe_filetypes(self) -> bool:
-        return any(
-            not self._member_is_safe(m) for m in self._archive.getmembers()
-        )
-
-    def has_less_items_than(self, max_items: int) -> bool:
-        """Check if this archive has less than a given amount of members.
-
-        :param max_items: The amount to check for.
-        """
-        i = 0
-        while True:
-            if self._archive.next() is None:
-                break
-            i += 1
-            if i >= max_items:
-                return False
-        return True
-
 
 @t.overload
 def _get_members_of_archives(  # pylint: disable=function-redefined,missing-docstring,unused-argument
@@ -575,9 +557,6 @@ class _ZipArchive(_BaseArchive[zipfile.ZipInfo]):  # pylint: disable=unsubscript
     def close(self) -> None:
         self._archive.close()
 
-    def has_unsafe_filetypes(self) -> bool:  # pylint: disable=no-self-use
-        return False
-
     def __init__(self, filename: str) -> None:
         super().__init__(filename)
         self._archive = zipfile.ZipFile(self.filename)
@@ -612,24 +591,12 @@ class _ZipArchive(_BaseArchive[zipfile.ZipInfo]):  # pylint: disable=unsubscript
         """
         yield from _get_members_of_archives(self._archive.infolist())
 
-    def has_less_items_than(self, max_items: int) -> bool:
-        """Check if this archive has less than a given amount of members.
-
-        :param max_items: The amount to check for.
-        """
-        # It is not possible to get the number of items in the zipfile without
-        # reading them all, which is done on the ``__init__`` function.
-        return len(self._archive.infolist()) < max_items
-
 
 @_archive_handlers.register('.7z')
 class _7ZipArchive(_BaseArchive[py7zlib.ArchiveFile]):  # pylint: disable=unsubscriptable-object
     def close(self) -> None:
         self._fp.close()
 
-    def has_unsafe_filetypes(self) -> bool:  # pylint: disable=no-self-use
-        return False
-
     def __init__(self, filename: str) -> None:
         super().__init__(filename)
         self._fp = open(filename, 'rb')
@@ -666,12 +633,3 @@ class _7ZipArchive(_BaseArchive[py7zlib.ArchiveFile]):  # pylint: disable=unsubs
 ('dir/dir2/single_file_work_copy', False)]
         """
         yield from _get_members_of_archives(self._archive.getmembers())
-
-    def has_less_items_than(self, max_items: int) -> bool:
-        """Check if this archive has less than a given amount of members.
-
-        :param max_items: The amount to check for.
-        """
-        # It is not possible to get the number of items in the zipfile without
-        # reading them all, which is done on the ``__init__`` function.
-        return len(self._archive.getmembers()) < max_items
@@ -0,0 +1,335 @@
+"""
+This module implements a content addressed store for uploaded files.
+
+Every distinct file content is stored exactly once, in the blob directory
+inside the upload directory, under the SHA256 digest of its contents. A
+:class:`.models.File` never refers to this blob directly, instead its
+``filename`` is a (random) hard link to the blob. This means that the
+reference count of a blob is simply its link count minus one, so creating a
+new reference (e.g. when splitting a file between a student and a teacher) is
+a cheap link instead of a full copy, and removing a reference is a normal
+unlink.
+
+Blobs that are not referenced anymore are removed by
+:func:`collect_garbage`.
+
+.. warning::
+
+    As files with the same content share their inode, the contents of a file
+    in the upload directory should never be changed in place. Instead store
+    the new contents (e.g. with :func:`store_bytes`) and :func:`release` the
+    old reference.
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import os
+import stat
+import uuid
+import fcntl
+import shutil
+import typing as t
+import hashlib
+
+import structlog
+
+from . import app
+
+logger = structlog.get_logger()
+
+BLOB_DIR_NAME = '.blobs'
+
+_CHUNK_SIZE = 2 ** 16
+
+# The ``FICLONE`` ioctl from ``linux/fs.h``, used to create reflinks.
+_FICLONE = 0x40049409
+
+_WRITE_BITS = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+
+
+class StoredFile(t.NamedTuple):
+    """A file that was stored in the blob store.
+
+    :ivar filename: The name of the file relative to the upload directory,
+        this should be saved as :attr:`.models.File.filename`.
+    :ivar digest: The hex digest of the contents of the file.
+    :ivar size: The size of the file in bytes.
+    """
+    filename: str
+    digest: str
+    size: int
+
+
+def get_blob_dir() -> str:
+    """Get the directory where the blobs are stored.
+
+    :returns: The absolute path of the blob directory.
+    """
+    return os.path.join(app.config['UPLOAD_DIR'], BLOB_DIR_NAME)
+
+
+def get_path(filename: str) -> str:
+    """Get the absolute path of a file in the store.
+
+    :param filename: The filename of the file as returned by one of the store
+        functions (or a legacy filename in the upload directory).
+    :returns: The absolute path of the file.
+    """
+    upload_dir = app.config['UPLOAD_DIR']
+    res = os.path.realpath(os.path.join(upload_dir, filename))
+    assert res.startswith(upload_dir)
+    return res
+
+
+def _get_blob_path(digest: str) -> str:
+    return os.path.join(get_blob_dir(), digest[:2], digest)
+
+
+def _new_filename() -> t.Tuple[str, str]:
+    root = app.config['UPLOAD_DIR']
+    while True:
+        name = str(uuid.uuid4())
+        candidate = os.path.join(root, name)
+        if not os.path.exists(candidate):
+            return candidate, name
+
+
+def hash_file(path: str) -> str:
+    """Get the digest of the contents of the given file as used by the store.
+
+    :param path: The file to hash.
+    :returns: The hex digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_digest(filename: str) -> str:
+    """Get the digest of the contents of a file in the store.
+
+    :param filename: The file to get the digest for.
+    :returns: The hex digest of the file.
+    """
+    return hash_file(get_path(filename))
+
+
+def _add_to_store(path: str, name: str, digest: str) -> str:
+    """Make the given file, which should be located directly in the upload
+    directory, a reference to the blob with the given digest.
+
+    :param path: The absolute path of the file.
+    :param name: The name of the file relative to the upload directory.
+    :param digest: The digest of the contents of the file.
+    :returns: The filename that should be used to refer to the content, this
+        is ``name`` if no usable blob existed yet.
+    """
+    blob_path = _get_blob_path(digest)
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    _make_read_only(path)
+
+    while True:
+        try:
+            os.link(path, blob_path)
+        except FileExistsError:
+            pass
+        except OSError:  # pragma: no cover
+            # The filesystem does not support hard links, simply store the
+            # file without deduplication.
+            logger.warning(
+                'Could not create hard link for blob',
+                blob=digest,
+                exc_info=True,
+            )
+            return name
+        else:
+            return name
+
+        new_path, new_name = _new_filename()
+        try:
+            os.link(blob_path, new_path)
+        except FileNotFoundError:  # pragma: no cover
+            # The blob was removed by the garbage collector after we checked
+            # it existed, simply try again.
+            continue
+        os.unlink(path)
+        return new_name
+
+
+def store_file(path: str) -> StoredFile:
+    """Move the given file into the store.
+
+    The file at ``path`` will not exist after this function returns.
+
+    :param path: The file to move into the store.
+    :returns: The stored file.
+    """
+    new_path, new_name = _new_filename()
+    if os.stat(path).st_dev == os.stat(app.config['UPLOAD_DIR']).st_dev:
+        os.rename(path, new_path)
+        digest = hash_file(new_path)
+        size = os.path.getsize(new_path)
+    else:
+        with open(path, 'rb') as f:
+            digest, size = _write_hashed(f, new_path)
+        os.unlink(path)
+
+    return StoredFile(
+        filename=_add_to_store(new_path, new_name, digest),
+        digest=digest,
+        size=size,
+    )
+
+
+def _write_hashed(stream: t.BinaryIO, dst: str) -> t.Tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    with open(dst, 'wb') as f:
+        for chunk in iter(lambda: stream.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+            f.write(chunk)
+    return digest.hexdigest(), size
+
+
+def store_stream(stream: t.BinaryIO) -> StoredFile:
+    """Store the contents of the given stream.
+
+    :param stream: The stream to read till its end.
+    :returns: The stored file.
+    """
+    new_path, new_name = _new_filename()
+    digest, size = _write_hashed(stream, new_path)
+    return StoredFile(
+        filename=_add_to_store(new_path, new_name, digest),
+        digest=digest,
+        size=size,
+    )
+
+
+def store_bytes(data: bytes) -> StoredFile:
+    """Store the given bytes.
+
+    :param data: The data to store.
+    :returns: The stored file.
+    """
+    new_path, new_name = _new_filename()
+    with open(new_path, 'wb') as f:
+        f.write(data)
+    digest = hashlib.sha256(data).hexdigest()
+    return StoredFile(
+        filename=_add_to_store(new_path, new_name, digest),
+        digest=digest,
+        size=len(data),
+    )
+
+
+def link(filename: str) -> str:
+    """Create a new reference to the contents of the given file.
+
+    :param filename: The file to create a new reference to.
+    :returns: A new filename with the same contents as ``filename``.
+    """
+    old_path = get_path(filename)
+    new_path, new_name = _new_filename()
+    try:
+        os.link(old_path, new_path)
+    except OSError:  # pragma: no cover
+        shutil.copyfile(old_path, new_path)
+    return new_name
+
+
+def _make_read_only(path: str) -> None:
+    mode = os.stat(path).st_mode
+    if mode & _WRITE_BITS:
+        os.chmod(path, mode & ~_WRITE_BITS)
+
+
+def _reflink(src: str, dst: str) -> None:
+    with open(src, 'rb') as src_f, open(dst, 'wb') as dst_f:
+        try:
+            fcntl.ioctl(dst_f.fileno(), _FICLONE, src_f.fileno())
+        except OSError:
+            os.unlink(dst)
+            raise
+
+
+def materialize(filename: str, dst: str, *, use_links: bool = True) -> None:
+    """Make the contents of the given file available at ``dst``.
+
+    If ``use_links`` is ``True`` a reflink is tried first, after that a hard
+    link and only if the filesystem supports neither the file is copied. The
+    resulting file is always read-only, and so is the original file in the
+    store if a hard link was created. This prevents tools that are run on the
+    resulting file from accidentally changing the original contents, however
+    note that a process running as the owner of the files can still change
+    their mode.
+
+    :param filename: The file in the store to materialize.
+    :param dst: The location where the file should be placed, this file should
+        not exist yet.
+    :param use_links: Try to use links instead of copying the file.
+    :returns: Nothing.
+    """
+    src = get_path(filename)
+
+    if use_links:
+        try:
+            _reflink(src, dst)
+        except OSError:
+            pass
+        else:
+            _make_read_only(dst)
+            return
+
+        _make_read_only(src)
+        try:
+            os.link(src, dst)
+        except OSError:
+            pass
+        else:
+            return
+
+    shutil.copyfile(src, dst, follow_symlinks=False)
+    _make_read_only(dst)
+
+
+def release(filename: str) -> None:
+    """Remove the given reference to a blob.
+
+    The blob itself will only be removed by :func:`collect_garbage` once it is
+    not referenced anymore.
+
+    :param filename: The reference to remove.
+    :returns: Nothing.
+    """
+    os.unlink(get_path(filename))
+
+
+def collect_garbage() -> int:
+    """Remove all blobs that are not referenced anymore.
+
+    It is safe to run this function while other processes use the store:
+    if a new reference is created for a blob while it is being removed the
+    reference simply keeps its contents, but it will not be deduplicated.
+
+    :returns: The amount of blobs removed.
+    """
+    removed = 0
+    blob_dir = get_blob_dir()
+    if not os.path.isdir(blob_dir):
+        return removed
+
+    for prefix in os.listdir(blob_dir):
+        prefix_dir = os.path.join(blob_dir, prefix)
+        if not os.path.isdir(prefix_dir):  # pragma: no cover
+            continue
+        for digest in os.listdir(prefix_dir):
+            blob_path = os.path.join(prefix_dir, digest)
+            if os.stat(blob_path).st_nlink == 1:
+                os.unlink(blob_path)
+                removed += 1
+
+    logger.info('Collected unreferenced blobs', amount=removed)
+    return removed
@@ -3,7 +3,9 @@
 SPDX-License-Identifier: AGPL-3.0-only
 """
 import typing as t
+import threading
 from functools import wraps
+from collections import OrderedDict
 
 import structlog
 from flask import g
@@ -87,3 +89,65 @@ def cache_within_request(f: T) -> T:
     __decorated.clear_cache = clear_cache  # type: ignore
 
     return t.cast(T, __decorated)
+
+
+K = t.TypeVar('K')
+V = t.TypeVar('V')
+
+
+class LRUCache(t.Generic[K, V]):
+    """A simple least recently used cache that lives as long as the process.
+
+    This cache is shared between all requests handled by this process, so the
+    keys should contain all information needed to decide if a value is still
+    valid (for example a version), as the cache is never invalidated.
+
+    >>> cache = LRUCache(max_size=2)
+    >>> cache.set('a', 1)
+    >>> cache.set('b', 2)
+    >>> cache.get('a')
+    1
+    >>> cache.set('c', 3)
+    >>> cache.get('b') is None
+    True
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._values: 'OrderedDict[K, V]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> t.Optional[V]:
+        """Get the value stored for the given key.
+
+        :param key: The key to get the value for.
+        :returns: The stored value or ``None`` if it is not in the cache.
+        """
+        with self._lock:
+            if key not in self._values:
+                return None
+            self._values.move_to_end(key)
+            return self._values[key]
+
+    def set(self, key: K, value: V) -> None:
+        """Store the given value in the cache.
+
+        If the cache is full the least recently used value is removed.
+
+        :param key: The key to store the value under.
+        :param value: The value to store.
+        :returns: Nothing.
+        """
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self._max_size:
+                self._values.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all values from the cache.
+
+        :returns: Nothing.
+        """
+        with self._lock:
+            self._values.clear()
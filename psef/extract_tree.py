@@ -23,6 +23,8 @@ class ExtractFileTreeBase:
     :ivar ~.ExtractFileTreeBase.name: The original name of this file in the
         archive that was extracted.
     """
+    __slots__ = ('name', 'parent')
+
     name: str
     parent: t.Optional['ExtractFileTreeDirectory']
 
@@ -69,6 +71,15 @@ class ExtractFileTreeBase:
         """
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_file_count(self) -> int:
+        """Get the amount of files in this file.
+
+        For a normal file this is always one, and for a directory it is the
+        amount of files (so not directories) in it and all its children.
+        """
+        raise NotImplementedError
+
     @property
     @abc.abstractmethod
     def is_dir(self) -> bool:
@@ -83,13 +94,22 @@ class ExtractFileTreeFile(ExtractFileTreeBase):
 
     :ivar ~.ExtractFileTreeFile.diskname: The name of the file saved in the
         uploads directory.
+    :ivar ~.ExtractFileTreeFile.size: The size of the file in bytes.
+    :ivar ~.ExtractFileTreeFile.digest: The digest of the contents of the file
+        as used by the :mod:`.blob_store`, if known.
     """
+    __slots__ = ('disk_name', 'size', 'digest')
+
     disk_name: str
     size: 'psef.archive.FileSize'
+    digest: t.Optional[str]
 
     def get_size(self) -> 'psef.archive.FileSize':
         return self.size
 
+    def get_file_count(self) -> int:
+        return 1
+
     def delete(self, base_dir: str) -> None:
         super().delete(base_dir)
         path = os.path.realpath(os.path.join(base_dir, self.disk_name))
@@ -110,18 +130,54 @@ class ExtractFileTreeFile(ExtractFileTreeBase):
 class ExtractFileTreeDirectory(ExtractFileTreeBase):
     """Type used to represent a directory of an extracted file tree.
 
+    The size and the amount of files of a directory are kept up to date when
+    children are added or removed, so getting them is always ``O(1)``. This
+    means that :attr:`.ExtractFileTreeDirectory.values` should only be
+    changed through :meth:`.ExtractFileTreeDirectory.add_child` and
+    :meth:`.ExtractFileTreeDirectory.forget_child`.
+
     :ivar ~.ExtractFileTreeDirectory.values: The items present in this
         directory.
     """
+    __slots__ = ('values', '_size', '_file_count')
+
     values: t.List[ExtractFileTreeBase]
 
+    def __post_init__(self) -> None:
+        super().__post_init__()
+        self._size = psef.archive.FileSize(
+            sum(c.get_size() for c in self.values)
+        )
+        self._file_count = sum(c.get_file_count() for c in self.values)
+
     def get_size(self) -> 'psef.archive.FileSize':
-        return psef.archive.FileSize(sum(c.get_size() for c in self.values))
+        return self._size
+
+    def get_file_count(self) -> int:
+        return self._file_count
+
+    def _update_totals(self, size: int, file_count: int) -> None:
+        cur: t.Optional[ExtractFileTreeDirectory] = self
+        while cur is not None:
+            cur._size = psef.archive.FileSize(cur._size + size)
+            cur._file_count += file_count
+            cur = cur.parent
 
     def delete(self, base_dir: str) -> None:
-        super().delete(base_dir)
-        for val in self.values:
+        # The children are deleted first, so that their deletion is recorded
+        # in the change log of the tree we are part of (if any).
+        # Copy is needed here as deleting a child removes it from our values.
+        for val in list(self.values):
             val.delete(base_dir)
+        super().delete(base_dir)
+
+    def _get_change_log(self) -> t.Optional[t.List[t.Callable[[], None]]]:
+        cur = self
+        while cur.parent is not None:
+            cur = cur.parent
+        if isinstance(cur, ExtractFileTree):
+            return cur._change_log  # pylint: disable=protected-access
+        return None
 
     def get_all_children(self) -> t.Iterable['ExtractFileTreeBase']:
         """Get all the children of this directory.
@@ -144,8 +200,19 @@ class ExtractFileTreeDirectory(ExtractFileTreeBase):
 
         :param f: The file to forget.
         """
+        change_log = self._get_change_log()
+        if change_log is not None:
+            idx = self.values.index(f)
+            change_log.append(lambda: self._insert_child(idx, f))
+
         f.forget_parent()
         self.values.remove(f)
+        self._update_totals(-f.get_size(), -f.get_file_count())
+
+    def _insert_child(self, idx: int, f: ExtractFileTreeBase) -> None:
+        f.parent = self
+        self.values.insert(idx, f)
+        self._update_totals(f.get_size(), f.get_file_count())
 
     def add_child(self, f: ExtractFileTreeBase) -> None:
         """Add a directory as a child.
@@ -157,6 +224,7 @@ class ExtractFileTreeDirectory(ExtractFileTreeBase):
 
         f.parent = self
         self.values.append(f)
+        self._update_totals(f.get_size(), f.get_file_count())
 
     def __to_json__(self) -> t.Mapping[str, object]:
         return {
@@ -203,7 +271,50 @@ class ExtractFileTree(ExtractFileTreeDirectory):
     """Type used to represent the top of an extracted file tree.
 
     This is simply a directory with some utility methods.
+
+    Changes made to the structure of the tree can be recorded, see
+    :meth:`.ExtractFileTree.start_recording_changes`, which makes it possible
+    to get the original tree back without copying it beforehand.
     """
+    __slots__ = ('_change_log', )
+
+    def __post_init__(self) -> None:
+        super().__post_init__()
+        self._change_log: t.Optional[t.List[t.Callable[[], None]]] = None
+
+    def start_recording_changes(self) -> None:
+        """Start recording the removal of files from this tree, and the
+        removal of leading directories.
+
+        Only changes made by :meth:`.ExtractFileTreeDirectory.forget_child`
+        (and so by ``delete``) and :meth:`.ExtractFileTree.remove_leading_self`
+        are recorded. Renaming files is not supported while recording.
+
+        :returns: Nothing.
+        """
+        assert self._change_log is None
+        self._change_log = []
+
+    def stop_recording_changes(self) -> None:
+        """Stop recording changes, and forget all recorded changes.
+
+        :returns: Nothing.
+        """
+        self._change_log = None
+
+    def undo_recorded_changes(self) -> None:
+        """Undo all changes made since recording started, and stop recording.
+
+        The tree will have the same structure and sizes as it had when
+        :meth:`.ExtractFileTree.start_recording_changes` was called, however
+        files deleted in the meantime are not restored on disk.
+
+        :returns: Nothing.
+        """
+        assert self._change_log is not None
+        change_log, self._change_log = self._change_log, None
+        while change_log:
+            change_log.pop()()
 
     @property
     def contains_file(self) -> bool:
@@ -211,9 +322,7 @@ class ExtractFileTree(ExtractFileTreeDirectory):
 
         :returns: If the file tree contains actual files
         """
-        return any(
-            isinstance(v, ExtractFileTreeFile) for v in self.get_all_children()
-        )
+        return self.get_file_count() > 0
 
     def remove_leading_self(self) -> None:
         """Removing leading directories in this directory.
@@ -234,3 +343,13 @@ class ExtractFileTree(ExtractFileTreeDirectory):
         for grandchild in child.values:
             grandchild.parent = self
         self.values = child.values
+
+        if self._change_log is not None:
+
+            def __undo() -> None:
+                for grandchild in child.values:
+                    grandchild.parent = child
+                child.parent = self
+                self.values = [child]
+
+            self._change_log.append(__undo)
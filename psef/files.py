@@ -4,25 +4,26 @@ extracting and abstracting the structures of directories and archives.
 
 SPDX-License-Identifier: AGPL-3.0-only
 """
-import io
 import os
 import re
-import copy
 import uuid
 import shutil
 import typing as t
 import tarfile
 import zipfile
 import tempfile
+import threading
+import concurrent.futures
 
 import structlog
 import mypy_extensions
+from flask import g
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
 
 import psef.models as models
 
-from . import app, archive, helpers, blackboard
+from . import app, archive, helpers, blackboard, blob_store
 from .ignore import (
     DeletionType, FileDeletion, IgnoreHandling, SubmissionFilter,
     EmptySubmissionFilter
@@ -195,7 +196,7 @@ class IgnoredFilesException(APIException):
             api_code=APICodes.INVALID_FILE_IN_ARCHIVE,
             status_code=400,
             invalid_files=[
-                [d.deleted_file.get_full_name(), d.reason]
+                [d.fullname, d.reason]
                 for d in self.invalid_files
                 if d.deletion_type != DeletionType.leading_directory
             ],
@@ -230,8 +231,7 @@ def get_stat_information(file: models.File) -> t.Mapping[str, t.Any]:
     if file.is_directory:
         size = 0
     else:
-        filename = file.get_diskname()
-        size = os.stat(filename).st_size
+        size = file.get_stored_file().size
 
     return {
         'is_directory': file.is_directory,
@@ -241,11 +241,14 @@ def get_stat_information(file: models.File) -> t.Mapping[str, t.Any]:
     }
 
 
-def get_file_contents(code: models.File) -> bytes:
-    """Get the contents of the given :class:`.models.File`.
+def get_readable_diskname(code: models.File) -> str:
+    """Get the path on disk of the given :class:`.models.File` and check that
+    its contents can be read.
 
-    :param code: The file object to read.
-    :returns: The contents of the file with newlines.
+    :param code: The file object to get the path for.
+    :returns: The absolute path of the contents of the file.
+
+    :raises APIException: If the file is a directory. (OBJECT_WRONG_TYPE)
     """
     if code.is_directory:
         raise APIException(
@@ -267,7 +270,16 @@ def get_file_contents(code: models.File) -> bytes:
             'The file {} is a symlink'.format(code.id), APICodes.INVALID_STATE,
             410
         )
-    with open(filename, 'rb') as codefile:
+    return filename
+
+
+def get_file_contents(code: models.File) -> bytes:
+    """Get the contents of the given :class:`.models.File`.
+
+    :param code: The file object to read.
+    :returns: The contents of the file with newlines.
+    """
+    with open(get_readable_diskname(code), 'rb') as codefile:
         return codefile.read()
 
 
@@ -330,11 +342,20 @@ def search_path_in_filetree(filetree: FileTree, path: str) -> int:
 def restore_directory_structure(
     work: models.Work,
     parent: str,
-    exclude: models.FileOwner = models.FileOwner.teacher
+    exclude: models.FileOwner = models.FileOwner.teacher,
+    *,
+    use_links: bool = False,
 ) -> FileTree:
     """Restores the directory structure recursively for a submission
     (a :class:`.models.Work`).
 
+    If ``use_links`` is ``True`` the files are hard linked (or reflinked) from
+    the upload directory instead of copied, see
+    :func:`.blob_store.materialize`. The restored files are always read-only,
+    so the restored tree should only be used for reading. Links can only be
+    created if ``parent`` is on the same filesystem as the upload directory,
+    so it is best located in the ``RESTORE_DIR``.
+
     The directory structure is returned like this:
 
     .. code:: python
@@ -367,6 +388,7 @@ def restore_directory_structure(
     :param work: A submissions.
     :param parent: Path to parent directory.
     :param exclude: The file owner to exclude.
+    :param use_links: Link the files instead of copying them.
     :returns: A tree as described.
     """
     code = helpers.filter_single_or_404(
@@ -376,26 +398,28 @@ def restore_directory_structure(
         models.File.fileowner != exclude,
     )
     cache = work.get_file_children_mapping(exclude)
-    return _restore_directory_structure(code, parent, cache)
+    return _restore_directory_structure(code, parent, cache, use_links)
 
 
 def _restore_directory_structure(
     code: models.File,
     parent: str,
     cache: t.Mapping[int, t.Sequence[models.File]],
+    use_links: bool,
 ) -> FileTree:
     """Worker function for :py:func:`.restore_directory_structure`
 
     :param code: A file
     :param parent: Path to parent directory
     :param cache: The cache to use to get file children.
+    :param use_links: Link the files instead of copying them.
     :returns: A tree as described in :py:func:`.restore_directory_structure`
     """
     out = os.path.join(parent, code.name)
     if code.is_directory:
         os.mkdir(out)
         subtree: t.List[FileTree] = [
-            _restore_directory_structure(child, out, cache)
+            _restore_directory_structure(child, out, cache, use_links)
             for child in cache[code.id]
         ]
         return {
@@ -404,7 +428,8 @@ def _restore_directory_structure(
             "entries": subtree,
         }
     else:  # this is a file
-        shutil.copyfile(code.get_diskname(), out, follow_symlinks=False)
+        assert code.filename is not None
+        blob_store.materialize(code.filename, out, use_links=use_links)
         return {"name": code.name, "id": code.id}
 
 
@@ -420,9 +445,8 @@ def rename_directory_structure(rootdir: str) -> ExtractFileTreeDirectory:
             - file 2
         - file 3
 
-    will be moved to files given by :py:func:`random_file_path` and the object
-    returned will represent the file structure, which will be something like
-    this:
+    will be moved into the :mod:`.blob_store` and the object returned will
+    represent the file structure, which will be something like this:
 
     .. code:: python
 
@@ -465,14 +489,14 @@ def rename_directory_structure(rootdir: str) -> ExtractFileTreeDirectory:
 
         for key, value in dirs.items():
             if value is None:
-                new_name, filename = random_file_path()
-                shutil.move(os.path.join(name, key), new_name)
+                stored = blob_store.store_file(os.path.join(name, key))
                 res.append(
                     ExtractFileTreeFile(
                         name=key,
-                        disk_name=filename,
+                        disk_name=stored.filename,
                         parent=None,
-                        size=get_file_size(new_name),
+                        size=archive.FileSize(stored.size),
+                        digest=stored.digest,
                     )
                 )
             else:
@@ -506,18 +530,58 @@ def extract_to_temp(
     :returns: The pathname of the new temporary directory.
     """
     tmpfd, tmparchive = tempfile.mkstemp()
-    size: archive.FileSize
 
     try:
         os.remove(tmparchive)
         tmparchive += '_archive_{}'.format(
             os.path.basename(secure_filename(file.filename))
         )
-        tmpdir = tempfile.mkdtemp(dir=parent_result_dir)
         file.save(tmparchive)
+        return extract_path_to_temp(
+            tmparchive,
+            max_size=max_size,
+            archive_name=archive_name,
+            parent_result_dir=parent_result_dir,
+        )
+    finally:
+        os.close(tmpfd)
+        if os.path.exists(tmparchive):
+            os.remove(tmparchive)
+
+
+def extract_path_to_temp(
+    path: str,
+    max_size: archive.FileSize,
+    archive_name: str = 'archive',
+    parent_result_dir: t.Optional[str] = None,
+) -> t.Tuple[str, archive.FileSize]:
+    """Extracts the archive stored at the given path into a temporary
+    directory.
+
+    This is the same as :func:`extract_to_temp`, but for an archive that is
+    already stored on disk, so it doesn't have to be copied first. The type of
+    the archive is determined by the extension of ``path``.
 
-        with archive.Archive.create_from_file(tmparchive) as arch:
-            size = arch.extract(to_path=tmpdir, max_size=max_size)
+    :param path: The path of the archive to extract, this file is not
+        removed.
+    :param max_size: The maximum size the extracted archive may be.
+    :param archive_name: The name used for the archive in error messages.
+    :param parent_result_dir: The location the resulting directory should be
+        placed in.
+    :returns: The pathname of the new temporary directory.
+    """
+    size: archive.FileSize
+    tmpdir = tempfile.mkdtemp(dir=parent_result_dir)
+
+    try:
+        try:
+            with archive.Archive.create_from_file(path) as arch:
+                size = arch.extract(to_path=tmpdir, max_size=max_size)
+        except:
+            # The archive is extracted while it is checked, so the directory
+            # can contain some files of the rejected archive.
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            raise
     except (
         tarfile.ReadError, zipfile.BadZipFile,
         archive.UnrecognizedArchiveFormat
@@ -540,13 +604,35 @@ def extract_to_temp(
             APICodes.INVALID_FILE_IN_ARCHIVE,
             400,
         )
-    finally:
-        os.close(tmpfd)
-        os.remove(tmparchive)
 
     return tmpdir, size
 
 
+def _tree_from_extracted_dir(tmpdir: str, name: str) -> ExtractFileTree:
+    """Move the files of an extracted archive into the :mod:`.blob_store`.
+
+    :param tmpdir: The directory with the extracted archive, this directory
+        is removed.
+    :param name: The name of the root of the returned tree.
+    :returns: A tree with the contents of ``tmpdir``.
+    """
+    try:
+        res = rename_directory_structure(tmpdir).values
+        for val in res:
+            val.forget_parent()
+
+        new_parent = ExtractFileTree(
+            name=name,
+            values=[],
+            parent=None,
+        )
+        for val in res:
+            new_parent.add_child(val)
+        return new_parent
+    finally:
+        shutil.rmtree(tmpdir)
+
+
 def extract(
     file: FileStorage,
     max_size: archive.FileSize,
@@ -567,22 +653,7 @@ def extract(
         file=file,
         max_size=max_size,
     )
-
-    try:
-        res = rename_directory_structure(tmpdir).values
-        for val in res:
-            val.forget_parent()
-
-        new_parent = ExtractFileTree(
-            name=file.filename,
-            values=[],
-            parent=None,
-        )
-        for val in res:
-            new_parent.add_child(val)
-        return new_parent
-    finally:
-        shutil.rmtree(tmpdir)
+    return _tree_from_extracted_dir(tmpdir, file.filename)
 
 
 def random_file_path(use_mirror_dir: bool = False) -> t.Tuple[str, str]:
@@ -626,17 +697,7 @@ def process_files(
     :returns: The tree of the files as is described by
         :py:func:`rename_directory_structure`
     """
-    if ignore_filter is None:
-        ignore_filter = EmptySubmissionFilter()
-
-    if (
-        handle_ignore == IgnoreHandling.keep and
-        not ignore_filter.can_override_ignore_filter
-    ):
-        raise APIException(
-            'Overriding the ignore filter is not possible for this assignment',
-            'The filter disallows overriding it', APICodes.INVALID_PARAM, 400
-        )
+    ignore_filter = _get_ignore_filter(ignore_filter, handle_ignore)
 
     def consider_archive(f: FileStorage) -> bool:
         return not force_txt and archive.Archive.is_archive(f.filename)
@@ -650,14 +711,14 @@ def process_files(
                     max_size=max_size,
                 ))
             else:
-                new_file_name, filename = random_file_path()
-                file.save(new_file_name)
+                stored = blob_store.store_stream(file.stream)
                 tree.add_child(
                     ExtractFileTreeFile(
                         name=file.filename,
-                        disk_name=filename,
+                        disk_name=stored.filename,
                         parent=None,
-                        size=get_file_size(new_file_name),
+                        size=archive.FileSize(stored.size),
+                        digest=stored.digest,
                     )
                 )
                 if tree.get_size() > app.max_single_file_size:
@@ -671,6 +732,50 @@ def process_files(
             max_size=max_size,
         )
 
+    return process_file_tree(tree, max_size, ignore_filter, handle_ignore)
+
+
+def _get_ignore_filter(
+    ignore_filter: t.Optional[SubmissionFilter],
+    handle_ignore: IgnoreHandling,
+) -> SubmissionFilter:
+    if ignore_filter is None:
+        ignore_filter = EmptySubmissionFilter()
+
+    if (
+        handle_ignore == IgnoreHandling.keep and
+        not ignore_filter.can_override_ignore_filter
+    ):
+        raise APIException(
+            'Overriding the ignore filter is not possible for this assignment',
+            'The filter disallows overriding it', APICodes.INVALID_PARAM, 400
+        )
+
+    return ignore_filter
+
+
+def process_file_tree(
+    tree: ExtractFileTree,
+    max_size: archive.FileSize,
+    ignore_filter: t.Optional[SubmissionFilter] = None,
+    handle_ignore: IgnoreHandling = IgnoreHandling.keep,
+) -> ExtractFileTree:
+    """Process an already stored file tree by filtering it and checking its
+    size.
+
+    This is the part of :func:`process_files` that is done after the files
+    are extracted, so it can also be used for trees that were created in
+    another way.
+
+    :param tree: The tree to process, the files of this tree should be stored
+        in the :mod:`.blob_store`.
+    :param max_size: The maximum combined size of all files.
+    :param ignore_filter: The files and directories that should be ignored.
+    :param handle_ignore: Determines how ignored files should be handled.
+    :returns: The processed tree.
+    """
+    ignore_filter = _get_ignore_filter(ignore_filter, handle_ignore)
+
     if not tree.contains_file:
         raise APIException(
             'No files found in archive',
@@ -680,23 +785,29 @@ def process_files(
         )
 
     tree.fix_duplicate_filenames()
-    original_tree = copy.deepcopy(tree)
-    tree, total_changes, missing_files = ignore_filter.process_submission(
-        tree, handle_ignore
-    )
-    actual_file_changes = any(
-        c.deletion_type != DeletionType.leading_directory
-        for c in total_changes
-    )
-    if missing_files or (
-        handle_ignore == IgnoreHandling.error and actual_file_changes
-    ):
-        raise IgnoredFilesException(
-            total_changes,
-            ignore_filter.CGIGNORE_VERSION,
-            original_tree=original_tree,
-            missing_files=missing_files,
+    # Instead of copying the tree, which is expensive for large trees, we
+    # record the changes so we can undo them when we need the original tree.
+    tree.start_recording_changes()
+    try:
+        tree, total_changes, missing_files = ignore_filter.process_submission(
+            tree, handle_ignore
+        )
+        actual_file_changes = any(
+            c.deletion_type != DeletionType.leading_directory
+            for c in total_changes
         )
+        if missing_files or (
+            handle_ignore == IgnoreHandling.error and actual_file_changes
+        ):
+            tree.undo_recorded_changes()
+            raise IgnoredFilesException(
+                total_changes,
+                ignore_filter.CGIGNORE_VERSION,
+                original_tree=tree,
+                missing_files=missing_files,
+            )
+    finally:
+        tree.stop_recording_changes()
 
     logger.info('Removing files', removed_files=total_changes)
 
@@ -727,74 +838,408 @@ def process_files(
     return tree
 
 
-def process_blackboard_zip(
-    blackboard_zip: FileStorage,
-    max_size: archive.FileSize,
-) -> t.MutableSequence[t.Tuple[blackboard.SubmissionInfo, ExtractFileTree]]:
-    """Process the given :py:mod:`.blackboard` zip file.
+class ManifestEntry(t.NamedTuple):
+    """A single file in the manifest of a submission.
 
-    This is done by extracting, moving and saving the tree structure of each
-    submission.
+    :ivar path: The parts of the path of the file in the submission.
+    :ivar digest: The SHA256 hex digest of the contents of the file, as used
+        by the :mod:`.blob_store`.
+    :ivar size: The size of the file in bytes, as given by the client.
+    """
+    path: t.Sequence[str]
+    digest: str
+    size: int
 
-    :param file: The blackboard gradebook to import
-    :returns: List of tuples (BBInfo, tree)
+
+_DIGEST_REGEX = re.compile(r'^[0-9a-f]{64}$')
+
+
+def parse_manifest(data: helpers.JSONType) -> t.List[ManifestEntry]:
+    """Parse the manifest of a submission as given by a client.
+
+    The manifest should be a non empty list of objects with a ``path`` (a
+    forward slash separated path), a ``hash`` (the SHA256 hex digest of the
+    file) and a ``size`` (the size of the file in bytes).
+
+    :param data: The manifest to parse.
+    :returns: The entries of the manifest.
+
+    :raises APIException: If the manifest is not valid. (INVALID_PARAM)
+    """
+    if not isinstance(data, list) or not data:
+        raise APIException(
+            'The given manifest is not valid',
+            'The manifest should be a non empty list', APICodes.INVALID_PARAM,
+            400
+        )
+
+    res = []
+    for item in data:
+        item = helpers.ensure_json_dict(item)
+        helpers.ensure_keys_in_dict(
+            item, [('path', str), ('hash', str), ('size', int)]
+        )
+        path = split_path(t.cast(str, item['path']))[0] if item['path'] else []
+        digest = t.cast(str, item['hash']).lower()
+        size = t.cast(int, item['size'])
+
+        if (
+            not path or any(part in {'.', '..'} for part in path) or
+            _DIGEST_REGEX.match(digest) is None or size < 0
+        ):
+            raise APIException(
+                'The given manifest is not valid',
+                f'The entry for "{item["path"]}" is not valid',
+                APICodes.INVALID_PARAM, 400
+            )
+        res.append(ManifestEntry(path=path, digest=digest, size=size))
+
+    return res
+
+
+def get_file_digests(work: models.Work
+                     ) -> t.Dict[str, blob_store.StoredFile]:
+    """Get the digests of the contents of all files of the given submission.
+
+    :param work: The submission to get the digests for.
+    :returns: A mapping from digest to a file in the submission with those
+        contents.
+    """
+    files = models.File.query.filter(
+        models.File.work_id == work.id,
+        t.cast(models.DbColumn[str], models.File.filename).isnot(None),
+    ).all()
+    res = {}
+    for f in files:
+        stored = f.get_stored_file()
+        res[stored.digest] = stored
+    return res
+
+
+def create_tree_from_manifest(
+    manifest: t.Sequence[ManifestEntry],
+    files: t.Mapping[str, FileStorage],
+    known: t.Mapping[str, blob_store.StoredFile],
+) -> ExtractFileTree:
+    """Create a file tree for the given manifest.
+
+    The contents of every file are either taken from the given ``files`` or,
+    if it was not given, from the ``known`` files that are already stored, so
+    a client only has to upload the files that are not known yet.
+
+    :param manifest: The manifest of the submission.
+    :param files: The uploaded files, mapped by their digest. The digest of
+        their contents is checked.
+    :param known: Files that are already stored, mapped by their digest, as
+        given by :func:`get_file_digests`.
+    :returns: A tree with all files of the manifest, all files in the tree are
+        placed in a top level directory.
+
+    :raises APIException: If the contents of some file in the manifest were
+        not given and were not known, the error contains the digests of these
+        files under the key ``missing``. (INVALID_PARAM)
+    :raises APIException: If some uploaded file does not match its digest or
+        if the paths in the manifest are not unique. (INVALID_PARAM)
+    """
+    missing = sorted(
+        set(e.digest for e in manifest if e.digest not in files) -
+        set(known)
+    )
+    if missing:
+        raise APIException(
+            'Not all files of the manifest were given',
+            f'The contents of {len(missing)} files are not known',
+            APICodes.INVALID_PARAM,
+            400,
+            missing=missing,
+        )
+
+    created: t.List[str] = []
+    stored: t.Dict[str, blob_store.StoredFile] = {}
+
+    def get_stored(entry: ManifestEntry) -> blob_store.StoredFile:
+        if entry.digest in stored:
+            res = stored[entry.digest]
+            res = res._replace(filename=blob_store.link(res.filename))
+        elif entry.digest in files:
+            res = blob_store.store_stream(files[entry.digest].stream)
+            if res.digest != entry.digest:
+                blob_store.release(res.filename)
+                raise APIException(
+                    'An uploaded file does not match its hash',
+                    f'The file uploaded for "{entry.digest}" has a hash of'
+                    f' "{res.digest}"', APICodes.INVALID_PARAM, 400
+                )
+        else:
+            res = known[entry.digest]
+            try:
+                res = res._replace(filename=blob_store.link(res.filename))
+            except FileNotFoundError:  # pragma: no cover
+                # The known file was deleted in the meantime.
+                raise APIException(
+                    'Not all files of the manifest were given',
+                    'The contents of 1 file are not known anymore',
+                    APICodes.INVALID_PARAM,
+                    400,
+                    missing=[entry.digest],
+                )
+        created.append(res.filename)
+        stored.setdefault(entry.digest, res)
+        return res
+
+    tree = ExtractFileTree(name='top', values=[], parent=None)
+    dirs: t.Dict[t.Tuple[str, ...], ExtractFileTreeDirectory] = {(): tree}
+    taken: t.Set[t.Tuple[str, ...]] = set()
+
+    try:
+        for entry in manifest:
+            parts = tuple(escape_logical_filename(p) for p in entry.path)
+            for idx in range(1, len(parts) + 1):
+                key = parts[:idx]
+                is_file = idx == len(parts)
+                if key in dirs and not is_file:
+                    continue
+                elif key in taken:
+                    raise APIException(
+                        'The paths in the manifest are not unique',
+                        f'The path "{"/".join(key)}" is given multiple times',
+                        APICodes.INVALID_PARAM, 400
+                    )
+
+                taken.add(key)
+                if not is_file:
+                    dirs[key] = ExtractFileTreeDirectory(
+                        name=key[-1], values=[], parent=None
+                    )
+                    dirs[key[:-1]].add_child(dirs[key])
+                else:
+                    new_file = get_stored(entry)
+                    if new_file.size > app.max_single_file_size:
+                        helpers.raise_file_too_big_exception(
+                            app.max_single_file_size, single_file=True
+                        )
+                    dirs[key[:-1]].add_child(
+                        ExtractFileTreeFile(
+                            name=key[-1],
+                            disk_name=new_file.filename,
+                            parent=None,
+                            size=archive.FileSize(new_file.size),
+                            digest=new_file.digest,
+                        )
+                    )
+    except:  # pylint: disable=bare-except
+        for filename in created:
+            blob_store.release(filename)
+        raise
+
+    return tree
+
+
+class _SizeBudget:
+    """A size limit that is shared between multiple threads.
     """
 
-    def __get_files(info: blackboard.SubmissionInfo) -> t.List[FileStorage]:
-        files = []
+    def __init__(self, max_size: archive.FileSize) -> None:
+        self.max_size = max_size
+        self._used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def left(self) -> archive.FileSize:
+        """The amount of bytes that can still be used.
+        """
+        with self._lock:
+            return archive.FileSize(max(0, self.max_size - self._used))
+
+    def take(self, size: int, *, force: bool = False) -> None:
+        """Use the given amount of bytes of this budget.
+
+        :param size: The amount of bytes to use.
+        :param force: Use the bytes even if this exceeds the budget.
+        :returns: Nothing.
+        :raises APIException: If there are not enough bytes left and ``force``
+            is not given. (REQUEST_TOO_LARGE)
+        """
+        with self._lock:
+            if not force and self._used + size > self.max_size:
+                helpers.raise_file_too_big_exception(self.max_size)
+            self._used += size
+
+
+def _process_blackboard_submission(
+    tmpdir: str,
+    info_file: str,
+    budget: _SizeBudget,
+) -> t.Tuple[blackboard.SubmissionInfo, ExtractFileTree]:
+    """Process a single submission of an extracted :py:mod:`.blackboard` zip.
+
+    The files of the submission are moved from ``tmpdir`` into the
+    :mod:`.blob_store`. If the archives of the submission cannot be extracted,
+    or the submission is too large, all files are stored as is together with a
+    ``__WARNING__`` file.
+
+    :param tmpdir: The directory with the extracted blackboard zip.
+    :param info_file: The name of the info file of the submission.
+    :param budget: The size budget shared by all submissions in the zip.
+    :returns: The info of the submission and its tree.
+    """
+    info = blackboard.parse_info_file(os.path.join(tmpdir, info_file))
+
+    # Files that are not archives never need to be extracted, so they are
+    # moved into the store once and used by both attempts.
+    stored: t.List[t.Tuple[str, blob_store.StoredFile]] = []
+    archives: t.List[t.Tuple[str, str]] = []
+    try:
         for blackboard_file in info.files:
             if isinstance(blackboard_file, blackboard.FileInfo):
                 name = blackboard_file.original_name
-                stream = open(
-                    os.path.join(tmpdir, blackboard_file.name), mode='rb'
-                )
+                path = os.path.join(tmpdir, blackboard_file.name)
+                if archive.Archive.is_archive(name):
+                    # The archive type is determined by the extension of the
+                    # path, which might differ from the original name.
+                    new_path = os.path.join(
+                        tmpdir,
+                        f'{uuid.uuid4()}_archive_{secure_filename(name)}',
+                    )
+                    os.rename(path, new_path)
+                    archives.append((name, new_path))
+                    continue
+                stored_file = blob_store.store_file(path)
             else:
                 name = blackboard_file[0]
-                stream = io.BytesIO(blackboard_file[1])
+                stored_file = blob_store.store_bytes(blackboard_file[1])
 
             if name == '__WARNING__':
                 name = '__WARNING__ (User)'
+            stored.append((name, stored_file))
+    except:
+        for _, stored_file in stored:
+            blob_store.release(stored_file.filename)
+        raise
+
+    def make_file(name: str, stored_file: blob_store.StoredFile
+                  ) -> ExtractFileTreeFile:
+        return ExtractFileTreeFile(
+            name=name,
+            disk_name=stored_file.filename,
+            parent=None,
+            size=archive.FileSize(stored_file.size),
+            digest=stored_file.digest,
+        )
 
-            files.append(FileStorage(stream=stream, filename=name))
-        return files
+    tree = ExtractFileTree(name='top', values=[], parent=None)
+    try:
+        max_size = budget.left
+        for name, path in archives:
+            tmp_tree = _tree_from_extracted_dir(
+                extract_path_to_temp(path, max_size=max_size)[0], name
+            )
+            tree.add_child(tmp_tree)
+        for name, stored_file in stored:
+            tree.add_child(
+                make_file(name, blob_store.StoredFile(
+                    filename=blob_store.link(stored_file.filename),
+                    digest=stored_file.digest,
+                    size=stored_file.size,
+                ))
+            )
+
+        if len(tree.values) == 1 and archives:
+            # A single archive is used as the root of the submission, just
+            # like :func:`process_files` does.
+            tree = t.cast(ExtractFileTree, tree.values[0])
+            tree.forget_parent()
+        tree = process_file_tree(tree, max_size=max_size)
+        budget.take(tree.get_size())
+    # TODO: We catch all exceptions, this should probably be narrowed
+    # down, however finding all exception types is difficult.
+    except Exception:  # pylint: disable=broad-except
+        tree.delete(app.config['UPLOAD_DIR'])
+    else:
+        for _, stored_file in stored:
+            blob_store.release(stored_file.filename)
+        return info, tree
+
+    tree = ExtractFileTree(name='top', values=[], parent=None)
+    for name, path in archives:
+        tree.add_child(make_file(name, blob_store.store_file(path)))
+    for name, stored_file in stored:
+        tree.add_child(make_file(name, stored_file))
+    tree.add_child(
+        make_file(
+            '__WARNING__',
+            blob_store.store_bytes(b'Some files could not be extracted!'),
+        )
+    )
+    tree = process_file_tree(tree, max_size=budget.max_size)
+    # These files were all part of the blackboard zip, so they are always
+    # accepted.
+    budget.take(tree.get_size(), force=True)
+    return info, tree
+
+
+def process_blackboard_zip(
+    blackboard_zip: FileStorage,
+    max_size: archive.FileSize,
+) -> t.MutableSequence[t.Tuple[blackboard.SubmissionInfo, ExtractFileTree]]:
+    """Process the given :py:mod:`.blackboard` zip file.
+
+    This is done by extracting, moving and saving the tree structure of each
+    submission. The submissions are processed in parallel by
+    ``BLACKBOARD_ZIP_WORKERS`` threads, and together they may not be larger
+    than ``max_size``.
+
+    :param file: The blackboard gradebook to import
+    :param max_size: The maximum size of the gradebook and of all
+        submissions in it together.
+    :returns: List of tuples (BBInfo, tree)
+    """
+    flask_app = app._get_current_object()  # pylint: disable=protected-access
+    budget = _SizeBudget(max_size)
+
+    def __process(info_file: str) -> t.Tuple[
+        t.Tuple[blackboard.SubmissionInfo, ExtractFileTree], t.List[t.Any],
+    ]:
+        # The threads need their own app context, and the warnings raised in
+        # it are added to the request afterwards.
+        with flask_app.app_context():
+            g.request_warnings = []
+            return (
+                _process_blackboard_submission(tmpdir, info_file, budget),
+                g.request_warnings,
+            )
 
     tmpdir, _ = extract_to_temp(
         blackboard_zip,
         max_size=max_size,
     )
     try:
-        info_files = filter(
-            None, (_BB_TXT_FORMAT.match(f) for f in os.listdir(tmpdir))
+        info_files = sorted(
+            f for f in os.listdir(tmpdir) if _BB_TXT_FORMAT.match(f)
         )
-        submissions = []
-        for info_file in info_files:
-            info = blackboard.parse_info_file(
-                os.path.join(tmpdir, info_file.string)
-            )
+        if not info_files:
+            raise ValueError
 
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=app.config['BLACKBOARD_ZIP_WORKERS']
+        ) as executor:
+            futures = [executor.submit(__process, f) for f in info_files]
+            submissions = []
             try:
-                tree = process_files(
-                    files=__get_files(info), max_size=max_size
-                )
-            # TODO: We catch all exceptions, this should probably be narrowed
-            # down, however finding all exception types is difficult.
-            except Exception:  # pylint: disable=broad-except
-                files = __get_files(info)
-                files.append(
-                    FileStorage(
-                        stream=io.BytesIO(
-                            b'Some files could not be extracted!',
-                        ),
-                        filename='__WARNING__'
-                    )
-                )
-                tree = process_files(
-                    files=files, max_size=max_size, force_txt=True
-                )
-
-            submissions.append((info, tree))
-        if not submissions:
-            raise ValueError
+                for future in futures:
+                    submission, warnings = future.result()
+                    submissions.append(submission)
+                    if hasattr(g, 'request_warnings'):
+                        g.request_warnings.extend(warnings)
+            except:
+                for future in futures:
+                    future.cancel()
+                for future in futures:
+                    if not future.cancelled() and future.exception() is None:
+                        future.result()[0][1].delete(
+                            app.config['UPLOAD_DIR']
+                        )
+                raise
     finally:
         shutil.rmtree(tmpdir)
     return submissions
@@ -853,6 +853,12 @@ def get_files_from_request(
     lot too large if you provide check_size. This is done for the entire
     request, not only the processed files.
 
+    Instead of posting the files in the request the ids of finalized
+    :class:`.models.ChunkedUpload` objects of the current user can be given
+    using the ``chunked_upload`` query parameter (multiple times), in that
+    case the uploads are used as the files of the request. The uploads are
+    deleted when the request was successful.
+
     :param only_small_files: Only allow small files to be uploaded.
     :param keys: The keys the files should match in the request.
     :param only_start: If set to false the key of the request should only match
@@ -867,6 +873,14 @@ def get_files_from_request(
     if (request.content_length or 0) > max_size:
         raise_file_too_big_exception(max_size)
 
+    upload_ids = flask.request.args.getlist('chunked_upload')
+    if upload_ids:
+        return _get_files_from_chunked_uploads(
+            upload_ids,
+            max_size=max_size,
+            max_amount=None if only_start else len(keys),
+        )
+
     if not flask.request.files:
         raise errors.APIException(
             "No file in HTTP request.",
@@ -905,6 +919,55 @@ def get_files_from_request(
     return res
 
 
+def _get_files_from_chunked_uploads(
+    upload_ids: t.List[str],
+    *,
+    max_size: 'psef.archive.FileSize',
+    max_amount: t.Optional[int],
+) -> t.MutableSequence[FileStorage]:
+    if max_amount is not None and len(upload_ids) > max_amount:
+        raise errors.APIException(
+            'Too many uploads were given',
+            f'At most {max_amount} uploads can be given, but '
+            f'{len(upload_ids)} were given', errors.APICodes.INVALID_PARAM, 400
+        )
+
+    uploads = get_in_or_error(
+        models.ChunkedUpload,
+        t.cast(models.DbColumn[str], models.ChunkedUpload.id),
+        upload_ids,
+    )
+    if any(
+        u.user_id != psef.current_user.id or not u.finalized for u in uploads
+    ):
+        raise errors.APIException(
+            'Not all given uploads can be used',
+            'Some uploads are not finalized or are not yours',
+            errors.APICodes.INVALID_STATE, 400
+        )
+    if sum(u.size for u in uploads) > max_size:
+        raise_file_too_big_exception(max_size)
+
+    uploads.sort(key=lambda u: upload_ids.index(u.id))
+    res = [u.get_file() for u in uploads]
+
+    @flask.after_this_request
+    def __delete_uploads(response: flask.Response) -> flask.Response:
+        for f in res:
+            f.close()
+        # When the request failed the uploads are kept, so they can be used
+        # again, for example with another value for ``ignored_files``.
+        if response.status_code < 400:
+            for upload in uploads:
+                models.db.session.delete(upload)
+            models.db.session.commit()
+            for upload in uploads:
+                upload.delete_from_disk()
+        return response
+
+    return res
+
+
 def is_sublist(needle: t.Sequence[T], hay: t.Sequence[T]) -> bool:
     """Check if a needle is present in the given hay.
 
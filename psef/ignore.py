@@ -12,7 +12,9 @@ import copy
 import enum
 import typing as t
 import os.path
-from dataclasses import dataclass
+import functools
+from dataclasses import field, dataclass
+from collections import defaultdict
 
 import structlog
 import typing_extensions
@@ -77,16 +79,21 @@ class FileDeletion:
     deletion_type: DeletionType
     deleted_file: ExtractFileTreeBase
     reason: t.Union[str, 'FileRule']
+    fullname: str = field(init=False)
+    name: str = field(init=False)
 
     def __post_init__(self) -> None:
-        self.deleted_file = copy.deepcopy(self.deleted_file)
+        # The file will be detached from its tree when it is deleted, so save
+        # its names now.
+        self.fullname = self.deleted_file.get_full_name()
+        self.name = self.deleted_file.name
 
     def __to_json__(self) -> t.Mapping[str, t.Union[str, 'FileRule']]:
         return {
-            'fullname': self.deleted_file.get_full_name(),
+            'fullname': self.fullname,
             'reason': self.reason,
             'deletion_type': self.deletion_type.name,
-            'name': self.deleted_file.name,
+            'name': self.name,
         }
 
 
@@ -132,15 +139,14 @@ class SubmissionFilter(typing_extensions.Protocol):
     ) -> t.Tuple[ExtractFileTree, t.List[FileDeletion]]:
         """Remove leading directories from a given tree.
 
+        The tree is modified in-place.
+
         :param tree: The tree to remove the directories from.
         :returns: The modified tree, and a list of files that were deleted.
         """
         # pylint: disable=no-self-use
 
         changes = []
-        if len(tree.values) == 1 and tree.values[0].is_dir:
-            tree = copy.deepcopy(tree)
-
         while len(tree.values) == 1 and tree.values[0].is_dir:
             changes.append(
                 FileDeletion(
@@ -256,7 +262,12 @@ class EmptySubmissionFilter(SubmissionFilter):
 
 
 class Pattern:
-    """A single ignore pattern."""
+    """A single ignore pattern.
+
+    :ivar regex: The regex this pattern is translated to, it should be
+        compiled with the :data:`Pattern.REGEX_FLAGS` flags.
+    """
+    REGEX_FLAGS = re.MULTILINE | re.DOTALL
 
     def __init__(self, pattern: str, orig_line: str) -> None:
         self.pattern = pattern
@@ -268,8 +279,8 @@ class Pattern:
             if pattern[0:1] == '\\':
                 pattern = pattern[1:]
             self.is_exclude = True
-        flags = 0
-        self._re = re.compile(self.translate(pattern), flags)
+        self.regex = self.translate(pattern)
+        self._re = re.compile(self.regex, self.REGEX_FLAGS)
 
     def match(self, path: str) -> bool:
         """Try to match a path against this ignore pattern.
@@ -327,9 +338,12 @@ class Pattern:
 
         Originally copied from fnmatch in Python 2.7, but modified for Dulwich
         to cope with features in Git ignore patterns.
+
+        The resulting regex should be compiled with the
+        :data:`Pattern.REGEX_FLAGS` flags.
         """
 
-        res = '(?ms)'
+        res = ''
 
         if '/' not in pat[:-1]:
             # If there's no slash, this is a filename-based match
@@ -360,18 +374,60 @@ class Pattern:
 
 class IgnoreFilter:
     """A ignore filter. This filter consists of multiple :class:`.Filter`.
+
+    All patterns are also compiled into a single regex, so the last matching
+    pattern can be found without trying every pattern separately.
     """
 
     def __init__(self, patterns: t.Iterable[str]) -> None:
         self.original_input = patterns
 
         self._patterns: t.List[Pattern] = []
+        self._combined: t.Optional[t.Pattern] = None
         for pattern, orig_line in self.read_ignore_patterns(patterns):
             self.append_pattern(pattern, orig_line)
 
     def append_pattern(self, pattern: str, orig_line: str) -> None:
         """Add a pattern to the set."""
         self._patterns.append(Pattern(pattern, orig_line))
+        self._combined = None
+
+    def find_last_matching(self, path: str) -> t.Optional[Pattern]:
+        """Find the last pattern that matches the given path.
+
+        >>> f = IgnoreFilter(['*.py', '!main.py', 'dir/'])
+        >>> f.find_last_matching('main.py').original_line
+        '!main.py'
+        >>> f.find_last_matching('a/b.py').original_line
+        '*.py'
+        >>> f.find_last_matching('b.txt') is None
+        True
+
+        :param path: Path to match.
+        :returns: The last pattern in this filter that matches the given path,
+            or ``None`` if no pattern matches.
+        """
+        if not self._patterns:
+            return None
+
+        if self._combined is None:
+            # The alternatives of a regex are tried in order, so by reversing
+            # the patterns the last matching pattern is found.
+            self._combined = re.compile(
+                '|'.join(
+                    f'(?P<p{i}>{pattern.regex})'
+                    for i, pattern in reversed(list(enumerate(self._patterns)))
+                ),
+                Pattern.REGEX_FLAGS,
+            )
+
+        match = self._combined.match(path)
+        if match is None:
+            return None
+        # The group of the pattern contains all other groups of the pattern,
+        # so it is always closed last.
+        assert match.lastgroup is not None
+        return self._patterns[int(match.lastgroup[1:])]
 
     def find_matching(self, path: str) -> t.Iterable[Pattern]:
         """Yield all matching patterns for path.
@@ -425,6 +481,11 @@ class IgnoreFilterManager(SubmissionFilter):
         if isinstance(global_filters, str):
             global_filters = global_filters.split('\n')
         self._filter = IgnoreFilter(global_filters)
+        # The result for a directory is the same for all files in it, so it
+        # is cached.
+        self._find_dir_match = functools.lru_cache(maxsize=4096)(
+            self._find_dir_match_uncached
+        )
 
     @classmethod
     # type: ignore
@@ -461,17 +522,51 @@ class IgnoreFilterManager(SubmissionFilter):
                 return matches
         return []
 
+    def _find_dir_match_uncached(self, dir_path: str) -> t.Optional[Pattern]:
+        """Find the last pattern matching the first path leading up to and
+        including the given directory that is matched by any pattern.
+
+        :param dir_path: The path of the directory, ending with a ``/``. The
+            path ``/`` is used for the root directory.
+        :returns: The found pattern, or ``None`` if no pattern matches any of
+            the paths.
+        """
+        if dir_path != '/':
+            parent = dir_path[:dir_path.rstrip('/').rfind('/') + 1] or '/'
+            match = self._find_dir_match(parent)
+            if match is not None:
+                return match
+        return self._filter.find_last_matching(dir_path)
+
     def is_ignored(self, path: str
                    ) -> t.Union[t.Tuple[bool, str], t.Tuple[None, None]]:
         """Check whether a path is explicitly included or excluded in ignores.
 
+        This gives the same result as using the last pattern returned by
+        :meth:`.IgnoreFilterManager.find_matching`, however the results for
+        the directories leading up to the path are cached.
+
+        >>> f = IgnoreFilterManager(['venv/', '*.pyc', '!keep.pyc'])
+        >>> f.is_ignored('a/venv/b/keep.pyc')
+        (True, 'venv/')
+        >>> f.is_ignored('a/b/keep.pyc')
+        (False, '!keep.pyc')
+        >>> f.is_ignored('a/b/c.py')
+        (None, None)
+
         :param path: Path to check
         :return: None if the file is not mentioned, True if it is included,
             False if it is explicitly excluded.
         """
-        matches = self.find_matching(path)
-        if matches:
-            return matches[-1].is_exclude, matches[-1].original_line
+        assert not os.path.isabs(path), f'File "{path}" is an absolute path'
+
+        dir_end = path.rfind('/', 0, len(path) - 1) + 1
+        match = self._find_dir_match(path[:dir_end] or '/')
+        if match is None:
+            match = self._filter.find_last_matching(path)
+
+        if match is not None:
+            return match.is_exclude, match.original_line
 
         return None, None
 
@@ -779,6 +874,87 @@ class FileRule:
         return self.filename.matches(f)
 
 
+class _FileRuleIndex:
+    """An index of :class:`.FileRule` objects, used to quickly find the rules
+    that could match a file.
+
+    File rules are indexed by their name, or by the extension after their
+    wildcard, and directory rules are indexed by their first directory name.
+    """
+
+    def __init__(self, rules: t.Sequence[FileRule]) -> None:
+        self._by_name: t.DefaultDict[str, t.List[t.Tuple[int, FileRule]]
+                                     ] = defaultdict(list)
+        self._by_extension: t.DefaultDict[str, t.List[t.Tuple[int, FileRule]]
+                                          ] = defaultdict(list)
+        self._by_dir_name: t.DefaultDict[str, t.List[t.Tuple[int, FileRule]]
+                                         ] = defaultdict(list)
+        self._other_wildcards: t.List[t.Tuple[int, FileRule]] = []
+        self._always: t.List[t.Tuple[int, FileRule]] = []
+
+        for item in enumerate(rules):
+            filename = item[1].filename
+            if item[1].is_dir_rule:
+                if filename.dir_names:
+                    self._by_dir_name[filename.dir_names[0]].append(item)
+                else:
+                    self._always.append(item)
+            elif filename.wildcard_index is None:
+                self._by_name[filename.name].append(item)
+            else:
+                after = filename.name[filename.wildcard_index + 1:]
+                if '.' in after:
+                    self._by_extension[after[after.rfind('.'):]].append(item)
+                else:
+                    self._other_wildcards.append(item)
+
+    def get_candidates(self, f: ExtractFileTreeBase
+                       ) -> t.List[t.Tuple[int, FileRule]]:
+        """Get the rules that could match the given file.
+
+        >>> rules = [
+        ...  FileRule.parse({'rule_type': 'deny', 'file_type': 'file',
+        ...                  'name': name})
+        ...  for name in ['*.py', 'main.py', 'a*', 'main.c']
+        ... ] + [
+        ...  FileRule.parse({'rule_type': 'deny', 'file_type': 'directory',
+        ...                  'name': name})
+        ...  for name in ['dir/', '/']
+        ... ]
+        >>> from psef.extract_tree import ExtractFileTreeFile as File
+        >>> from psef.extract_tree import ExtractFileTreeDirectory as Dir
+        >>> top = Dir(name='top', values=[], parent=None)
+        >>> top.add_child(File(
+        ...  name='main.py', disk_name='', size=1, digest=None, parent=None
+        ... ))
+        >>> [str(r) for _, r in _FileRuleIndex(rules).get_candidates(
+        ...  top.values[0]
+        ... )]
+        ['Deny File *.py', 'Deny File main.py', 'Deny File a*', \
+'Deny Directory /']
+
+        :param f: The file to get the rules for.
+        :returns: The rules, in the order they were given, with their index.
+            Only these rules can match the given file, however they do not
+            necessarily match.
+        """
+        name_list = f.get_name_list()
+        res = list(self._always)
+
+        if not f.is_dir:
+            name = name_list[-1]
+            res.extend(self._by_name.get(name, []))
+            if '.' in name:
+                res.extend(self._by_extension.get(name[name.rfind('.'):], []))
+            res.extend(self._other_wildcards)
+
+        for dir_name in set(name_list):
+            res.extend(self._by_dir_name.get(dir_name, []))
+
+        res.sort(key=lambda item: item[0])
+        return res
+
+
 @dataclass(eq=False)
 class _OptionNameValue:
     required: bool
@@ -950,6 +1126,7 @@ class SubmissionValidator(SubmissionFilter):
         self.options = options
         self.rules = rules
         self._data = data
+        self._rule_index = _FileRuleIndex(rules)
 
     def file_allowed(self, f: ExtractFileTreeBase) -> t.Optional[FileDeletion]:
         """Check if the given file adheres to this validator.
@@ -967,18 +1144,20 @@ class SubmissionValidator(SubmissionFilter):
                 reason='Empty directory'
             )
 
+        rules = [rule for _, rule in self._rule_index.get_candidates(f)]
+
         if self.policy == self.Policy.deny_all_files:
-            if not any(rule.matches(f) for rule in self.rules):
+            if not any(rule.matches(f) for rule in rules):
                 return FileDeletion(
                     deletion_type=DeletionType.denied_file,
                     deleted_file=f,
                     reason='Default policy, no rule matches',
                 )
         elif self.policy == self.Policy.allow_all_files:
-            for rule in self.rules:
+            for rule in rules:
                 if rule.rule_type == rule.RuleType.require and rule.matches(f):
                     return None
-            for rule in self.rules:
+            for rule in rules:
                 if rule.rule_type == rule.RuleType.deny and rule.matches(f):
                     return FileDeletion(
                         deletion_type=DeletionType.denied_file,
@@ -1000,11 +1179,12 @@ class SubmissionValidator(SubmissionFilter):
             r for r in self.rules if r.rule_type == FileRule.RuleType.require
         ]
         found: t.Set[int] = set()
+        required_index = _FileRuleIndex(required_files)
 
         for f in tree.get_all_children():
             if len(found) == len(required_files):
                 break
-            for idx, required_file in enumerate(required_files):
+            for idx, required_file in required_index.get_candidates(f):
                 if required_file.matches(f):
                     # Directory rules are only satisfied when there is a file
                     # in the directory. So if we match a directory rule we
@@ -0,0 +1,347 @@
+"""
+This module implements long running servers for linters that are expensive to
+start, like Checkstyle and PMD which need a new JVM for every run.
+
+A :class:`LinterDaemon` is started once per worker process, the first time a
+linter that uses it is run, and after that jobs are passed to it over a Unix
+socket by a (cheap) client program. The server and the client are configured
+by the ``*_DAEMON_PROGRAM`` and ``*_DAEMON_CLIENT_PROGRAM`` options, for
+example using `Nailgun <https://github.com/facebook/nailgun>`_. If a daemon is
+not configured or not healthy the normal linter program is started instead,
+see :func:`run_program`.
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import os
+import time
+import atexit
+import ctypes
+import shutil
+import signal
+import socket
+import typing as t
+import tempfile
+import threading
+import subprocess
+import ctypes.util
+
+import structlog
+
+from . import app
+
+logger = structlog.get_logger()
+
+# After a daemon failed to start we do not try to start it again for this
+# amount of seconds, the normal linter program is used in the meantime.
+_START_BACKOFF = 60
+
+
+# The ``PR_SET_PDEATHSIG`` option of ``prctl`` from ``linux/prctl.h``.
+_PR_SET_PDEATHSIG = 1
+
+# This is loaded here, and not when a server is started, as loading a library
+# is not safe between forking and executing the server.
+_LIBC = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+
+
+def _set_parent_death_signal() -> None:  # pragma: no cover
+    """Make the current process receive a ``SIGTERM`` when its parent dies.
+
+    This is called in the server process before executing the server, so
+    that the server is also stopped when its worker is killed or exits without
+    running its exit handlers. This only works on Linux, on other systems it
+    does nothing.
+    """
+    prctl = getattr(_LIBC, 'prctl', None)
+    if prctl is not None:
+        prctl(_PR_SET_PDEATHSIG, signal.SIGTERM)
+
+
+class LinterDaemonError(Exception):
+    """The exception raised when a job could not be run by a
+    :class:`LinterDaemon`.
+    """
+
+
+class LinterDaemon:
+    """A long running linter server that accepts jobs over a Unix socket.
+
+    The server is (re)started when a job is run and the server is not healthy,
+    which means that its process has exited or that it does not accept
+    connections on its socket anymore.
+
+    :ivar name: The name of this daemon, used for logging.
+    :ivar restarts: The amount of times the server has been restarted.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        server_program: t.Sequence[str],
+        client_program: t.Sequence[str],
+    ) -> None:
+        """Create a new daemon, the server is not started yet.
+
+        :param name: The name of the daemon.
+        :param server_program: The program to start the server, the
+            ``{socket}`` variable is replaced by the path of the socket the
+            server should listen on.
+        :param client_program: The program to run a job on the server, this
+            is formatted with the ``{socket}`` variable and the variables
+            passed to :meth:`run`.
+        """
+        self.name = name
+        self.restarts = 0
+        self._server_program = list(server_program)
+        self._client_program = list(client_program)
+        self._lock = threading.Lock()
+        self._proc: t.Optional[subprocess.Popen] = None
+        self._socket_dir: t.Optional[str] = None
+        self._failed_at: t.Optional[float] = None
+
+    @property
+    def socket_path(self) -> t.Optional[str]:
+        """The path of the socket of the server, or ``None`` if the server is
+        not started.
+        """
+        if self._socket_dir is None:
+            return None
+        return os.path.join(self._socket_dir, 'daemon.sock')
+
+    def is_healthy(self) -> bool:
+        """Check if the server is running and accepts connections.
+
+        :returns: ``True`` if jobs can be sent to the server.
+        """
+        socket_path = self.socket_path
+        if self._proc is None or socket_path is None:
+            return False
+        if self._proc.poll() is not None:
+            return False
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(1)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return False
+        else:
+            return True
+        finally:
+            sock.close()
+
+    def _start(self) -> None:
+        if (
+            self._failed_at is not None and
+            time.monotonic() - self._failed_at < _START_BACKOFF
+        ):
+            raise LinterDaemonError('The daemon failed to start recently')
+
+        self._socket_dir = tempfile.mkdtemp(prefix='linter_daemon_')
+        socket_path = self.socket_path
+        assert socket_path is not None
+
+        logger.info('Starting linter daemon', daemon=self.name)
+        try:
+            self._proc = self._spawn_server(
+                [
+                    part.format(socket=socket_path)
+                    for part in self._server_program
+                ]
+            )
+        except OSError:
+            self._failed_to_start()
+            raise LinterDaemonError('The daemon could not be started')
+
+        deadline = time.monotonic() + app.config['LINTER_DAEMON_START_TIMEOUT']
+        while not self.is_healthy():
+            if self._proc.poll() is not None or time.monotonic() > deadline:
+                self._failed_to_start()
+                raise LinterDaemonError('The daemon did not become healthy')
+            time.sleep(0.1)
+
+        self._failed_at = None
+
+    @staticmethod
+    def _spawn_server(args: t.List[str]) -> subprocess.Popen:
+        """Start the server process from a thread that lives as long as the
+        server.
+
+        The parent death signal of the server is sent when the thread that
+        started it exits, not when the process does. So the server is not
+        started from the calling thread, which may be a short lived thread of
+        a pool, but from its own thread that waits for the server to exit.
+
+        :param args: The program to start.
+        :returns: The started server process.
+        :raises OSError: If the server could not be started.
+        """
+        started = threading.Event()
+        result: t.List[t.Union[subprocess.Popen, OSError]] = []
+
+        def __run() -> None:
+            try:
+                proc = subprocess.Popen(
+                    args,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    start_new_session=True,
+                    preexec_fn=_set_parent_death_signal,
+                )
+            except OSError as exc:
+                result.append(exc)
+                started.set()
+                return
+
+            result.append(proc)
+            started.set()
+            proc.wait()
+
+        threading.Thread(target=__run, daemon=True).start()
+        started.wait()
+
+        res = result[0]
+        if isinstance(res, OSError):
+            raise res
+        return res
+
+    def _failed_to_start(self) -> None:
+        logger.warning('The linter daemon failed to start', daemon=self.name)
+        self._failed_at = time.monotonic()
+        self.stop()
+
+    def stop(self) -> None:
+        """Stop the server of this daemon if it is running.
+
+        :returns: Nothing.
+        """
+        if self._proc is not None:
+            if self._proc.poll() is None:
+                self._proc.terminate()
+                try:
+                    self._proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self._proc.kill()
+                    self._proc.wait()
+            self._proc = None
+        if self._socket_dir is not None:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+            self._socket_dir = None
+
+    def run(self, **fmt: str) -> subprocess.CompletedProcess:
+        """Run a job on the server, starting it if needed.
+
+        :param fmt: The variables to format the client program with.
+        :returns: The completed client process, which has the output and the
+            exit code of the job.
+
+        :raises LinterDaemonError: If the server could not be started, or if it
+            stopped being healthy during the job. In the last case the output
+            of the job cannot be trusted.
+        """
+        with self._lock:
+            if not self.is_healthy():
+                if self._proc is not None:
+                    logger.warning(
+                        'Restarting unhealthy linter daemon', daemon=self.name
+                    )
+                    self.restarts += 1
+                self.stop()
+                self._start()
+            socket_path = self.socket_path
+
+        try:
+            out = subprocess.run(
+                [
+                    part.format(socket=socket_path, **fmt)
+                    for part in self._client_program
+                ],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+        except OSError:
+            raise LinterDaemonError('The daemon client could not be started')
+
+        if not self.is_healthy():
+            raise LinterDaemonError('The daemon stopped during the job')
+
+        return out
+
+
+_daemons: t.Dict[str, LinterDaemon] = {}
+_daemons_pid = os.getpid()
+_daemons_lock = threading.Lock()
+
+
+def get_daemon(
+    name: str,
+    server_program: t.Sequence[str],
+    client_program: t.Sequence[str],
+) -> t.Optional[LinterDaemon]:
+    """Get the daemon with the given name of this process.
+
+    :param name: The name of the daemon, normally the name of the linter.
+    :param server_program: The program to start the server of the daemon.
+    :param client_program: The program to send jobs to the daemon.
+    :returns: The daemon, or ``None`` if no server or client program is
+        configured.
+    """
+    global _daemons, _daemons_pid  # pylint: disable=global-statement
+
+    if not server_program or not client_program:
+        return None
+
+    with _daemons_lock:
+        # The daemons of the parent process are not ours to use after a fork.
+        if _daemons_pid != os.getpid():
+            _daemons = {}
+            _daemons_pid = os.getpid()
+
+        if name not in _daemons:
+            _daemons[name] = LinterDaemon(name, server_program, client_program)
+        return _daemons[name]
+
+
+@atexit.register
+def stop_all() -> None:
+    """Stop all daemons started by this process.
+
+    :returns: Nothing.
+    """
+    with _daemons_lock:
+        if _daemons_pid == os.getpid():
+            for daemon in _daemons.values():
+                daemon.stop()
+
+
+def run_program(
+    program: t.Sequence[str],
+    daemon: t.Optional[LinterDaemon],
+    **fmt: str,
+) -> subprocess.CompletedProcess:
+    """Run a linter program, using the given daemon if possible.
+
+    :param program: The linter program to run if the daemon cannot be used.
+    :param daemon: The daemon to run the job on, if ``None`` the program is
+        always used.
+    :param fmt: The variables to format the programs with.
+    :returns: The completed process of the linter.
+    """
+    if daemon is not None:
+        try:
+            return daemon.run(**fmt)
+        except LinterDaemonError:
+            logger.warning(
+                'Running linter without daemon',
+                daemon=daemon.name,
+                exc_info=True,
+            )
+
+    return subprocess.run(
+        [part.format(**fmt) for part in program],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
@@ -11,16 +11,19 @@ import abc
 import csv
 import json
 import uuid
+import shutil
 import typing as t
+import hashlib
 import tempfile
 import subprocess
+import concurrent.futures
 import xml.etree.ElementTree as ET
 from io import StringIO
 
 import structlog
 from defusedxml.ElementTree import fromstring as defused_xml_fromstring
 
-from . import app, files, models
+from . import app, files, models, blob_store, linter_daemon
 from .models import db
 from .helpers import register
 from .exceptions import ValidationException
@@ -75,7 +78,10 @@ class Linter(abc.ABC):
     method, and they may override the ``DEFAULT_OPTIONS`` variable. If
     ``RUN_LINTER`` is set to ``False`` we never actually run the linter, but
     only create a :py:class:`.models.AssignmentLinter` for this assignment and
-    a :py:class:`.models.LinterInstance` for each submission.
+    a :py:class:`.models.LinterInstance` for each submission. If
+    ``CACHE_PER_FILE`` is ``True`` the feedback on a file may only depend on
+    the contents and path of that file, so it is cached for every file instead
+    of for the entire submission.
 
     .. note::
 
@@ -85,6 +91,8 @@ class Linter(abc.ABC):
     """
     DEFAULT_OPTIONS: t.ClassVar[t.Mapping[str, str]] = {}
     RUN_LINTER: t.ClassVar[bool] = True
+    SUPPORTS_BATCH: t.ClassVar[bool] = False
+    CACHE_PER_FILE: t.ClassVar[bool] = False
 
     def __init__(self, cfg: str) -> None:
         self.config = cfg
@@ -121,6 +129,23 @@ class Linter(abc.ABC):
         """
         raise NotImplementedError('A subclass should implement this function!')
 
+    def run_batch(
+        self,
+        tempdir: str,
+        emit: t.Callable[[str, int, str, str], None],
+        process_completed: ProcessCompletedCallback,
+    ) -> None:  # pragma: no cover
+        """Run the linter on the code of multiple submissions at once.
+
+        This method is only called if ``SUPPORTS_BATCH`` is ``True``. The given
+        `tempdir` contains a directory for every submission, which in turn
+        contains the restored code of that submission. The filenames passed to
+        `emit` should be absolute or relative to `tempdir`.
+
+        Arguments are the same as for :py:meth:`Linter.run`.
+        """
+        raise NotImplementedError('This linter does not support batches!')
+
 
 @_linter_handlers.register('Pylint')
 class Pylint(Linter):
@@ -130,6 +155,8 @@ class Pylint(Linter):
     modules and will display an error on the first line of every file if the
     given code was not a proper module.
     """
+    # Pylint also does checks between modules, like ``duplicate-code``, so
+    # running it on multiple submissions at once would give different results.
     DEFAULT_OPTIONS: t.ClassVar[t.Mapping[str, str]] = {
         'Empty config file': ''
     }
@@ -191,12 +218,38 @@ class Flake8(Linter):
     DEFAULT_OPTIONS: t.ClassVar[t.Mapping[str, str]] = {
         'Empty config file': ''
     }
+    SUPPORTS_BATCH: t.ClassVar[bool] = True
+    CACHE_PER_FILE: t.ClassVar[bool] = True
 
     def run(
         self,
         tempdir: str,
         emit: t.Callable[[str, int, str, str], None],
         process_completed: ProcessCompletedCallback,
+    ) -> None:
+        """Run flake8.
+
+        Arguments are the same as for :py:meth:`Linter.run`.
+        """
+        self._lint_dir(tempdir, emit, process_completed)
+
+    def run_batch(
+        self,
+        tempdir: str,
+        emit: t.Callable[[str, int, str, str], None],
+        process_completed: ProcessCompletedCallback,
+    ) -> None:
+        """Run flake8 on multiple submissions.
+
+        Arguments are the same as for :py:meth:`Linter.run_batch`.
+        """
+        self._lint_dir(tempdir, emit, process_completed)
+
+    def _lint_dir(
+        self,
+        directory: str,
+        emit: t.Callable[[str, int, str, str], None],
+        process_completed: ProcessCompletedCallback,
     ) -> None:
         # This is not guessable
         sep = uuid.uuid4()
@@ -207,7 +260,7 @@ class Flake8(Linter):
             cfg.flush()
             out = subprocess.run(
                 [
-                    part.format(config=cfg.name, files=tempdir, line_fmt=fmt)
+                    part.format(config=cfg.name, files=directory, line_fmt=fmt)
                     for part in app.config['FLAKE8_PROGRAM']
                 ],
                 stdout=subprocess.PIPE,
@@ -261,6 +314,7 @@ class Checkstyle(Linter):
         'Google style': _read_config_file('checkstyle', 'google.xml'),
         'Sun style': _read_config_file('checkstyle', 'sun.xml'),
     }
+    SUPPORTS_BATCH: t.ClassVar[bool] = True
 
     @classmethod
     def _validate_module(cls: t.Type['Checkstyle'], mod: ET.Element) -> None:
@@ -346,8 +400,26 @@ class Checkstyle(Linter):
 
         Arguments are the same as for :py:meth:`Linter.run`.
         """
-        tempdir = os.path.dirname(tempdir)
+        self._lint_dir(os.path.dirname(tempdir), emit, process_completed)
+
+    def run_batch(
+        self,
+        tempdir: str,
+        emit: t.Callable[[str, int, str, str], None],
+        process_completed: ProcessCompletedCallback,
+    ) -> None:
+        """Run checkstyle on multiple submissions.
+
+        Arguments are the same as for :py:meth:`Linter.run_batch`.
+        """
+        self._lint_dir(tempdir, emit, process_completed)
 
+    def _lint_dir(
+        self,
+        directory: str,
+        emit: t.Callable[[str, int, str, str], None],
+        process_completed: ProcessCompletedCallback,
+    ) -> None:
         with tempfile.NamedTemporaryFile('w') as cfg:
             module: ET.Element = defused_xml_fromstring(self.config)
             assert module is not None
@@ -356,7 +428,7 @@ class Checkstyle(Linter):
                 module.__class__(
                     'property', {
                         'name': 'basedir',
-                        'value': '${basedir}'
+                        'value': directory,
                     }
                 )
             )
@@ -369,14 +441,15 @@ class Checkstyle(Linter):
             cfg.write(ET.tostring(module, encoding='unicode'))
             cfg.flush()
 
-            out = subprocess.run(
-                [
-                    part.format(config=cfg.name, files=tempdir)
-                    for part in app.config['CHECKSTYLE_PROGRAM']
-                ],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
+            out = linter_daemon.run_program(
+                app.config['CHECKSTYLE_PROGRAM'],
+                linter_daemon.get_daemon(
+                    'Checkstyle',
+                    app.config['CHECKSTYLE_DAEMON_PROGRAM'],
+                    app.config['CHECKSTYLE_DAEMON_CLIENT_PROGRAM'],
+                ),
+                config=cfg.name,
+                files=directory,
             )
             process_completed(out)
             if out.returncode == 254:
@@ -414,6 +487,8 @@ class PMD(Linter):
     DEFAULT_OPTIONS: t.ClassVar[t.Mapping[str, str]] = {
         'Maven': _read_config_file('pmd', 'maven.xml'),
     }
+    SUPPORTS_BATCH: t.ClassVar[bool] = True
+    CACHE_PER_FILE: t.ClassVar[bool] = True
 
     @classmethod
     def validate_config(cls: t.Type['PMD'], config: str) -> None:
@@ -459,20 +534,39 @@ class PMD(Linter):
 
         Arguments are the same as for :py:meth:`Linter.run`.
         """
-        tempdir = os.path.dirname(tempdir)
+        self._lint_dir(os.path.dirname(tempdir), emit, process_completed)
+
+    def run_batch(
+        self,
+        tempdir: str,
+        emit: t.Callable[[str, int, str, str], None],
+        process_completed: ProcessCompletedCallback,
+    ) -> None:
+        """Run PMD on multiple submissions.
+
+        Arguments are the same as for :py:meth:`Linter.run_batch`.
+        """
+        self._lint_dir(tempdir, emit, process_completed)
 
+    def _lint_dir(
+        self,
+        directory: str,
+        emit: t.Callable[[str, int, str, str], None],
+        process_completed: ProcessCompletedCallback,
+    ) -> None:
         with tempfile.NamedTemporaryFile('w') as cfg:
             cfg.write(self.config)
             cfg.flush()
 
-            out = subprocess.run(
-                [
-                    part.format(config=cfg.name, files=tempdir)
-                    for part in app.config['PMD_PROGRAM']
-                ],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
+            out = linter_daemon.run_program(
+                app.config['PMD_PROGRAM'],
+                linter_daemon.get_daemon(
+                    'PMD',
+                    app.config['PMD_DAEMON_PROGRAM'],
+                    app.config['PMD_DAEMON_CLIENT_PROGRAM'],
+                ),
+                config=cfg.name,
+                files=directory,
             )
             process_completed(out)
             assert out.returncode == 0
@@ -488,6 +582,93 @@ class PMD(Linter):
                 emit(filename, line_number, code, msg)
 
 
+_BATCHED_OUTPUT_NOTE = (
+    'This submission was linted together with other submissions, so the'
+    ' output of the linter is not available.'
+)
+
+_TempLinterResult = t.Dict[str, t.Dict[int, t.List[t.Tuple[str, str]]]]
+_LinterFeedback = t.Dict[int, t.Mapping[int, t.Sequence[t.Tuple[str, str]]]]
+
+
+def _add_linter_feedback(
+    temp_res: _TempLinterResult, f: str, line: int, code: str, msg: str
+) -> None:
+    """Add a line of feedback of a linter to the given result.
+
+    :param temp_res: The result to add the feedback to, it maps the filename
+        to a mapping of zero indexed line numbers to the feedback on that line.
+    :param f: The name of the file, relative to the restore directory.
+    :param line: The one indexed line number of the feedback.
+    :param code: The code of the feedback.
+    :param msg: The message of the feedback.
+    :returns: Nothing.
+    """
+    if f not in temp_res:
+        temp_res[f] = {}
+    line = line - 1
+    if line not in temp_res[f]:
+        temp_res[f][line] = []
+    temp_res[f][line].append((code, msg))
+
+
+class _RestoredWork:
+    """A work that is restored to be linted.
+
+    :ivar tree_root: The restored file tree of the work.
+    :ivar cached: The cached feedback for the work, in the same format as the
+        output of the linter.
+    :ivar to_cache: A mapping from cache key to the paths of the files,
+        relative to the root of the work, whose feedback should be cached under
+        that key. If this is empty the linter doesn't have to run for this
+        work.
+    """
+
+    def __init__(
+        self,
+        tree_root: files.FileTree,
+        cached: _TempLinterResult,
+        to_cache: t.Dict[str, t.List[str]],
+    ) -> None:
+        self.tree_root = tree_root
+        self.cached = cached
+        self.to_cache = to_cache
+
+    def get_feedback(self, temp_res: _TempLinterResult) -> _LinterFeedback:
+        """Cache the given output of the linter on this work and get the
+        feedback for every file of this work.
+
+        :param temp_res: The output of the linter, as created by
+            :func:`_add_linter_feedback`. Found entries are removed from it.
+        :returns: The feedback for each file of the work, by file id.
+        """
+        root = self.tree_root['name']
+        models.LinterResultCache.store_all(
+            {
+                key: {
+                    path: temp_res.get(os.path.join(root, path), {})
+                    for path in paths
+                }
+                for key, paths in self.to_cache.items()
+            }
+        )
+        temp_res.update(self.cached)
+
+        res: _LinterFeedback = {}
+
+        def __do(tree: files.FileTree, parent: str) -> None:
+            parent = os.path.join(parent, tree['name'])
+            if 'entries' in tree:  # this is dir:
+                for entry in tree['entries']:
+                    __do(entry, parent)
+            elif parent in temp_res:
+                res[tree['id']] = temp_res[parent]
+                del temp_res[parent]
+
+        __do(self.tree_root, '')
+        return res
+
+
 class LinterRunner:
     """This class is used to run a :class:`Linter` with a specific config on
     sets of :class:`.models.Work`.
@@ -510,120 +691,308 @@ class LinterRunner:
         .. note:: This method takes a long time to execute, please run it in a
                   thread.
 
+        If the linter supports it all the given instances are first linted in
+        a single batch, only if this batch fails every instance is run
+        separately so the failure ends up at the correct instance.
+
+        When running the instances separately the works are restored in this
+        thread, as this needs the database, after which the linter is run on
+        at most ``LINTER_WORKERS`` works at the same time in a thread pool. The
+        results are stored in this thread again.
+
+        Files for which the feedback is found in the
+        :class:`.models.LinterResultCache` are not linted again.
+
         :param linter_instance_ids: A sequence of all the ids of the linter
             instances which should be run. If this linter instance has already
             run once its old comments will be removed.
 
         :returns: Nothing
         """
-        for linter_instance_id in linter_instance_ids:
-            linter_inst = db.session.query(models.LinterInstance
-                                           ).get(linter_instance_id)
-
-            # This should never happen however it is better to check here.
-            if linter_inst is None:  # pragma: no cover
-                continue
-
-            compl_proc: t.Optional[subprocess.CompletedProcess] = None
-
-            def set_proc(proc: subprocess.CompletedProcess) -> None:
-                nonlocal compl_proc
-                compl_proc = proc
-
+        if self.linter.SUPPORTS_BATCH and len(linter_instance_ids) > 1:
             try:
-                self.test(linter_inst, set_proc)
-            # We want to catch all exceptions here as need to set our linter to
-            # the crashed state.
-            except LinterCrash as e:
-                logger.warning(
-                    'The linter crashed',
-                    linter_instance_id=linter_inst.id,
-                    exc_info=True,
-                )
-                linter_inst.state = models.LinterState.crashed
-                linter_inst.error_summary = (
-                    e.error_summary or
-                    'The linter program exited unsuccessfully.'
-                )
+                self.test_batch(linter_instance_ids)
             except Exception:  # pylint: disable=broad-except
                 logger.warning(
-                    'The linter crashed unexpectedly',
-                    linter_instance_id=linter_inst.id,
+                    'The batched linter crashed, running instances separately',
+                    linter_instance_ids=linter_instance_ids,
                     exc_info=True,
                 )
-                linter_inst.state = models.LinterState.crashed
-            finally:
-                if compl_proc is not None:
-                    linter_inst.stdout = compl_proc.stdout.replace('\0', '')
-                    linter_inst.stderr = compl_proc.stderr.replace('\0', '')
-                db.session.commit()
-
-    def test(
+                db.session.rollback()
+            else:
+                return
+
+        # pylint: disable=protected-access
+        flask_app = app._get_current_object()
+
+        def __lint(
+            tmpdir: str,
+            tree_root: files.FileTree,
+            process_completed: ProcessCompletedCallback,
+        ) -> _TempLinterResult:
+            with flask_app.app_context():
+                return self._lint_restored(
+                    tmpdir, tree_root, process_completed
+                )
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=app.config['LINTER_WORKERS']
+        ) as executor:
+            jobs = []
+            for linter_instance_id in linter_instance_ids:
+                linter_inst = db.session.query(models.LinterInstance
+                                               ).get(linter_instance_id)
+
+                # This should never happen however it is better to check here.
+                if linter_inst is None:  # pragma: no cover
+                    continue
+
+                procs: t.List[subprocess.CompletedProcess] = []
+                restored: t.Optional[_RestoredWork] = None
+                future: concurrent.futures.Future
+                tmpdir = tempfile.mkdtemp(dir=app.config['RESTORE_DIR'])
+                try:
+                    restored = self._restore(linter_inst, tmpdir)
+                except Exception as exc:  # pylint: disable=broad-except
+                    shutil.rmtree(tmpdir, ignore_errors=True)
+                    future = concurrent.futures.Future()
+                    future.set_exception(exc)
+                else:
+                    if restored.to_cache:
+                        future = executor.submit(
+                            __lint, tmpdir, restored.tree_root, procs.append
+                        )
+                    else:
+                        shutil.rmtree(tmpdir, ignore_errors=True)
+                        future = concurrent.futures.Future()
+                        future.set_result({})
+                jobs.append((linter_inst, procs, restored, future))
+
+            for linter_inst, procs, restored, future in jobs:
+                try:
+                    temp_res = future.result()
+                    assert restored is not None
+                    self._store_comments(
+                        linter_inst, restored.get_feedback(temp_res)
+                    )
+                # We want to catch all exceptions here as need to set our
+                # linter to the crashed state.
+                except LinterCrash as e:
+                    logger.warning(
+                        'The linter crashed',
+                        linter_instance_id=linter_inst.id,
+                        exc_info=True,
+                    )
+                    linter_inst.state = models.LinterState.crashed
+                    linter_inst.error_summary = (
+                        e.error_summary or
+                        'The linter program exited unsuccessfully.'
+                    )
+                except Exception:  # pylint: disable=broad-except
+                    logger.warning(
+                        'The linter crashed unexpectedly',
+                        linter_instance_id=linter_inst.id,
+                        exc_info=True,
+                    )
+                    linter_inst.state = models.LinterState.crashed
+                finally:
+                    if procs:
+                        linter_inst.stdout = procs[-1].stdout.replace('\0', '')
+                        linter_inst.stderr = procs[-1].stderr.replace('\0', '')
+                    db.session.commit()
+
+    def _restore(
         self,
         linter_instance: models.LinterInstance,
+        restore_dir: str,
+    ) -> _RestoredWork:
+        """Restore the work of the given linter instance and find its cached
+        feedback.
+
+        If the linter lints every file on its own the files with cached
+        feedback are removed again after restoring, so they are not linted
+        again. Otherwise the feedback is only cached for the entire work.
+
+        :param linter_instance: The linter instance to restore the work of.
+        :param restore_dir: The directory to restore the work in.
+        :returns: The restored work.
+        """
+        tree_root = files.restore_directory_structure(
+            linter_instance.work,
+            restore_dir,
+            use_links=True,
+        )
+        root = tree_root['name']
+
+        paths: t.Dict[int, str] = {}
+
+        def __do(tree: files.FileTree, parent: str) -> None:
+            if 'entries' in tree:
+                for entry in tree['entries']:
+                    __do(entry, os.path.join(parent, entry['name']))
+            else:
+                paths[tree['id']] = parent
+
+        __do(tree_root, '')
+
+        file_id_col = t.cast(models.DbColumn[int], models.File.id)
+        digests: t.Dict[str, str] = {}
+        for file_id, digest, filename in db.session.query(
+            models.File.id, models.File.digest, models.File.filename
+        ).filter(file_id_col.in_(list(paths))):
+            digests[paths[file_id]] = (
+                blob_store.get_digest(filename) if digest is None else digest
+            )
+
+        name = type(self.linter).__name__
+        to_cache: t.Dict[str, t.List[str]]
+        if self.linter.CACHE_PER_FILE:
+            to_cache = {
+                models.LinterResultCache.make_key(
+                    name, self.linter.config, digest, path
+                ): [path]
+                for path, digest in digests.items()
+            }
+        else:
+            work_digest = hashlib.sha256()
+            for path, digest in sorted(digests.items()):
+                work_digest.update(f'{path}\0{digest}\0'.encode('utf8'))
+            to_cache = {
+                models.LinterResultCache.make_key(
+                    name, self.linter.config, work_digest.hexdigest(), root
+                ): sorted(digests)
+            }
+
+        cached: _TempLinterResult = {}
+        key_col = t.cast(models.DbColumn[str], models.LinterResultCache.key)
+        for entry in models.LinterResultCache.query.filter(
+            key_col.in_(list(to_cache))
+        ):
+            for path, lines in entry.feedback.items():
+                cached[os.path.join(root, path)] = lines
+            if self.linter.CACHE_PER_FILE:
+                for path in to_cache[entry.key]:
+                    os.unlink(os.path.join(restore_dir, root, path))
+            del to_cache[entry.key]
+
+        return _RestoredWork(tree_root, cached, to_cache)
+
+    def _lint_restored(
+        self,
+        tmpdir: str,
+        tree_root: files.FileTree,
         process_completed: ProcessCompletedCallback,
-    ) -> None:
-        """Test the given code (:class:`.models.Work`) and add generated
-        comments.
+    ) -> _TempLinterResult:
+        """Run the linter on a restored work and remove the restored files
+        afterwards.
+
+        This method does not use the database, so it can be called from any
+        thread with an app context.
 
-        :param linter_instance: The linter instance that will be run. This
-            linter instance is linked to a work from which all files will be
-            restored and the linter will be run on those files.
+        :param tmpdir: The directory the work is restored in.
+        :param tree_root: The restored file tree of the work.
         :param process_completed: The callback that should be called by the
             linter instance after the process, like pylint or java, has been
             completed.
-        :returns: Nothing
+        :returns: The output of the linter, as created by
+            :func:`_add_linter_feedback`.
         """
-        temp_res: t.Dict[str, t.Dict[int, t.List[t.Tuple[str, str]]]]
-        temp_res = {}
-        res: t.Dict[int, t.Mapping[int, t.Sequence[t.Tuple[str, str]]]]
-        res = {}
+        temp_res: _TempLinterResult = {}
 
-        with tempfile.TemporaryDirectory() as tmpdir:
+        try:
 
             def __emit(f: str, line: int, code: str, msg: str) -> None:
                 if f.startswith(tmpdir):
                     f = f[len(tmpdir) + 1:]
-                if f not in temp_res:
-                    temp_res[f] = {}
-                line = line - 1
-                if line not in temp_res[f]:
-                    temp_res[f][line] = []
-                temp_res[f][line].append((code, msg))
-
-            tree_root = files.restore_directory_structure(
-                linter_instance.work,
-                tmpdir,
-            )
+                _add_linter_feedback(temp_res, f, line, code, msg)
 
             self.linter.run(
                 os.path.join(tmpdir, tree_root['name']), __emit,
                 process_completed
             )
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
 
-        del tmpdir
+        return temp_res
 
-        def __do(tree: files.FileTree, parent: str) -> None:
-            parent = os.path.join(parent, tree['name'])
-            if 'entries' in tree:  # this is dir:
-                for entry in tree['entries']:
-                    __do(entry, parent)
-            elif parent in temp_res:
-                res[tree['id']] = temp_res[parent]
-                del temp_res[parent]
+    def test_batch(self, linter_instance_ids: t.Sequence[str]) -> None:
+        """Test the code of multiple linter instances by running the linter
+        only once, and add the generated comments.
 
-        __do(tree_root, '')
+        The works of the instances are restored next to each other, each in a
+        directory named after the id of the instance, and the output of the
+        linter is split by this directory. As the output of the linter
+        process contains the files of all instances it is not stored, instead
+        the stdout of every instance is set to a note explaining this.
+
+        :param linter_instance_ids: The ids of the linter instances to run.
+        :returns: Nothing
 
-        models.LinterComment.query.filter_by(linter_id=linter_instance.id
-                                             ).delete()
+        :raises LinterCrash: If the linter crashed on one of the instances, no
+            changes are committed in this case.
+        """
+        instances = [
+            inst for inst in (
+                db.session.query(models.LinterInstance).get(inst_id)
+                for inst_id in linter_instance_ids
+            ) if inst is not None
+        ]
+        temp_res: t.Dict[str, _TempLinterResult] = {
+            inst.id: {}
+            for inst in instances
+        }
+        restored: t.Dict[str, _RestoredWork] = {}
+        compl_proc: t.Optional[subprocess.CompletedProcess] = None
 
-        for comment in linter_instance.add_comments(res):
-            db.session.add(comment)
+        def set_proc(proc: subprocess.CompletedProcess) -> None:
+            nonlocal compl_proc
+            compl_proc = proc
 
-        linter_instance.state = models.LinterState.done
+        with tempfile.TemporaryDirectory(
+            dir=app.config['RESTORE_DIR'],
+        ) as tmpdir:
+
+            def __emit(f: str, line: int, code: str, msg: str) -> None:
+                if f.startswith(tmpdir):
+                    f = f[len(tmpdir) + 1:]
+                inst_id, _, f = f.partition(os.path.sep)
+                if inst_id in temp_res:
+                    _add_linter_feedback(temp_res[inst_id], f, line, code, msg)
+
+            for inst in instances:
+                inst_dir = os.path.join(tmpdir, inst.id)
+                os.mkdir(inst_dir)
+                restored[inst.id] = self._restore(inst, inst_dir)
+
+            if any(work.to_cache for work in restored.values()):
+                self.linter.run_batch(tmpdir, __emit, set_proc)
+
+        del tmpdir
 
+        for inst in instances:
+            self._store_comments(
+                inst, restored[inst.id].get_feedback(temp_res[inst.id])
+            )
+            if compl_proc is not None:
+                inst.stdout = _BATCHED_OUTPUT_NOTE
+                inst.stderr = ''
         db.session.commit()
 
+    @staticmethod
+    def _store_comments(
+        linter_instance: models.LinterInstance,
+        res: _LinterFeedback,
+    ) -> None:
+        """Replace the comments of the given linter instance by the given
+        feedback and mark it as done.
+
+        :param linter_instance: The linter instance to store the comments for.
+        :param res: The feedback for the work of the instance, by file id.
+        :returns: Nothing
+        """
+        linter_instance.replace_comments(res)
+        linter_instance.state = models.LinterState.done
+
 
 def get_all_linters(
 ) -> t.Dict[str, t.Dict[str, t.Union[str, t.Mapping[str, str]]]]:
@@ -19,6 +19,12 @@ This module defines all the objects in the database in their relation.
     :members:
     :show-inheritance:
 
+``psef.models.export``
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+.. automodule:: psef.models.export
+    :members:
+    :show-inheritance:
+
 ``psef.models.file``
 ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 .. automodule:: psef.models.file
@@ -79,6 +85,12 @@ This module defines all the objects in the database in their relation.
     :members:
     :show-inheritance:
 
+``psef.models.upload``
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+.. automodule:: psef.models.upload
+    :members:
+    :show-inheritance:
+
 ``psef.models.user``
 ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 .. automodule:: psef.models.user
@@ -199,13 +211,17 @@ if True:  # pylint: disable=using-constant-test
     from .permission import Permission
     from .user import User
     from .lti_provider import LTIProvider
-    from .file import File, FileOwner
+    from .file import File, FileOwner, FileTreeCache
     from .work import Work, GradeHistory
-    from .linter import LinterState, LinterComment, LinterInstance
+    from .linter import (
+        LinterState, LinterComment, LinterInstance, LinterResultCache
+    )
     from .plagiarism import (
         PlagiarismState, PlagiarismRun, PlagiarismCase, PlagiarismMatch
     )
     from .comment import Comment
+    from .export import ExportState, AssignmentExport
+    from .upload import UploadState, ChunkedUpload, SubmissionUpload
     from .role import AbstractRole, Role, CourseRole
     from .snippet import Snippet
     from .rubric import RubricItem, RubricRow
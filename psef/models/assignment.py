@@ -6,6 +6,7 @@ import enum
 import json
 import math
 import uuid
+import hashlib
 import typing as t
 import datetime
 from random import shuffle
@@ -28,6 +29,7 @@ from . import linter as linter_models
 from . import _MyQuery
 from .. import auth, ignore, helpers
 from .role import CourseRole
+from ..cache import LRUCache
 from .rubric import RubricRow, RubricItem
 from .permission import Permission
 from ..exceptions import PermissionException, InvalidAssignmentState
@@ -43,6 +45,11 @@ else:
 
 T = t.TypeVar('T')
 
+# Parsed submission filters, indexed by the id of the assignment, the version
+# of the filter and the hash of the serialized filter.
+_CGIGNORES: LRUCache[t.Tuple[int, t.Optional[str], str], ignore.
+                     SubmissionFilter] = LRUCache(max_size=256)
+
 
 @enum.unique
 class _AssignmentStateEnum(enum.IntEnum):
@@ -471,20 +478,42 @@ class Assignment(Base):  # pylint: disable=too-many-public-methods
     @property
     def cgignore(self) -> t.Optional[ignore.SubmissionFilter]:
         """The submission filter of this assignment.
+
+        Parsed filters are cached for the entire process, so the returned
+        filter should not be modified, use the setter to change the filter.
         """
         if self._cgignore is None:
             return None
-        elif self._cgignore_version is None:  # pragma: no cover
+
+        key = None
+        if self.id is not None:
+            key = (
+                self.id,
+                self._cgignore_version,
+                hashlib.sha256(self._cgignore.encode('utf-8')).hexdigest(),
+            )
+            res = _CGIGNORES.get(key)
+            if res is not None:
+                return res
+
+        if self._cgignore_version is None:  # pragma: no cover
             # This branch is needed for backwards compatibility, but it is not
             # possible to test as it is not possible to insert this old data
             # using the api.
-            return ignore.IgnoreFilterManager.parse(self._cgignore)
+            res = ignore.IgnoreFilterManager.parse(self._cgignore)
         else:
             filter_type = ignore.filter_handlers[self._cgignore_version]
-            return filter_type.parse(json.loads(self._cgignore))
+            res = filter_type.parse(json.loads(self._cgignore))
+
+        if key is not None:
+            _CGIGNORES.set(key, res)
+        return res
 
     @cgignore.setter
     def cgignore(self, val: ignore.SubmissionFilter) -> None:
+        # The key of the cache contains the version and the hash of the
+        # filter, so changing them makes sure the old filter is never used
+        # again.
         self._cgignore_version = ignore.filter_handlers.find(type(val), None)
         self._cgignore = json.dumps(val.export())
 
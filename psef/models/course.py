@@ -228,7 +228,7 @@ class Course(Base):
             subdir: psef.files.ExtractFileTreeBase
             if isinstance(child, psef.files.ExtractFileTreeFile):
                 subdir = psef.files.ExtractFileTreeDirectory(
-                    name='top', values=[child], parent=None
+                    name='top', values=[], parent=None
                 )
                 tree.forget_child(child)
                 subdir.add_child(child)
@@ -0,0 +1,144 @@
+"""This module defines an AssignmentExport.
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import enum
+import uuid
+import typing as t
+import datetime
+
+from . import UUID_LENGTH, Base, db, _MyQuery
+from .file import FileOwner
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    # pylint: disable=unused-import
+    from .user import User
+    from .assignment import Assignment
+
+
+@enum.unique
+class ExportState(enum.IntEnum):
+    """Describes in what state a :class:`.AssignmentExport` is.
+
+    :param starting: The export has been created but is not running yet.
+    :param running: The archive is being created.
+    :param done: The archive is done and can be downloaded.
+    :param crashed: The export has crashed in some way.
+    """
+    starting: int = 1
+    running: int = 2
+    done: int = 3
+    crashed: int = 4
+
+
+class AssignmentExport(Base):
+    """Describes an export of all latest submissions of an assignment to a
+    single archive that is created in the background.
+
+    :ivar ~.AssignmentExport.state: The state this export is in.
+    :ivar ~.AssignmentExport.exclude_owner: The owner of the files that are
+        not included in the archive.
+    :ivar ~.AssignmentExport.include_feedback: Should the feedback of the
+        submissions be included in the archive.
+    :ivar ~.AssignmentExport.filename: The name of the archive in the mirror
+        upload directory, only available if the state is ``done``.
+    """
+    if t.TYPE_CHECKING:  # pragma: no cover
+        query: t.ClassVar[_MyQuery['AssignmentExport']] = Base.query
+    __tablename__ = 'AssignmentExport'
+
+    id: str = db.Column(
+        'id',
+        db.String(UUID_LENGTH),
+        nullable=False,
+        primary_key=True,
+        default=lambda: str(uuid.uuid4()),
+    )
+    state: ExportState = db.Column(
+        'state',
+        db.Enum(ExportState),
+        default=ExportState.starting,
+        nullable=False
+    )
+    submissions_total: int = db.Column(
+        'submissions_total', db.Integer, default=0, nullable=False
+    )
+    submissions_done: int = db.Column(
+        'submissions_done', db.Integer, default=0, nullable=False
+    )
+    exclude_owner: FileOwner = db.Column(
+        'exclude_owner', db.Enum(FileOwner), nullable=False
+    )
+    include_feedback: bool = db.Column(
+        'include_feedback', db.Boolean, default=True, nullable=False
+    )
+    filename: t.Optional[str] = db.Column(
+        'filename', db.Unicode, nullable=True
+    )
+    assignment_id: int = db.Column(
+        'assignment_id',
+        db.Integer,
+        db.ForeignKey('Assignment.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+    user_id: int = db.Column(
+        'user_id',
+        db.Integer,
+        db.ForeignKey('User.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+    created_at: datetime.datetime = db.Column(
+        db.DateTime, default=datetime.datetime.utcnow
+    )
+
+    assignment: 'Assignment' = db.relationship(
+        'Assignment',
+        foreign_keys=assignment_id,
+        lazy='joined',
+        innerjoin=True,
+    )
+    user: 'User' = db.relationship('User', foreign_keys=user_id)
+
+    @property
+    def output_name(self) -> str:
+        """
+        :returns: The name the user should see for the created archive.
+        """
+        return f'{self.assignment.name}-submissions.zip'
+
+    def __to_json__(self) -> t.Mapping[str, object]:
+        """Creates a JSON serializable representation of this object.
+
+        This object will look like this:
+
+        .. code:: python
+
+            {
+                'id': str, # The id of this export.
+                'state': str, # The name of the current state of this export.
+                'submissions_done': int, # The amount of submissions that are
+                                         # already in the archive.
+                'submissions_total': int, # The total amount of submissions
+                                          # that will be in the archive.
+                'name': t.Optional[str], # The name which can be given to
+                                         # ``GET - /api/v1/files/<name>`` to
+                                         # download the archive, only
+                                         # available if the state is
+                                         # ``done``.
+                'output_name': str, # The name the resulting file should have.
+                'created_at': str, # ISO UTC date.
+                'assignment_id': int, # The assignment of this export.
+            }
+
+        :returns: A object as described above.
+        """
+        return {
+            'id': self.id,
+            'state': self.state.name,
+            'submissions_done': self.submissions_done,
+            'submissions_total': self.submissions_total,
+            'name': self.filename,
+            'output_name': self.output_name,
+            'created_at': self.created_at.isoformat(),
+            'assignment_id': self.assignment_id,
+        }
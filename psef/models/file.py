@@ -8,12 +8,10 @@ import enum
 import typing as t
 import datetime
 
-from flask import current_app
-
 import psef
 
-from . import Base, db, _MyQuery
-from .. import auth
+from . import UUID_LENGTH, Base, db, _MyQuery
+from .. import auth, blob_store
 from ..exceptions import APICodes, APIException
 from ..permissions import CoursePermission
 
@@ -41,6 +39,17 @@ class FileOwner(enum.IntEnum):
     both: int = 3
 
 
+def _find_subtree(tree: 'psef.files.FileTree',
+                  file_id: int) -> t.Optional['psef.files.FileTree']:
+    todo = [tree]
+    while todo:
+        cur = todo.pop()
+        if cur['id'] == file_id:
+            return cur
+        todo.extend(cur.get('entries', []))
+    return None
+
+
 class File(Base):
     """
     This object describes a file or directory that stored is stored on the
@@ -65,10 +74,24 @@ class File(Base):
     # The given name of the file.
     name: str = db.Column('name', db.Unicode, nullable=False)
 
+    # The full path of this file in its submission: the names of all its
+    # parents and the name of this file separated by forward slashes. This is
+    # kept up to date on renames, so a file can be found by its path with a
+    # single query.
+    path: str = db.Column('path', db.Unicode, nullable=False)
+
     # This is the filename for the actual file on the disk. This is probably a
     # randomly generated uuid.
     filename: t.Optional[str]
     filename = db.Column('filename', db.Unicode, nullable=True)
+    # The size in bytes and the digest, as used by the :mod:`.blob_store`, of
+    # the contents of this file. These are stored so this information is
+    # available without accessing the file on disk, they are ``None`` for
+    # directories and for files that were created before these were stored.
+    size: t.Optional[int] = db.Column('size', db.Integer, nullable=True)
+    digest: t.Optional[str] = db.Column(
+        'digest', db.String(64), nullable=True
+    )
     modification_date = db.Column(
         'modification_date', db.DateTime, default=datetime.datetime.utcnow
     )
@@ -100,6 +123,52 @@ class File(Base):
         )
     )  # type: 'work_models.Work'
 
+    __table_args__ = (db.Index('ix_File_Work_id_path', work_id, path), )
+
+    def __init__(self, **kwargs: t.Any) -> None:
+        """Create a new file.
+
+        The ``path`` of the file is derived from the given ``parent`` and
+        ``name``, so the parent should be given as object and not by id.
+        """
+        assert 'parent_id' not in kwargs
+        super().__init__(**kwargs)
+        if self.path is None:
+            self.path = self.get_child_path(kwargs.get('parent'), self.name)
+
+    @staticmethod
+    def get_child_path(parent: t.Optional['File'], name: str) -> str:
+        """Get the path of a file with the given name in the given parent.
+
+        :param parent: The parent of the file, or ``None`` if the file is the
+            top level directory of a submission.
+        :param name: The name of the file.
+        :returns: The value of :attr:`File.path` for such a file.
+        """
+        return File.join_path(None if parent is None else parent.path, name)
+
+    @staticmethod
+    def join_path(parent_path: t.Optional[str], name: str) -> str:
+        """Get the path of a file with the given name in the directory with
+        the given path.
+
+        :param parent_path: The path of the parent of the file, or ``None`` if
+            the file is the top level directory of a submission.
+        :param name: The name of the file.
+        :returns: The value of :attr:`File.path` for such a file.
+        """
+        if parent_path is None:
+            return name
+        return f'{parent_path}/{name}'
+
+    def _set_path(self, new_path: str) -> None:
+        self.path = new_path
+        if self.is_directory:
+            for child in self.children:
+                child._set_path(  # pylint: disable=protected-access
+                    self.get_child_path(self, child.name)
+                )
+
     @staticmethod
     def get_exclude_owner(owner: t.Optional[str], course_id: int) -> FileOwner:
         """Get the :class:`.FileOwner` the current user does not want to see
@@ -140,19 +209,53 @@ class File(Base):
         """
         assert not self.is_directory
         assert self.filename is not None
-        res = os.path.realpath(
-            os.path.join(current_app.config['UPLOAD_DIR'], self.filename)
+        return blob_store.get_path(self.filename)
+
+    def set_contents(self, stored: 'blob_store.StoredFile') -> None:
+        """Make this file refer to the given contents in the store.
+
+        :param stored: The stored contents, as returned by one of the store
+            functions of the :mod:`.blob_store`.
+        :returns: Nothing.
+        """
+        assert not self.is_directory
+        self.filename = stored.filename
+        self.size = stored.size
+        self.digest = stored.digest
+
+    def get_stored_file(self) -> 'blob_store.StoredFile':
+        """Get the contents of this file as stored in the :mod:`.blob_store`.
+
+        The size and digest of files created before these were stored in the
+        database are retrieved from the disk.
+
+        :returns: The stored file with the contents of this file.
+        """
+        assert not self.is_directory
+        assert self.filename is not None
+        return blob_store.StoredFile(
+            filename=self.filename,
+            digest=(
+                blob_store.get_digest(self.filename)
+                if self.digest is None else self.digest
+            ),
+            size=(
+                os.path.getsize(self.get_diskname())
+                if self.size is None else self.size
+            ),
         )
-        assert res.startswith(current_app.config['UPLOAD_DIR'])
-        return res
 
     def delete_from_disk(self) -> None:
         """Delete the file from disk if it is not a directory.
 
+        This only removes the reference of this file to its contents, other
+        files with the same contents are not affected.
+
         :returns: Nothing.
         """
         if not self.is_directory:
-            os.remove(self.get_diskname())
+            assert self.filename is not None
+            blob_store.release(self.filename)
 
     def list_contents(
         self,
@@ -187,10 +290,29 @@ class File(Base):
         Otherwise it will formatted like one of the file children of the above
         tree.
 
+        The tree is retrieved from the cached tree of the submission, see
+        :meth:`.work_models.Work.get_file_tree`, which should never be
+        mutated.
+
         :param exclude: The file owner to exclude from the tree.
 
         :returns: A tree as described above.
         """
+        tree = _find_subtree(self.work.get_file_tree(exclude), self.id)
+        if tree is None:
+            # This file is excluded itself, so it is not in the cached tree.
+            return self.list_contents_uncached(exclude)
+        return tree
+
+    def list_contents_uncached(
+        self,
+        exclude: FileOwner,
+    ) -> 'psef.files.FileTree':
+        """List the contents of this file without using any cache.
+
+        :param exclude: The file owner to exclude from the tree.
+        :returns: The same tree as :meth:`File.list_contents`.
+        """
         cache = self.work.get_file_children_mapping(exclude)
         return self._list_contents(exclude, cache)
 
@@ -220,6 +342,9 @@ class File(Base):
     ) -> None:
         """Rename the this file to the given new name.
 
+        The :attr:`File.path` of this file and all its children is updated,
+        however the ``parent`` of this file is not changed.
+
         :param new_name: The new name to be given to the given file.
         :param new_parent: The new parent of this file.
         :param exclude_owner: The owner to exclude while searching for
@@ -240,6 +365,10 @@ class File(Base):
             )
 
         self.name = new_name
+        # Make sure changes to the children of this directory (for example by
+        # splitting it) are visible.
+        db.session.flush()
+        self._set_path(self.get_child_path(new_parent, new_name))
 
     def __to_json__(self) -> t.Mapping[str, t.Union[str, bool, int]]:
         """Creates a JSON serializable representation of this object.
@@ -262,3 +391,37 @@ class File(Base):
             'is_directory': self.is_directory,
             'id': self.id,
         }
+
+
+class FileTreeCache(Base):
+    """A cached version of the file tree of a :class:`.work_models.Work`.
+
+    Creating the tree of a submission means loading all its files, so the
+    serialized tree is stored for each owner that can be excluded. A stored
+    tree is only valid if its ``version`` is equal to the current file tree
+    version of the work, see :meth:`.work_models.Work.get_file_tree`.
+
+    :ivar ~.FileTreeCache.version: The file tree version of the work this tree
+        was created for.
+    :ivar ~.FileTreeCache.tree: The tree as returned by
+        :meth:`File.list_contents` serialized as JSON.
+    """
+    if t.TYPE_CHECKING:  # pragma: no cover
+        query: t.ClassVar[_MyQuery['FileTreeCache']] = Base.query
+    __tablename__ = 'FileTreeCache'
+
+    work_id: int = db.Column(
+        'Work_id',
+        db.Integer,
+        db.ForeignKey('Work.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+    exclude_owner: FileOwner = db.Column(
+        'exclude_owner',
+        db.Enum(FileOwner),
+        primary_key=True,
+    )
+    version: str = db.Column(
+        'version', db.String(UUID_LENGTH), nullable=False
+    )
+    tree: str = db.Column('tree', db.Unicode, nullable=False)
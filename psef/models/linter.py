@@ -4,10 +4,14 @@ SPDX-License-Identifier: AGPL-3.0-only
 """
 
 import enum
+import json
 import uuid
 import typing as t
+import hashlib
+import datetime
 
 from sqlalchemy import orm
+from sqlalchemy.dialects import postgresql
 
 from . import UUID_LENGTH, Base, db, _MyQuery
 
@@ -70,6 +74,105 @@ class LinterComment(Base):
         }
 
 
+class LinterResultCache(Base):
+    """The cached feedback of a linter on a part of a submission.
+
+    The feedback of a linter only depends on the linter, its config and the
+    linted files, so it is stored by a key of these, see :meth:`make_key`. This
+    way resubmissions and files that are identical to files in other
+    submissions do not have to be linted again.
+
+    :ivar ~.LinterResultCache.key: The key of the cached feedback.
+    :ivar ~.LinterResultCache.created_at: The moment the feedback was cached,
+        old entries can be removed without any problem.
+    """
+    if t.TYPE_CHECKING:  # pragma: no cover
+        query: t.ClassVar[_MyQuery['LinterResultCache']] = Base.query
+    __tablename__ = 'LinterResultCache'
+
+    key: str = db.Column('key', db.String(64), primary_key=True)
+    _feedback: str = db.Column('feedback', db.Unicode, nullable=False)
+    created_at: datetime.datetime = db.Column(
+        'created_at',
+        db.DateTime,
+        default=datetime.datetime.utcnow,
+        nullable=False,
+    )
+
+    @staticmethod
+    def make_key(linter_name: str, config: str, digest: str, path: str) -> str:
+        """Make the key for cached feedback.
+
+        :param linter_name: The name of the linter.
+        :param config: The config the linter was run with.
+        :param digest: The digest of the contents of the linted files.
+        :param path: The path of the linted files, relative to the root of the
+            submission.
+        :returns: The key, which is a hex digest.
+        """
+        res = hashlib.sha256()
+        for part in [
+            linter_name,
+            hashlib.sha256(config.encode('utf8')).hexdigest(),
+            digest,
+            path,
+        ]:
+            res.update(part.encode('utf8'))
+            res.update(b'\0')
+        return res.hexdigest()
+
+    @property
+    def feedback(self) -> t.Dict[str, t.Dict[int, t.List[t.Tuple[str, str]]]]:
+        """The cached feedback.
+
+        This is a mapping from the path of a file, relative to the root of the
+        submission, to a mapping from the zero indexed line number to the
+        feedback, as ``(code, message)`` tuples, on that line.
+        """
+        return {
+            path: {
+                int(line): [(code, msg) for code, msg in feedback]
+                for line, feedback in lines.items()
+            }
+            for path, lines in json.loads(self._feedback).items()
+        }
+
+    @staticmethod
+    def store_all(
+        entries: t.Mapping[str, t.Mapping[str, t.Mapping[
+            int, t.Sequence[t.Tuple[str, str]]]]]
+    ) -> None:
+        """Store the given feedback in the cache.
+
+        This doesn't create ORM objects, and existing keys are silently
+        ignored, as the same files might be linted at the same time by another
+        worker.
+
+        :param entries: A mapping from key to the feedback to cache, in the
+            format of :attr:`feedback`.
+        :returns: Nothing.
+        """
+        if not entries:
+            return
+
+        table = LinterResultCache.__table__
+        if db.session.get_bind().dialect.name == 'postgresql':
+            stmt = postgresql.insert(table).on_conflict_do_nothing()
+        else:
+            stmt = table.insert().prefix_with('OR IGNORE')
+
+        now = datetime.datetime.utcnow()
+        db.session.execute(
+            stmt, [
+                {
+                    'key': key,
+                    'feedback': json.dumps(feedback),
+                    'created_at': now,
+                } for key, feedback in entries.items()
+            ]
+        )
+
+
 class LinterInstance(Base):
     """Describes the connection between a :class:`assignment.AssignmentLinter`
     and a :class:`work_models.Work`.
@@ -191,17 +294,20 @@ class LinterInstance(Base):
             'error_summary': self.error_summary,
         }
 
-    def add_comments(
+    def replace_comments(
         self,
         feedbacks: t.Mapping[int, t.Mapping[int, t.Sequence[t.
                                                             Tuple[str, str]]]],
-    ) -> t.Iterable[LinterComment]:
-        """Add comments written by this instance.
+    ) -> None:
+        """Replace all comments of this instance by the given feedback.
+
+        The comments are inserted in batches with executemany, without
+        creating ORM objects, as a linter can produce tens of thousands of
+        comments for a single submission. They are not committed yet.
 
         :param feedbacks: The feedback to add, it should be in form as
             described below.
-        :returns: A iterable with comments that have not been added or commited
-            to the database yet.
+        :returns: Nothing.
 
         .. code:: python
 
@@ -211,13 +317,21 @@ class LinterInstance(Base):
                 }
             }
         """
-        for file_id, feedback in feedbacks.items():
-            for line_number, msgs in feedback.items():
-                for linter_code, msg in msgs:
-                    yield LinterComment(
-                        file_id=file_id,
-                        line=line_number,
-                        linter_code=linter_code,
-                        linter_id=self.id,
-                        comment=msg,
-                    )
+        LinterComment.query.filter_by(linter_id=self.id).delete()
+
+        table = LinterComment.__table__
+        batch_size = 1000
+        rows = [
+            {
+                'File_id': file_id,
+                'line': line_number,
+                'linter_code': linter_code,
+                'linter_id': self.id,
+                'comment': msg,
+            }
+            for file_id, feedback in feedbacks.items()
+            for line_number, msgs in feedback.items()
+            for linter_code, msg in msgs
+        ]
+        for i in range(0, len(rows), batch_size):
+            db.session.execute(table.insert(), rows[i:i + batch_size])
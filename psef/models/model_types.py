@@ -107,6 +107,12 @@ class MySession:  # pragma: no cover
     def begin_nested(self) -> t.ContextManager:
         ...
 
+    def execute(self, *args: t.Any, **kwargs: t.Any) -> t.Any:
+        ...
+
+    def get_bind(self) -> t.Any:
+        ...
+
 
 class DbType(t.Generic[T]):  # pragma: no cover
     ...
@@ -210,6 +216,7 @@ class DbColumn(t.Generic[T]):  # pragma: no cover
 
 class Base:  # pragma: no cover
     query = None  # type: t.ClassVar[t.Any]
+    __table__: t.ClassVar[t.Any]
 
     def __init__(self, *args: t.Any, **kwargs: t.Any) -> None:
         pass
@@ -0,0 +1,385 @@
+"""This module defines a SubmissionUpload and a ChunkedUpload.
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import os
+import enum
+import json
+import uuid
+import shutil
+import typing as t
+import datetime
+
+from flask import current_app
+from werkzeug.datastructures import FileStorage
+
+from . import UUID_LENGTH, Base, db, _MyQuery
+from .. import helpers
+from ..ignore import IgnoreHandling
+from ..exceptions import APICodes, APIException
+from ..json_encoders import CustomJSONEncoder
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    # pylint: disable=unused-import
+    from .user import User
+    from .work import Work
+    from .assignment import Assignment
+    from ..archive import FileSize
+
+_CHUNK_SIZE = 2 ** 16
+
+
+@enum.unique
+class UploadState(enum.IntEnum):
+    """Describes in what state a :class:`.SubmissionUpload` is.
+
+    :param starting: The upload has been stored but is not processed yet.
+    :param running: The uploaded files are being extracted and filtered.
+    :param done: The submission has been created.
+    :param failed: The uploaded files could not be turned into a submission,
+        for example because they contain ignored files. The reason is stored
+        in the ``error`` of the upload.
+    :param crashed: Processing the upload crashed in some way.
+    """
+    starting: int = 1
+    running: int = 2
+    done: int = 3
+    failed: int = 4
+    crashed: int = 5
+
+
+class SubmissionUpload(Base):
+    """Describes an upload of a submission that is processed in the
+    background.
+
+    The uploaded files are stored as is in a directory in the shared temporary
+    directory, so that they can be processed by celery, and this directory is
+    removed when the processing is done.
+
+    :ivar ~.SubmissionUpload.state: The state this upload is in.
+    :ivar ~.SubmissionUpload.author: The author of the submission that will be
+        created, this is the virtual user of the group when submitting as a
+        group.
+    :ivar ~.SubmissionUpload.handle_ignore: How the ignored files in the
+        upload should be handled.
+    :ivar ~.SubmissionUpload.work: The created submission, only available if
+        the state is ``done``.
+    :ivar ~.SubmissionUpload.error: The serialized :class:`.APIException`
+        that caused the upload to fail, only available if the state is
+        ``failed``.
+    """
+    if t.TYPE_CHECKING:  # pragma: no cover
+        query: t.ClassVar[_MyQuery['SubmissionUpload']] = Base.query
+    __tablename__ = 'SubmissionUpload'
+
+    id: str = db.Column(
+        'id',
+        db.String(UUID_LENGTH),
+        nullable=False,
+        primary_key=True,
+        default=lambda: str(uuid.uuid4()),
+    )
+    state: UploadState = db.Column(
+        'state',
+        db.Enum(UploadState),
+        default=UploadState.starting,
+        nullable=False,
+    )
+    handle_ignore: IgnoreHandling = db.Column(
+        'handle_ignore', db.Enum(IgnoreHandling), nullable=False
+    )
+    # The directory with the uploaded files, the files are named after their
+    # index in ``_filenames``.
+    upload_dir: str = db.Column('upload_dir', db.Unicode, nullable=False)
+    # The original names of the uploaded files as a JSON list.
+    _filenames: str = db.Column('filenames', db.Unicode, nullable=False)
+    _error: t.Optional[str] = db.Column('error', db.Unicode, nullable=True)
+    assignment_id: int = db.Column(
+        'assignment_id',
+        db.Integer,
+        db.ForeignKey('Assignment.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+    user_id: int = db.Column(
+        'user_id',
+        db.Integer,
+        db.ForeignKey('User.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+    author_id: int = db.Column(
+        'author_id',
+        db.Integer,
+        db.ForeignKey('User.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+    work_id: t.Optional[int] = db.Column(
+        'work_id',
+        db.Integer,
+        db.ForeignKey('Work.id', ondelete='SET NULL'),
+        nullable=True,
+    )
+    created_at: datetime.datetime = db.Column(
+        db.DateTime, default=datetime.datetime.utcnow
+    )
+
+    assignment: 'Assignment' = db.relationship(
+        'Assignment',
+        foreign_keys=assignment_id,
+        lazy='joined',
+        innerjoin=True,
+    )
+    user: 'User' = db.relationship('User', foreign_keys=user_id)
+    author: 'User' = db.relationship('User', foreign_keys=author_id)
+    work: t.Optional['Work'] = db.relationship('Work', foreign_keys=work_id)
+
+    def __init__(
+        self,
+        *,
+        files: t.Sequence[FileStorage],
+        upload_dir: str,
+        **kwargs: t.Any,
+    ) -> None:
+        """Create a new upload by storing the given files in the given
+        directory.
+
+        :param files: The uploaded files.
+        :param upload_dir: The, existing and empty, directory to store the
+            files in.
+        """
+        super().__init__(
+            upload_dir=upload_dir,
+            _filenames=json.dumps([f.filename for f in files]),
+            **kwargs,
+        )
+        for idx, f in enumerate(files):
+            f.save(os.path.join(upload_dir, str(idx)))
+
+    def get_files(self) -> t.List[FileStorage]:
+        """Open the stored files of this upload.
+
+        :returns: The uploaded files with their original names, the caller
+            should close them.
+        """
+        return [
+            FileStorage(
+                stream=open(os.path.join(self.upload_dir, str(idx)), 'rb'),
+                filename=name,
+            ) for idx, name in enumerate(json.loads(self._filenames))
+        ]
+
+    def delete_stored_files(self) -> None:
+        """Delete the stored files of this upload.
+
+        :returns: Nothing.
+        """
+        shutil.rmtree(self.upload_dir, ignore_errors=True)
+
+    @property
+    def error(self) -> t.Optional[t.Mapping[str, object]]:
+        """The serialized exception that caused this upload to fail.
+        """
+        if self._error is None:
+            return None
+        return json.loads(self._error)
+
+    @error.setter
+    def error(self, err: object) -> None:
+        self._error = json.dumps(err, cls=CustomJSONEncoder)
+
+    def __to_json__(self) -> t.Mapping[str, object]:
+        """Creates a JSON serializable representation of this object.
+
+        This object will look like this:
+
+        .. code:: python
+
+            {
+                'id': str, # The id of this upload.
+                'state': str, # The name of the current state of this upload.
+                'work_id': t.Optional[int], # The id of the created
+                                            # submission, only available if
+                                            # the state is ``done``.
+                'error': t.Optional[t.Mapping], # The error why the upload
+                                                # failed, formatted as any
+                                                # other API error, only
+                                                # available if the state is
+                                                # ``failed``.
+                'created_at': str, # ISO UTC date.
+                'assignment_id': int, # The assignment of this upload.
+            }
+
+        :returns: A object as described above.
+        """
+        return {
+            'id': self.id,
+            'state': self.state.name,
+            'work_id': self.work_id,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'assignment_id': self.assignment_id,
+        }
+
+
+class ChunkedUpload(Base):
+    """A single file that is uploaded in multiple requests.
+
+    The chunks are appended directly to a file in the shared temporary
+    directory, so a large upload never has to be kept in memory and it can be
+    resumed after a failed request by appending to it again from its current
+    ``size``. When all chunks are uploaded the upload should be finalized,
+    after which it can be used instead of a file in a multipart request, see
+    :func:`.helpers.get_files_from_request`.
+
+    :ivar ~.ChunkedUpload.filename: The name of the uploaded file.
+    :ivar ~.ChunkedUpload.size: The amount of bytes uploaded so far.
+    :ivar ~.ChunkedUpload.finalized: Are all chunks of this file uploaded.
+    """
+    if t.TYPE_CHECKING:  # pragma: no cover
+        query: t.ClassVar[_MyQuery['ChunkedUpload']] = Base.query
+    __tablename__ = 'ChunkedUpload'
+
+    id: str = db.Column(
+        'id',
+        db.String(UUID_LENGTH),
+        nullable=False,
+        primary_key=True,
+        default=lambda: str(uuid.uuid4()),
+    )
+    filename: str = db.Column('filename', db.Unicode, nullable=False)
+    size: int = db.Column('size', db.Integer, default=0, nullable=False)
+    finalized: bool = db.Column(
+        'finalized', db.Boolean, default=False, nullable=False
+    )
+    user_id: int = db.Column(
+        'user_id',
+        db.Integer,
+        db.ForeignKey('User.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+    created_at: datetime.datetime = db.Column(
+        db.DateTime, default=datetime.datetime.utcnow
+    )
+
+    user: 'User' = db.relationship('User', foreign_keys=user_id)
+
+    @property
+    def path(self) -> str:
+        """The path of the file with the uploaded chunks.
+        """
+        return os.path.join(
+            current_app.config['SHARED_TEMP_DIR'],
+            f'chunked_upload_{self.id}',
+        )
+
+    def append(
+        self,
+        stream: t.IO[bytes],
+        offset: int,
+        max_size: 'FileSize',
+    ) -> None:
+        """Append a chunk to this upload.
+
+        The size of the upload is checked while the chunk is written, so a too
+        large chunk is never completely stored.
+
+        :param stream: The stream with the chunk to append.
+        :param offset: The offset of the chunk in the file, this should be
+            equal to the current size of the upload.
+        :param max_size: The maximum size of the entire upload.
+        :returns: Nothing.
+
+        :raises APIException: If this upload is already finalized.
+            (INVALID_STATE)
+        :raises APIException: If the offset is not equal to the size of this
+            upload. (INVALID_PARAM)
+        :raises APIException: If the upload would become larger than
+            ``max_size``. (REQUEST_TOO_LARGE)
+        """
+        if self.finalized:
+            raise APIException(
+                'This upload is already finalized',
+                f'The upload "{self.id}" is finalized',
+                APICodes.INVALID_STATE, 400
+            )
+        if offset != self.size:
+            raise APIException(
+                'The given offset is not the end of the upload',
+                f'The offset should be {self.size}, but it was {offset}',
+                APICodes.INVALID_PARAM,
+                400,
+                size=self.size,
+            )
+
+        size = self.size
+        with open(self.path, 'ab') as f:
+            for chunk in iter(lambda: stream.read(_CHUNK_SIZE), b''):
+                size += len(chunk)
+                if size > max_size:
+                    f.truncate(self.size)
+                    helpers.raise_file_too_big_exception(max_size)
+                f.write(chunk)
+        self.size = size
+
+    def finalize(self, size: t.Optional[int] = None) -> None:
+        """Mark that all chunks of this upload are uploaded.
+
+        :param size: The expected size of the upload, if given this is
+            checked.
+        :returns: Nothing.
+
+        :raises APIException: If the upload is empty or not of the given size.
+            (INVALID_STATE)
+        """
+        if self.size == 0 or size not in {None, self.size}:
+            raise APIException(
+                'The upload is not complete',
+                f'The upload has a size of {self.size} bytes',
+                APICodes.INVALID_STATE,
+                400,
+                size=self.size,
+            )
+        self.finalized = True
+
+    def get_file(self) -> FileStorage:
+        """Open the uploaded file.
+
+        :returns: The uploaded file, the caller should close it.
+        """
+        assert self.finalized
+        return FileStorage(
+            stream=open(self.path, 'rb'), filename=self.filename
+        )
+
+    def delete_from_disk(self) -> None:
+        """Delete the uploaded chunks from disk.
+
+        :returns: Nothing.
+        """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __to_json__(self) -> t.Mapping[str, object]:
+        """Creates a JSON serializable representation of this object.
+
+        This object will look like this:
+
+        .. code:: python
+
+            {
+                'id': str, # The id of this upload.
+                'filename': str, # The name of the uploaded file.
+                'size': int, # The amount of bytes uploaded so far, this is
+                             # the offset of the next chunk.
+                'finalized': bool, # Are all chunks uploaded.
+                'created_at': str, # ISO UTC date.
+            }
+
+        :returns: A object as described above.
+        """
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'finalized': self.finalized,
+            'created_at': self.created_at.isoformat(),
+        }
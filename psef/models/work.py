@@ -3,27 +3,36 @@
 SPDX-License-Identifier: AGPL-3.0-only
 """
 
+import json
+import uuid
 import typing as t
 import datetime
 from collections import defaultdict
 
 import sqlalchemy.sql as sql
 from sqlalchemy import orm
+from sqlalchemy.exc import IntegrityError
 
 import psef
 
-from . import Base, DbColumn, db
+from . import UUID_LENGTH, Base, DbColumn, db
 from . import group as group_models
 from . import _MyQuery
 from .. import auth, helpers, features
-from .file import File, FileOwner
+from .file import File, FileOwner, FileTreeCache
 from .linter import LinterState, LinterComment, LinterInstance
 from .rubric import RubricItem
 from .comment import Comment
 from ..exceptions import PermissionException
 from .link_tables import work_rubric_item
+from ..cache import LRUCache
 from ..permissions import CoursePermission
 
+# Trees of submissions that were used recently by this process, indexed by
+# work id, excluded owner and file tree version.
+_FILE_TREES: LRUCache[t.Tuple[int, FileOwner, str], 'psef.files.FileTree'
+                      ] = LRUCache(max_size=256)
+
 if t.TYPE_CHECKING:  # pragma: no cover
     # pylint: disable=unused-import
     from . import user as user_models
@@ -140,6 +149,25 @@ class Work(Base):
     assigned_to: t.Optional[int] = db.Column(
         'assigned_to', db.Integer, db.ForeignKey('User.id'), nullable=True
     )
+    # This version is changed every time the files of this work are changed,
+    # so cached file trees are never used after such a change. A random value
+    # is used so that a version is never reused, not even for a different
+    # database.
+    _file_tree_version: str = db.Column(
+        'file_tree_version',
+        db.String(UUID_LENGTH),
+        default=lambda: str(uuid.uuid4()),
+        nullable=False,
+    )
+    # The total size in bytes and the amount of the files as they were handed
+    # in, these are ``None`` for submissions created before these were
+    # stored.
+    total_file_size: t.Optional[int] = db.Column(
+        'total_file_size', db.Integer, nullable=True
+    )
+    file_count: t.Optional[int] = db.Column(
+        'file_count', db.Integer, nullable=True
+    )
     selected_items = db.relationship(
         'RubricItem', secondary=work_rubric_item
     )  # type: t.MutableSequence['RubricItem']
@@ -503,46 +531,115 @@ class Work(Base):
 
         .. warning:: All previous files will be unlinked from this assignment.
 
+        .. note::
+
+            The files are inserted directly into the database, so this work
+            is added to the session and flushed if it doesn't have an id yet.
+
         :param tree: The file tree as described by
             :py:func:`psef.files.rename_directory_structure`
         :returns: Nothing
         """
-        self._add_file_tree(tree, None)
+        self.invalidate_file_tree()
+        self.total_file_size = tree.get_size()
+        self.file_count = tree.get_file_count()
+        if self.id is None:
+            db.session.add(self)
+            db.session.flush()
+        self._add_file_tree(tree)
 
     def _add_file_tree(
         self,
         tree: 'psef.files.ExtractFileTreeDirectory',
-        top: t.Optional['File'],
-    ) -> 'File':
-        """Add the given tree to the session with top as parent.
+    ) -> None:
+        """Insert the given tree for this work without creating ORM objects.
+
+        On PostgreSQL the ids of all files are reserved from the sequence in a
+        single query, after which the entire tree is inserted using multi row
+        inserts. Other databases have no sequences, so there each directory is
+        inserted separately to get its id and only the files are inserted in
+        bulk.
 
         :param tree: The file tree as described by
                           :py:func:`psef.files.rename_directory_structure`
-        :param top: The parent file
         :returns: Nothing
         """
-        new_top = File(
-            work=self,
-            is_directory=True,
-            name=tree.name,
-            parent=top,
-        )
-
-        for child in tree.values:
-            if isinstance(child, psef.files.ExtractFileTreeDirectory):
-                self._add_file_tree(child, new_top)
-            elif isinstance(child, psef.files.ExtractFileTreeFile):
-                File(
-                    work=self,
-                    name=child.name,
-                    filename=child.disk_name,
-                    is_directory=False,
-                    parent=new_top,
-                )
+        table = File.__table__
+        now = datetime.datetime.utcnow()
+        # The rows in pre-order, so every parent is before its children, with
+        # the index of the row of its parent.
+        rows: t.List[t.Tuple[t.Dict[str, object], t.Optional[int]]] = []
+
+        def __add_rows(
+            node: 'psef.files.ExtractFileTreeBase',
+            parent_idx: t.Optional[int],
+            parent_path: t.Optional[str],
+        ) -> None:
+            path = File.join_path(parent_path, node.name)
+            row: t.Dict[str, object] = {
+                'id': None,
+                'Work_id': self.id,
+                'name': node.name,
+                'path': path,
+                'filename': None,
+                'size': None,
+                'digest': None,
+                'is_directory': node.is_dir,
+                'parent_id': None,
+                'modification_date': now,
+                'fileowner': FileOwner.both,
+            }
+            rows.append((row, parent_idx))
+
+            if isinstance(node, psef.files.ExtractFileTreeDirectory):
+                idx = len(rows) - 1
+                for child in node.values:
+                    __add_rows(child, idx, path)
+            elif isinstance(node, psef.files.ExtractFileTreeFile):
+                row['filename'] = node.disk_name
+                row['size'] = node.size
+                row['digest'] = node.digest
             else:
                 # The above checks are exhaustive, so this cannot happen
                 assert False
-        return new_top
+
+        __add_rows(tree, None, None)
+
+        if db.session.get_bind().dialect.name == 'postgresql':
+            ids = db.session.execute(
+                sql.text(
+                    """SELECT nextval(pg_get_serial_sequence('"File"', 'id'))
+                    FROM generate_series(1, :amount)"""
+                ),
+                {'amount': len(rows)},
+            ).fetchall()
+            for (row, parent_idx), (new_id, ) in zip(rows, ids):
+                row['id'] = new_id
+                if parent_idx is not None:
+                    row['parent_id'] = rows[parent_idx][0]['id']
+            to_insert = [row for row, _ in rows]
+        else:
+            to_insert = []
+            for row, parent_idx in rows:
+                del row['id']
+                if parent_idx is not None:
+                    row['parent_id'] = rows[parent_idx][0]['id']
+                if row['is_directory']:
+                    row['id'] = db.session.execute(
+                        table.insert().values(row)
+                    ).inserted_primary_key[0]
+                else:
+                    to_insert.append(row)
+
+        # Databases limit the amount of parameters of a single query, SQLite
+        # to 999, so the rows are inserted in chunks that stay below this.
+        if not to_insert:
+            return
+        chunk_size = 999 // len(to_insert[0])
+        for i in range(0, len(to_insert), chunk_size):
+            db.session.execute(
+                table.insert().values(to_insert[i:i + chunk_size])
+            )
 
     def get_all_feedback(self) -> t.Tuple[t.Iterable[str], t.Iterable[str], ]:
         """Get all feedback for this work.
@@ -579,6 +676,29 @@ class Work(Base):
 
         return __get_user_feedback(), __get_linter_feedback()
 
+    def get_feedback_text(self) -> str:
+        """Get all feedback for this work as a human readable text.
+
+        :returns: The grade, general feedback and all comments of this work,
+            the linter comments are only included if the linters feature is
+            enabled.
+        """
+        comments, linter_comments = self.get_all_feedback()
+
+        res = [
+            f'Assignment: {self.assignment.name}\n'
+            f'Grade: {self.grade or ""}\n'
+            f'General feedback:\n{self.comment or ""}\n\n'
+            'Comments:\n'
+        ]
+        res.extend(f'{comment}\n' for comment in comments)
+
+        if features.has_feature(features.Feature.LINTERS):
+            res.append('\nLinter comments:\n')
+            res.extend(f'{lcomment}\n' for lcomment in linter_comments)
+
+        return ''.join(res)
+
     def remove_selected_rubric_item(self, row_id: int) -> None:
         """Deselect selected :class:`.RubricItem` on row.
 
@@ -614,25 +734,9 @@ class Work(Base):
         """
         patharr, is_dir = psef.files.split_path(pathname)
 
-        parent: t.Optional[t.Any] = None
-        for idx, pathpart in enumerate(patharr[:-1]):
-            if parent is not None:
-                parent = parent.c.id
-
-            parent = db.session.query(t.cast(DbColumn[int], File.id)).filter(
-                File.name == pathpart,
-                File.parent_id == parent,
-                File.work_id == self.id,
-                File.is_directory,
-            ).subquery(f'parent_{idx}')
-
-        if parent is not None:
-            parent = parent.c.id
-
         return [
             File.work_id == self.id,
-            File.name == patharr[-1],
-            File.parent_id == parent,
+            File.path == '/'.join(patharr),
             File.fileowner != exclude,
             File.is_directory == is_dir,
         ]
@@ -656,6 +760,72 @@ class Work(Base):
             *self.search_file_filters(pathname, exclude),
         )
 
+    def invalidate_file_tree(self) -> None:
+        """Invalidate all cached file trees of this work.
+
+        This should be called every time a file of this work is created,
+        deleted, moved, or when its owner changes.
+
+        :returns: Nothing.
+        """
+        self._file_tree_version = str(uuid.uuid4())
+
+    def get_file_tree(self, exclude: 'FileOwner') -> 'psef.files.FileTree':
+        """Get the tree of all files of this work.
+
+        The tree is retrieved from a process wide cache, and when that is not
+        possible from a tree stored in the database. Only if neither is
+        available (or they are outdated) the tree is created from the files of
+        this work, and stored in the database. It is the responsibility of the
+        caller to commit the session to persist this cache.
+
+        The returned tree is shared and should **never** be mutated.
+
+        :param exclude: The file owner to exclude from the tree.
+        :returns: The tree of the top level directory of this work, see
+            :meth:`.File.list_contents` for the format.
+        """
+        version = self._file_tree_version
+        key = (self.id, exclude, version)
+        tree = _FILE_TREES.get(key)
+        if tree is not None:
+            return tree
+
+        stored = FileTreeCache.query.get((self.id, exclude))
+        if stored is not None and stored.version == version:
+            tree = json.loads(stored.tree)
+        else:
+            root = helpers.filter_single_or_404(
+                File,
+                File.work_id == self.id,
+                t.cast(DbColumn[int], File.parent_id).is_(None),
+                File.fileowner != exclude,
+            )
+            tree = root.list_contents_uncached(exclude)
+            serialized = json.dumps(tree)
+
+            try:
+                with db.session.begin_nested():
+                    if stored is None:
+                        db.session.add(
+                            FileTreeCache(
+                                work_id=self.id,
+                                exclude_owner=exclude,
+                                version=version,
+                                tree=serialized,
+                            )
+                        )
+                    else:
+                        stored.version = version
+                        stored.tree = serialized
+            except IntegrityError:  # pragma: no cover
+                # Another request stored this tree at the same time, which is
+                # no problem as we only cache.
+                pass
+
+        _FILE_TREES.set(key, tree)
+        return tree
+
     def get_file_children_mapping(self, exclude: 'FileOwner'
                                   ) -> t.Mapping[int, t.Sequence['File']]:
         """Get a mapping that maps a file id to all its children.
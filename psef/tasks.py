@@ -84,6 +84,13 @@ def __celery_rejected(**kwargs: object) -> None:  # pragma: no cover
     )
 
 
+@signals.worker_process_shutdown.connect
+def __celery_worker_process_shutdown(**_: object) -> None:  # pragma: no cover
+    # Pool processes exit using ``os._exit``, so ``atexit`` handlers are not
+    # called and the linter daemons of the process have to be stopped here.
+    p.linter_daemon.stop_all()
+
+
 # pylint: disable=missing-docstring,no-self-use,pointless-statement
 if t.TYPE_CHECKING:  # pragma: no cover
     T = t.TypeVar('T', bound=t.Callable)
@@ -354,7 +361,10 @@ def _run_plagiarism_control_1(  # pylint: disable=too-many-branches,too-many-sta
         at_end,
     ), tempfile.TemporaryDirectory(
     ) as result_dir, tempfile.TemporaryDirectory(
-    ) as tempdir, tempfile.TemporaryDirectory() as archive_dir:
+        dir=p.app.config['RESTORE_DIR'],
+    ) as tempdir, tempfile.TemporaryDirectory(
+        dir=p.app.config['RESTORE_DIR'],
+    ) as archive_dir:
         plagiarism_run = p.models.PlagiarismRun.query.get(plagiarism_run_id)
         if plagiarism_run is None:  # pragma: no cover
             logger.info(
@@ -413,7 +423,9 @@ def _run_plagiarism_control_1(  # pylint: disable=too-many-branches,too-many-sta
                     parent = os.path.join(archive_dir, dir_name)
 
             os.mkdir(parent)
-            part_tree = p.files.restore_directory_structure(sub, parent)
+            part_tree = p.files.restore_directory_structure(
+                sub, parent, use_links=True
+            )
             file_lookup_tree[sub.id] = {
                 'name': dir_name,
                 'id': -1,
@@ -473,6 +485,115 @@ def _run_plagiarism_control_1(  # pylint: disable=too-many-branches,too-many-sta
         p.models.db.session.commit()
 
 
+@celery.task
+def _export_submissions_1(
+    export_id: str, submission_ids: t.Sequence[int]
+) -> None:
+    export = p.models.AssignmentExport.query.get(export_id)
+    if export is None:  # pragma: no cover
+        logger.info('Export was already deleted', export_id=export_id)
+        return
+
+    export.state = p.models.ExportState.running
+    p.models.db.session.commit()
+
+    def get_submissions() -> t.Iterator[p.models.Work]:
+        for sub_id in submission_ids:
+            sub = p.models.Work.query.get(sub_id)
+            if sub is None:  # pragma: no cover
+                # The submission was deleted after the export was started.
+                continue
+            yield sub
+
+    def submission_done(_: p.models.Work) -> None:
+        assert export is not None
+        export.submissions_done += 1
+        p.models.db.session.commit()
+
+    path, name = p.files.random_file_path(True)
+    try:
+        with open(path, 'wb') as f:
+            for chunk in p.zip_stream.stream_zip(
+                p.zip_stream.get_assignment_entries(
+                    get_submissions(),
+                    export.exclude_owner,
+                    export.include_feedback,
+                    submission_done,
+                ),
+            ):
+                f.write(chunk)
+    except Exception:  # pragma: no cover
+        p.models.db.session.rollback()
+        export.state = p.models.ExportState.crashed
+        p.models.db.session.commit()
+        if os.path.exists(path):
+            os.unlink(path)
+        raise
+
+    export.filename = name
+    export.state = p.models.ExportState.done
+    p.models.db.session.commit()
+
+
+@celery.task
+def _process_submission_upload_1(upload_id: str) -> None:
+    upload = p.models.SubmissionUpload.query.get(upload_id)
+    if upload is None:  # pragma: no cover
+        logger.info('Upload was already deleted', upload_id=upload_id)
+        return
+
+    upload.state = p.models.UploadState.running
+    p.models.db.session.commit()
+
+    files = upload.get_files()
+    try:
+        assig = upload.assignment
+        work = p.models.Work(
+            assignment=assig,
+            user_id=upload.author_id,
+            # The submission should not be late because of the time it took
+            # to process it.
+            created_at=upload.created_at,
+        )
+        work.divide_new_work()
+
+        tree = p.files.process_files(
+            files,
+            max_size=p.app.max_file_size,
+            force_txt=False,
+            ignore_filter=assig.cgignore,
+            handle_ignore=upload.handle_ignore,
+        )
+        work.add_file_tree(tree)
+        p.models.db.session.add(work)
+        p.models.db.session.flush()
+    except p.exceptions.APIException as e:
+        # These are the errors the user would have gotten if the upload was
+        # not processed in the background, for example about ignored files.
+        p.models.db.session.rollback()
+        upload.state = p.models.UploadState.failed
+        upload.error = e
+        p.models.db.session.commit()
+        return
+    except Exception:  # pragma: no cover
+        p.models.db.session.rollback()
+        upload.state = p.models.UploadState.crashed
+        p.models.db.session.commit()
+        raise
+    finally:
+        for f in files:
+            f.close()
+        upload.delete_stored_files()
+
+    upload.work = work
+    upload.state = p.models.UploadState.done
+    p.models.db.session.commit()
+
+    if assig.is_lti:
+        passback_grades([work.id], initial=True)
+    work.run_linter()
+
+
 @celery.task
 def _add_1(first: int, second: int) -> int:  # pragma: no cover
     """This function is used for testing if celery works. What it actually does
@@ -487,6 +608,8 @@ add = _add_1.delay  # pylint: disable=invalid-name
 send_done_mail = _send_done_mail_1.delay  # pylint: disable=invalid-name
 send_grader_status_mail = _send_grader_status_mail_1.delay  # pylint: disable=invalid-name
 run_plagiarism_control = _run_plagiarism_control_1.delay  # pylint: disable=invalid-name
+export_submissions = _export_submissions_1.delay  # pylint: disable=invalid-name
+process_submission_upload = _process_submission_upload_1.delay  # pylint: disable=invalid-name
 
 send_reminder_mails: t.Callable[[
     t.Tuple[int], NamedArg(t.Optional[datetime.datetime], 'eta')
@@ -10,6 +10,7 @@ import json
 import shutil
 import typing as t
 import datetime
+import tempfile
 from collections import defaultdict
 
 import werkzeug
@@ -35,7 +36,7 @@ from psef.exceptions import (
 from . import api
 from .. import (
     auth, tasks, ignore, models, archive, helpers, linters, parsers, features,
-    plagiarism
+    zip_stream, plagiarism
 )
 from ..permissions import CoursePermission as CPerm
 
@@ -646,7 +647,10 @@ def process_rubric_row(row: JSONType) -> models.RubricRow:
 
 
 @api.route('/assignments/<int:assignment_id>/submission', methods=['POST'])
-def upload_work(assignment_id: int) -> ExtendedJSONResponse[models.Work]:
+def upload_work(
+    assignment_id: int
+) -> t.Union[ExtendedJSONResponse[models.Work],
+             JSONResponse[models.SubmissionUpload]]:
     """Upload one or more files as :class:`.models.Work` to the given
     :class:`.models.Assignment`.
 
@@ -658,9 +662,18 @@ def upload_work(assignment_id: int) -> ExtendedJSONResponse[models.Work]:
         :py:class:`.APIException` when there are ignored files in the archive.
     :query author: The username of the user that should be the author of this
         new submission. Simply don't give this if you want to be the author.
+    :query async: If ``true`` the files are only stored and processed in the
+        background, use
+        :http:get:`/api/v1/assignments/(int:assignment_id)/uploads/(upload_id)`
+        to get the result.
+    :query chunked_upload: The id of a finalized upload, see
+        :http:post:`/api/v1/files/chunked/`, which should be used instead of
+        posted files. Can be given multiple times.
 
     :param int assignment_id: The id of the assignment
-    :returns: A JSON serialized work and with the status code 201.
+    :returns: A JSON serialized work and with the status code 201. If the
+        upload is processed in the background the created
+        :class:`.models.SubmissionUpload` is returned with status code 202.
 
     :raises APIException: If the request is bigger than the maximum upload
         size. (REQUEST_TOO_LARGE)
@@ -673,6 +686,52 @@ def upload_work(assignment_id: int) -> ExtendedJSONResponse[models.Work]:
         max_size=current_app.max_file_size, keys=['file'], only_start=True
     )
     assig = helpers.get_or_404(models.Assignment, assignment_id)
+    author = _get_submission_author(assig)
+    raise_or_delete = _get_ignore_handling()
+
+    if helpers.request_arg_true('async'):
+        upload_dir = tempfile.mkdtemp(
+            dir=current_app.config['SHARED_TEMP_DIR']
+        )
+        try:
+            upload = models.SubmissionUpload(
+                files=files,
+                upload_dir=upload_dir,
+                assignment=assig,
+                user=current_user,
+                author=author,
+                handle_ignore=raise_or_delete,
+            )
+            db.session.add(upload)
+            db.session.commit()
+        except:  # pylint: disable=bare-except; #pragma: no cover
+            shutil.rmtree(upload_dir)
+            raise
+
+        helpers.callback_after_this_request(
+            lambda: tasks.process_submission_upload(upload_id=upload.id)
+        )
+        return jsonify(upload, status_code=202)
+
+    tree = psef.files.process_files(
+        files,
+        max_size=current_app.max_file_size,
+        force_txt=False,
+        ignore_filter=assig.cgignore,
+        handle_ignore=raise_or_delete,
+    )
+    work = _create_work(assig, author, tree)
+
+    return extended_jsonify(work, status_code=201, use_extended=models.Work)
+
+
+def _get_submission_author(assig: models.Assignment) -> models.User:
+    """Get the author of a new submission for the given assignment.
+
+    :param assig: The assignment to which a submission will be uploaded.
+    :returns: The author of the submission, this is the virtual user of the
+        group of the author for group assignments.
+    """
     given_author = request.args.get('author', None)
 
     if assig.deadline is None:
@@ -715,11 +774,12 @@ def upload_work(assignment_id: int) -> ExtendedJSONResponse[models.Work]:
                 group=group,
             )
 
-    work = models.Work(assignment=assig, user_id=author.id)
-    work.divide_new_work()
+    return author
+
 
+def _get_ignore_handling() -> ignore.IgnoreHandling:
     try:
-        raise_or_delete = psef.ignore.IgnoreHandling[request.args.get(
+        return psef.ignore.IgnoreHandling[request.args.get(
             'ignored_files',
             'keep',
         )]
@@ -734,13 +794,21 @@ def upload_work(assignment_id: int) -> ExtendedJSONResponse[models.Work]:
             400,
         )
 
-    tree = psef.files.process_files(
-        files,
-        max_size=current_app.max_file_size,
-        force_txt=False,
-        ignore_filter=assig.cgignore,
-        handle_ignore=raise_or_delete,
-    )
+
+def _create_work(
+    assig: models.Assignment,
+    author: models.User,
+    tree: psef.files.ExtractFileTree,
+) -> models.Work:
+    """Create and commit a new submission with the given files.
+
+    :param assig: The assignment of the new submission.
+    :param author: The author of the new submission.
+    :param tree: The processed files of the submission.
+    :returns: The created submission.
+    """
+    work = models.Work(assignment=assig, user_id=author.id)
+    work.divide_new_work()
     work.add_file_tree(tree)
     db.session.add(work)
     db.session.flush()
@@ -755,9 +823,168 @@ def upload_work(assignment_id: int) -> ExtendedJSONResponse[models.Work]:
 
     work.run_linter()
 
+    return work
+
+
+def _get_previous_file_digests(
+    assig: models.Assignment, author: models.User
+) -> t.Dict[str, 'psef.blob_store.StoredFile']:
+    previous = models.Work.query.filter_by(
+        assignment_id=assig.id,
+        user_id=author.id,
+    ).order_by(t.cast(models.DbColumn[object], models.Work.created_at).desc()
+               ).first()
+    if previous is None:
+        return {}
+    return psef.files.get_file_digests(previous)
+
+
+@api.route(
+    '/assignments/<int:assignment_id>/submission/manifest', methods=['POST']
+)
+def check_submission_manifest(
+    assignment_id: int
+) -> JSONResponse[t.Mapping[str, t.List[str]]]:
+    """Check which files of a new submission are already known by the server.
+
+    .. :quickref: Assignment; Check which files of a submission are known.
+
+    The contents of files that are known do not have to be uploaded when
+    using
+    :http:post:`/api/v1/assignments/(int:assignment_id)/submission/delta`,
+    these are the files of the latest submission of the author.
+
+    :query author: The username of the user that should be the author of the
+        new submission, see
+        :http:post:`/api/v1/assignments/(int:assignment_id)/submission`.
+
+    :<json files: The manifest of the submission, this is a list of objects
+        with a ``path``, the SHA256 hex digest of the file as ``hash`` and the
+        ``size`` of the file in bytes.
+    :param int assignment_id: The id of the assignment
+    :returns: A mapping with the key ``known`` for the hashes of the files
+        that are known, and the key ``missing`` for the hashes of the files
+        that should be uploaded.
+
+    :raises APIException: If the manifest is not valid. (INVALID_PARAM)
+    :raises APIException: If the files in the manifest are too large.
+        (REQUEST_TOO_LARGE)
+    """
+    assig = helpers.get_or_404(models.Assignment, assignment_id)
+    author = _get_submission_author(assig)
+
+    content = ensure_json_dict(request.get_json())
+    ensure_keys_in_dict(content, [('files', list)])
+    manifest = psef.files.parse_manifest(content['files'])
+    if sum(e.size for e in manifest) > current_app.max_file_size:
+        helpers.raise_file_too_big_exception(current_app.max_file_size)
+
+    known = _get_previous_file_digests(assig, author)
+    digests = sorted(set(e.digest for e in manifest))
+
+    return jsonify(
+        {
+            'known': [d for d in digests if d in known],
+            'missing': [d for d in digests if d not in known],
+        }
+    )
+
+
+@api.route(
+    '/assignments/<int:assignment_id>/submission/delta', methods=['POST']
+)
+def upload_work_delta(
+    assignment_id: int
+) -> ExtendedJSONResponse[models.Work]:
+    """Create a submission from a manifest, only uploading the files that are
+    not known by the server yet.
+
+    .. :quickref: Assignment; Create work by uploading changed files.
+
+    The request should be a multipart request, where the form field
+    ``manifest`` contains the manifest as JSON, in the same format as for
+    :http:post:`/api/v1/assignments/(int:assignment_id)/submission/manifest`.
+    Every file that is not known should be posted under its hash as key.
+
+    :query ignored_files: How to handle ignored files, see
+        :http:post:`/api/v1/assignments/(int:assignment_id)/submission`.
+    :query author: The username of the user that should be the author of this
+        new submission. Simply don't give this if you want to be the author.
+
+    :param int assignment_id: The id of the assignment
+    :returns: A JSON serialized work and with the status code 201.
+
+    :raises APIException: If the request is bigger than the maximum upload
+        size. (REQUEST_TOO_LARGE)
+    :raises APIException: If the manifest is not valid or if the contents of
+        some files are not known and were not given, the hashes of these
+        files are returned under the ``missing`` key. (INVALID_PARAM)
+    """
+    if (request.content_length or 0) > current_app.max_file_size:
+        helpers.raise_file_too_big_exception(current_app.max_file_size)
+
+    assig = helpers.get_or_404(models.Assignment, assignment_id)
+    author = _get_submission_author(assig)
+    raise_or_delete = _get_ignore_handling()
+
+    try:
+        manifest = psef.files.parse_manifest(
+            json.loads(request.form['manifest'])
+        )
+    except (KeyError, ValueError):
+        raise APIException(
+            'The manifest is missing or is not valid JSON',
+            'The form field "manifest" should contain the manifest as JSON',
+            APICodes.INVALID_PARAM, 400
+        )
+
+    tree = psef.files.create_tree_from_manifest(
+        manifest,
+        request.files,
+        _get_previous_file_digests(assig, author),
+    )
+    tree = psef.files.process_file_tree(
+        tree,
+        max_size=current_app.max_file_size,
+        ignore_filter=assig.cgignore,
+        handle_ignore=raise_or_delete,
+    )
+    work = _create_work(assig, author, tree)
+
     return extended_jsonify(work, status_code=201, use_extended=models.Work)
 
 
+@api.route(
+    '/assignments/<int:assignment_id>/uploads/<upload_id>', methods=['GET']
+)
+@auth.login_required
+def get_submission_upload(
+    assignment_id: int, upload_id: str
+) -> JSONResponse[models.SubmissionUpload]:
+    """Get the state of an upload to the given :class:`.models.Assignment`
+    that is processed in the background.
+
+    .. :quickref: Assignment; Get the state of a background upload.
+
+    :param int assignment_id: The id of the assignment.
+    :param str upload_id: The id of the upload.
+    :returns: The :class:`.models.SubmissionUpload`. If its state is ``done``
+        it contains the id of the created submission, if its state is
+        ``failed`` it contains the error that would have been returned if the
+        upload was not processed in the background.
+
+    :raises APIException: If the upload does not exist or was not done by the
+        current user. (OBJECT_ID_NOT_FOUND)
+    """
+    upload = helpers.filter_single_or_404(
+        models.SubmissionUpload,
+        models.SubmissionUpload.id == upload_id,
+        models.SubmissionUpload.assignment_id == assignment_id,
+        models.SubmissionUpload.user_id == current_user.id,
+    )
+    return jsonify(upload)
+
+
 @api.route(
     '/assignments/<int:assignment_id>/division_parent', methods=['PATCH']
 )
@@ -1166,6 +1393,188 @@ def get_all_works_for_assignment(
         return jsonify(obj.all())
 
 
+def _ensure_can_export_submissions(
+    assignment: models.Assignment,
+    exclude_owner: models.FileOwner,
+    include_feedback: bool,
+) -> t.Sequence[int]:
+    """Make sure the current user can export all latest submissions of the
+    given assignment.
+
+    :param assignment: The assignment to export.
+    :param exclude_owner: The owner of the files that will be excluded.
+    :param include_feedback: Will the feedback be included in the export.
+    :returns: The ids of the submissions that will be exported.
+
+    :raises PermissionException: If the user cannot view the files or the
+        feedback of one of the submissions. (INCORRECT_PERMISSION)
+    """
+    auth.ensure_permission(CPerm.can_see_others_work, assignment.course_id)
+
+    subs = assignment.get_all_latest_submissions().all()
+    for sub in subs:
+        auth.ensure_can_view_files(
+            sub, exclude_owner == models.FileOwner.student
+        )
+        if include_feedback:
+            auth.ensure_can_see_grade(sub)
+
+    return [sub.id for sub in subs]
+
+
+@api.route(
+    '/assignments/<int:assignment_id>/submissions/export', methods=['GET']
+)
+@auth.login_required
+def export_submissions(assignment_id: int) -> werkzeug.wrappers.Response:
+    """Download all latest submissions of the given
+    :class:`.models.Assignment` as a single zip archive.
+
+    .. :quickref: Assignment; Download all latest submissions as zip.
+
+    The archive is streamed directly in the response. Every submission is
+    placed in a directory named after its author and id. To create the
+    archive in the background see
+    :http:post:`/api/v1/assignments/(int:assignment_id)/exports/`.
+
+    :param int assignment_id: The id of the assignment.
+    :returns: A streaming response with the zip archive as attachment.
+
+    :query str owner: The type of files to include, see
+        :http:get:`/api/v1/submissions/(int:submission_id)/zip`.
+    :query bool feedback: Include the feedback of every submission in a
+        ``feedback.txt`` file, defaults to ``false``.
+    :query str compression: Either ``deflate`` (the default) or ``store``.
+
+    :raises APIException: If the given compression is not valid.
+        (INVALID_PARAM)
+    :raises PermissionException: If there is no logged in user. (NOT_LOGGED_IN)
+    :raises PermissionException: If the user cannot view the files or the
+        feedback of one of the submissions. (INCORRECT_PERMISSION)
+    """
+    assignment = helpers.get_or_404(models.Assignment, assignment_id)
+    exclude_owner = models.File.get_exclude_owner(
+        request.args.get('owner'),
+        assignment.course_id,
+    )
+    include_feedback = helpers.request_arg_true('feedback')
+    compression = zip_stream.get_compression(
+        request.args.get('compression', 'deflate')
+    )
+
+    sub_ids = _ensure_can_export_submissions(
+        assignment, exclude_owner, include_feedback
+    )
+
+    # Load the submissions one by one, so that a submission and its files can
+    # be garbage collected as soon as it is in the archive.
+    def __get_submissions() -> t.Iterator[models.Work]:
+        for sub_id in sub_ids:
+            yield models.Work.query.get(sub_id)
+
+    return zip_stream.make_response(
+        zip_stream.stream_zip(
+            zip_stream.get_assignment_entries(
+                __get_submissions(),
+                exclude_owner,
+                include_feedback,
+            ),
+            compression=compression,
+        ),
+        f'{assignment.name}-submissions.zip',
+    )
+
+
+@api.route('/assignments/<int:assignment_id>/exports/', methods=['POST'])
+@auth.login_required
+def start_export_submissions(
+    assignment_id: int
+) -> JSONResponse[models.AssignmentExport]:
+    """Start exporting all latest submissions of the given
+    :class:`.models.Assignment` to a single zip archive in the background.
+
+    .. :quickref: Assignment; Export all latest submissions in the background.
+
+    :param int assignment_id: The id of the assignment.
+    :returns: The newly created :class:`.models.AssignmentExport`, use
+        :http:get:`/api/v1/assignments/(int:assignment_id)/exports/(export_id)`
+        to follow its progress.
+
+    :<json str owner: The type of files to include, see
+        :http:get:`/api/v1/submissions/(int:submission_id)/zip`. (OPTIONAL)
+    :<json bool feedback: Include the feedback of every submission.
+        (OPTIONAL)
+
+    :raises PermissionException: If there is no logged in user. (NOT_LOGGED_IN)
+    :raises PermissionException: If the user cannot view the files or the
+        feedback of one of the submissions. (INCORRECT_PERMISSION)
+    """
+    assignment = helpers.get_or_404(models.Assignment, assignment_id)
+    content = ensure_json_dict(request.get_json() or {})
+    owner = content.get('owner', None)
+    include_feedback = content.get('feedback', False)
+    if not isinstance(owner, (str, type(None))) or not isinstance(
+        include_feedback, bool
+    ):
+        raise APIException(
+            'The given options are not valid',
+            '"owner" should be a string and "feedback" a boolean',
+            APICodes.INVALID_PARAM, 400
+        )
+
+    exclude_owner = models.File.get_exclude_owner(owner, assignment.course_id)
+    sub_ids = _ensure_can_export_submissions(
+        assignment, exclude_owner, include_feedback
+    )
+
+    export = models.AssignmentExport(
+        assignment=assignment,
+        user=current_user,
+        exclude_owner=exclude_owner,
+        include_feedback=include_feedback,
+        submissions_total=len(sub_ids),
+    )
+    db.session.add(export)
+    db.session.commit()
+
+    helpers.callback_after_this_request(
+        lambda: psef.tasks.export_submissions(
+            export_id=export.id,
+            submission_ids=sub_ids,
+        )
+    )
+
+    return jsonify(export, status_code=201)
+
+
+@api.route(
+    '/assignments/<int:assignment_id>/exports/<export_id>', methods=['GET']
+)
+@auth.login_required
+def get_export_submissions(
+    assignment_id: int, export_id: str
+) -> JSONResponse[models.AssignmentExport]:
+    """Get the state of an export of the given :class:`.models.Assignment`.
+
+    .. :quickref: Assignment; Get the progress of an export.
+
+    :param int assignment_id: The id of the assignment.
+    :param str export_id: The id of the export.
+    :returns: The :class:`.models.AssignmentExport`. If its state is ``done``
+        the archive can be downloaded using ``GET - /api/v1/files/<name>``.
+
+    :raises APIException: If the export does not exist or was not started by
+        the current user. (OBJECT_ID_NOT_FOUND)
+    """
+    export = helpers.filter_single_or_404(
+        models.AssignmentExport,
+        models.AssignmentExport.id == export_id,
+        models.AssignmentExport.assignment_id == assignment_id,
+        models.AssignmentExport.user_id == current_user.id,
+    )
+    return jsonify(export)
+
+
 @api.route("/assignments/<int:assignment_id>/submissions/", methods=['POST'])
 @features.feature_required(features.Feature.BLACKBOARD_ZIP_UPLOAD)
 def post_submissions(assignment_id: int) -> EmptyResponse:
@@ -1178,6 +1587,10 @@ def post_submissions(assignment_id: int) -> EmptyResponse:
     with 'file'. Multiple blackboard zips are not supported and result in one
     zip being chosen at (psuedo) random.
 
+    :query chunked_upload: The id of a finalized upload, see
+        :http:post:`/api/v1/files/chunked/`, which should be used instead of a
+        posted file.
+
     :param int assignment_id: The id of the assignment
     :returns: An empty response with return code 204
 
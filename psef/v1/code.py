@@ -5,16 +5,19 @@ APIs are used to manipulate student submitted code and the related feedback.
 SPDX-License-Identifier: AGPL-3.0-only
 """
 
-import shutil
+import os
 import typing as t
+import hashlib
 
 import werkzeug
 import sqlalchemy.sql as sql
-from flask import request, make_response
+from flask import request, send_file
 from sqlalchemy.orm import make_transient
 
 from . import api
-from .. import app, auth, files, models, helpers, features, current_user
+from .. import (
+    app, auth, files, models, helpers, features, blob_store, current_user
+)
 from ..errors import APICodes, APIException
 from ..models import FileOwner, db
 from ..helpers import (
@@ -131,7 +134,9 @@ def get_code(file_id: int) -> t.Union[werkzeug.wrappers.Response, JSONResponse[
       :py:func:`.get_file_url`.
     - If ``type == 'feedback'`` or ``type == 'linter-feedback'`` see
       :py:func:`.code.get_feedback`
-    - Otherwise the content of the file is returned as plain text.
+    - Otherwise the content of the file is returned as plain text. This
+      response has a strong ``ETag`` and supports conditional (using
+      ``If-None-Match``) and ``Range`` requests.
 
     :param int file_id: The id of the file
     :returns: A response containing a plain text file unless specified
@@ -163,22 +168,58 @@ def get_code(file_id: int) -> t.Union[werkzeug.wrappers.Response, JSONResponse[
     elif get_type == 'linter-feedback':
         return jsonify(get_feedback(file, linter=True))
     else:
-        contents = files.get_file_contents(file)
-        res: 'werkzeug.wrappers.Response' = make_response(contents)
-        res.headers['Content-Type'] = 'application/octet-stream'
-        return res
+        return _send_code(file)
+
+
+def _send_code(file: models.File) -> werkzeug.wrappers.Response:
+    """Send the contents of the given file.
+
+    The contents of a :class:`.models.File` are never changed in place, a
+    change in its contents always results in a new ``filename``, so an ETag
+    derived from the ``filename`` is a strong validator. The response honors
+    ``If-None-Match`` and ``Range`` headers, and is served by the WSGI server
+    (using ``sendfile`` if available) instead of reading it into memory.
+
+    :param file: The file to send.
+    :returns: A response with the contents of the file.
+    """
+    path = files.get_readable_diskname(file)
+    res: werkzeug.wrappers.Response = send_file(
+        path,
+        mimetype='application/octet-stream',
+        add_etags=False,
+        conditional=False,
+        cache_timeout=0,
+    )
+
+    res.set_etag(
+        hashlib.sha256(f'{file.id}-{file.filename}'.encode()).hexdigest()
+    )
+    # Clients may cache the contents, but they should always revalidate them.
+    res.cache_control.public = False
+    res.cache_control.private = True
+    res.cache_control.no_cache = True
+    return res.make_conditional(
+        request,
+        accept_ranges=True,
+        complete_length=os.path.getsize(path),
+    )
 
 
 def get_file_url(file: models.File) -> str:
-    """Copies the given file to the mirror uploads folder and returns its name.
+    """Make the given file available in the mirror uploads folder and return
+    its name.
 
-    To get this file, see the :func:`psef.v1.files.get_file` function.
+    The file is linked into the mirror uploads folder if possible, so no data
+    is copied, see :func:`.blob_store.materialize`. To get this file, see the
+    :func:`psef.v1.files.get_file` function.
 
     :param file: The file object
-    :returns: The name of the newly created file (the copy).
+    :returns: The name of the newly created file (the link or copy).
     """
+    assert file.filename is not None
     path, name = files.random_file_path(True)
-    shutil.copyfile(file.get_diskname(), path)
+    blob_store.materialize(file.filename, path)
 
     return name
 
@@ -318,6 +359,7 @@ def delete_code(file_id: int) -> EmptyResponse:
     elif code.fileowner == models.FileOwner.both:
         code.fileowner = other
 
+    code.work.invalidate_file_tree()
     db.session.commit()
 
     return make_empty_response()
@@ -334,7 +376,9 @@ def split_code(
     ``old_owner`` and the newly created object will be given ``new_owner``. If
     ``code`` is a directory this directory is splitted (see
     :py:func:`redistribute_directory`), if it is a file the original content of
-    the file is only copied if ``copy`` is ``True``.
+    the file is only copied if ``copy`` is ``True``. Copying a file never
+    copies its contents on disk, it only creates a new reference to them in
+    the :mod:`.blob_store`.
 
     :param code: The file to split.
     :param new_owner: The new ``fileowner`` of the new file.
@@ -343,7 +387,7 @@ def split_code(
     """
     code.fileowner = old_owner
     old_id = code.id
-    old_diskname = None if code.is_directory else code.get_diskname()
+    old_filename = None if code.is_directory else code.filename
     db.session.flush()
     code = t.cast(models.File, db.session.query(models.File).get(code.id))
     assert code is not None
@@ -356,9 +400,8 @@ def split_code(
 
     code.fileowner = new_owner
     if not code.is_directory:
-        assert old_diskname is not None
-        _, code.filename = files.random_file_path()
-        shutil.copyfile(old_diskname, code.get_diskname())
+        assert old_filename is not None
+        code.filename = blob_store.link(old_filename)
     else:
         redistribute_directory(
             code, t.cast(models.File, models.File.query.get(old_id))
@@ -455,6 +498,8 @@ def update_code(file_id: int) -> JSONResponse[models.File]:
             app.max_file_size, single_file=True
         )
 
+    old_filenames: t.List[str] = []
+
     def _update_file(
         code: models.File,
         other: models.FileOwner,
@@ -464,8 +509,11 @@ def update_code(file_id: int) -> JSONResponse[models.File]:
             db.session.flush()
             code.parent = new_parent
         else:
-            with open(code.get_diskname(), 'wb') as f:
-                f.write(request.get_data())
+            # Files share their contents on disk, so never overwrite the
+            # contents in place.
+            assert code.filename is not None
+            old_filenames.append(code.filename)
+            code.set_contents(blob_store.store_bytes(request.get_data()))
 
     if code.work.assignment.is_open and current_user.id == code.work.user_id:
         current, other = models.FileOwner.both, models.FileOwner.teacher
@@ -496,6 +544,9 @@ def update_code(file_id: int) -> JSONResponse[models.File]:
             code = split_code(code, current, other)
             _update_file(code, other)
 
+    code.work.invalidate_file_tree()
     db.session.commit()
+    for old_filename in old_filenames:
+        blob_store.release(old_filename)
 
     return jsonify(code)
@@ -1,11 +1,12 @@
 """
 This module defines all API routes with the main directory "files". These APIs
 serve to upload and download temporary files which are not stored explicitly in
-the database.
+the database, and to upload large files in multiple chunks.
 
 SPDX-License-Identifier: AGPL-3.0-only
 """
 import os
+import typing as t
 
 import werkzeug
 from flask import request, safe_join, send_from_directory
@@ -14,9 +15,13 @@ from werkzeug.datastructures import FileStorage
 
 import psef.auth as auth
 import psef.files
-from psef import app
+from psef import app, models, current_user
 from psef.auth import APICodes, APIException
-from psef.helpers import JSONResponse, jsonify, callback_after_this_request
+from psef.models import db
+from psef.helpers import (
+    JSONResponse, EmptyResponse, jsonify, ensure_json_dict,
+    ensure_keys_in_dict, make_empty_response, callback_after_this_request
+)
 
 from . import api
 
@@ -103,3 +108,173 @@ def get_file(
             APICodes.OBJECT_NOT_FOUND,
             404,
         )
+
+
+def _get_chunked_upload(
+    upload_id: str, lock: bool = False
+) -> models.ChunkedUpload:
+    query = models.ChunkedUpload.query.filter_by(
+        id=upload_id, user_id=current_user.id
+    )
+    if lock:
+        query = query.with_for_update()
+    upload = query.one_or_none()
+
+    if upload is None:
+        raise APIException(
+            'The requested upload was not found',
+            f'The upload "{upload_id}" does not exist or is not yours',
+            APICodes.OBJECT_ID_NOT_FOUND, 404
+        )
+    return upload
+
+
+@api.route('/files/chunked/', methods=['POST'])
+@auth.login_required
+def start_chunked_upload() -> JSONResponse[models.ChunkedUpload]:
+    """Start uploading a file in multiple chunks.
+
+    .. :quickref: File; Start a resumable upload.
+
+    Chunks can be added using
+    :http:put:`/api/v1/files/chunked/(upload_id)`. When all chunks are
+    uploaded the upload should be finalized, after which its id can be given
+    as ``chunked_upload`` query parameter instead of posting a file to routes
+    that need an uploaded file, for example
+    :http:post:`/api/v1/assignments/(int:assignment_id)/submission`.
+
+    :<json str filename: The name of the file that will be uploaded.
+    :returns: The created :class:`.models.ChunkedUpload` with return code 201.
+
+    :raises PermissionException: If there is no logged in user. (NOT_LOGGED_IN)
+    """
+    content = ensure_json_dict(request.get_json())
+    ensure_keys_in_dict(content, [('filename', str)])
+    filename = t.cast(str, content['filename'])
+
+    if not filename:
+        raise APIException(
+            'The filename may not be empty',
+            'The given filename was empty', APICodes.INVALID_PARAM, 400
+        )
+
+    upload = models.ChunkedUpload(filename=filename, user=current_user)
+    db.session.add(upload)
+    db.session.commit()
+
+    return jsonify(upload, status_code=201)
+
+
+@api.route('/files/chunked/<upload_id>', methods=['GET'])
+@auth.login_required
+def get_chunked_upload(upload_id: str) -> JSONResponse[models.ChunkedUpload]:
+    """Get the state of an upload, for example to know where to resume it.
+
+    .. :quickref: File; Get the state of a resumable upload.
+
+    :param str upload_id: The id of the upload.
+    :returns: The :class:`.models.ChunkedUpload`.
+
+    :raises APIException: If the upload does not exist or is not of the
+        current user. (OBJECT_ID_NOT_FOUND)
+    """
+    return jsonify(_get_chunked_upload(upload_id))
+
+
+@api.route('/files/chunked/<upload_id>', methods=['PUT'])
+@auth.login_required
+def append_chunked_upload(
+    upload_id: str
+) -> JSONResponse[models.ChunkedUpload]:
+    """Append a chunk to an upload.
+
+    .. :quickref: File; Add a chunk to a resumable upload.
+
+    The body of the request should be the raw data of the chunk. The data is
+    written directly to disk, and the size of the upload is checked while
+    doing so.
+
+    :query offset: The offset of the chunk in the file, this should be the
+        current size of the upload. If a request failed the upload can be
+        resumed by getting its current size.
+    :param str upload_id: The id of the upload.
+    :returns: The updated :class:`.models.ChunkedUpload`.
+
+    :raises APIException: If the offset is not the size of the upload.
+        (INVALID_PARAM)
+    :raises APIException: If the upload is already finalized. (INVALID_STATE)
+    :raises APIException: If the upload would become larger than the maximum
+        upload size. (REQUEST_TOO_LARGE)
+    """
+    try:
+        offset = int(request.args['offset'])
+    except (KeyError, ValueError):
+        raise APIException(
+            'A valid offset is required',
+            'The "offset" query parameter should be given as integer',
+            APICodes.INVALID_PARAM, 400
+        )
+
+    max_size = app.max_large_file_size
+    if (request.content_length or 0) + offset > max_size:
+        psef.helpers.raise_file_too_big_exception(max_size)
+
+    # Lock the upload so chunks cannot be appended concurrently.
+    upload = _get_chunked_upload(upload_id, lock=True)
+    upload.append(request.stream, offset, max_size)
+    db.session.commit()
+
+    return jsonify(upload)
+
+
+@api.route('/files/chunked/<upload_id>/finalize', methods=['POST'])
+@auth.login_required
+def finalize_chunked_upload(
+    upload_id: str
+) -> JSONResponse[models.ChunkedUpload]:
+    """Mark that all chunks of an upload are uploaded.
+
+    .. :quickref: File; Finalize a resumable upload.
+
+    :param str upload_id: The id of the upload.
+    :<json int size: The size of the entire file, if given the size of the
+        upload is checked. (OPTIONAL)
+    :returns: The finalized :class:`.models.ChunkedUpload`.
+
+    :raises APIException: If the upload is empty or its size is not equal to
+        the given size. (INVALID_STATE)
+    """
+    content = ensure_json_dict(request.get_json() or {})
+    size = content.get('size', None)
+    if not isinstance(size, (int, type(None))) or isinstance(size, bool):
+        raise APIException(
+            'The given size is not valid', '"size" should be an integer',
+            APICodes.INVALID_PARAM, 400
+        )
+
+    upload = _get_chunked_upload(upload_id, lock=True)
+    upload.finalize(size)
+    db.session.commit()
+
+    return jsonify(upload)
+
+
+@api.route('/files/chunked/<upload_id>', methods=['DELETE'])
+@auth.login_required
+def delete_chunked_upload(upload_id: str) -> EmptyResponse:
+    """Delete an upload and its uploaded chunks.
+
+    .. :quickref: File; Delete a resumable upload.
+
+    :param str upload_id: The id of the upload.
+    :returns: An empty response with return code 204.
+
+    :raises APIException: If the upload does not exist or is not of the
+        current user. (OBJECT_ID_NOT_FOUND)
+    """
+    upload = _get_chunked_upload(upload_id, lock=True)
+    db.session.delete(upload)
+    db.session.commit()
+    upload.delete_from_disk()
+
+    return make_empty_response()
@@ -6,13 +6,12 @@ functions are defined to get related objects and information.
 SPDX-License-Identifier: AGPL-3.0-only
 """
 
-import os
 import typing as t
 import numbers
-import zipfile
-import tempfile
+import itertools
 from collections import Counter, defaultdict
 
+import werkzeug
 import structlog
 from flask import request
 from sqlalchemy.orm import selectinload
@@ -22,7 +21,7 @@ import psef.files
 from psef import app, current_user
 
 from . import api
-from .. import auth, models, helpers, features
+from .. import auth, models, helpers, features, blob_store, zip_stream
 from ..errors import APICodes, APIException
 from ..models import DbColumn, FileOwner, db
 from ..helpers import (
@@ -108,28 +107,12 @@ def get_feedback(work: models.Work) -> t.Mapping[str, str]:
         which can be given to ``GET - /api/v1/files/<name>`` and
         ``output_name`` which is the resulting file should be named.
     """
-    comments, linter_comments = work.get_all_feedback()
-
     filename = f'{work.assignment.name}-{work.user.name}-feedback.txt'
 
     path, name = psef.files.random_file_path(True)
 
     with open(path, 'w') as f:
-        f.write(
-            'Assignment: {}\n'
-            'Grade: {}\n'
-            'General feedback:\n{}\n\n'
-            'Comments:\n'.format(
-                work.assignment.name, work.grade or '', work.comment or ''
-            )
-        )
-        for comment in comments:
-            f.write(f'{comment}\n')
-
-        if features.has_feature(features.Feature.LINTERS):
-            f.write('\nLinter comments:\n')
-            for lcomment in linter_comments:
-                f.write(f'{lcomment}\n')
+        f.write(work.get_feedback_text())
 
     return {'name': name, 'output_name': filename}
 
@@ -155,34 +138,81 @@ def get_zip(work: models.Work,
 
     path, name = psef.files.random_file_path(True)
 
-    with open(
-        path,
-        'w+b',
-    ) as f, tempfile.TemporaryDirectory(
-        suffix='dir',
-    ) as tmpdir, zipfile.ZipFile(
-        f,
-        'w',
-        compression=zipfile.ZIP_DEFLATED,
-    ) as zipf:
-        # Restore the files to tmpdir
-        tree_root = psef.files.restore_directory_structure(
-            work, tmpdir, exclude_owner
-        )
-
-        zipf.write(tmpdir, tree_root['name'])
-
-        for root, _dirs, files in os.walk(tmpdir):
-            for file in files:
-                path = os.path.join(root, file)
-                zipf.write(path, path[len(tmpdir):])
+    with open(path, 'wb') as f:
+        for chunk in zip_stream.stream_zip(
+            zip_stream.get_work_entries(work, exclude_owner),
+        ):
+            f.write(chunk)
 
     return {
         'name': name,
-        'output_name': f'{work.assignment.name}-{work.user.name}-archive.zip'
+        'output_name': _get_zip_output_name(work),
     }
 
 
+def _get_zip_output_name(work: models.Work) -> str:
+    return f'{work.assignment.name}-{work.user.name}-archive.zip'
+
+
+@api.route('/submissions/<int:submission_id>/zip', methods=['GET'])
+@auth.login_required
+def stream_submission_zip(submission_id: int) -> werkzeug.wrappers.Response:
+    """Download a submission (:class:`.models.Work`) as a zip archive.
+
+    .. :quickref: Submission; Download the files of a submission as zip.
+
+    Unlike ``GET /submissions/<submission_id>?type=zip`` the archive is
+    directly streamed in the response, without writing it to disk first.
+
+    :param int submission_id: The id of the submission.
+    :returns: A streaming response with the zip archive as attachment.
+
+    :query str owner: The type of files to include, if set to `teacher` only
+        teacher files will be included, otherwise only student files will be
+        included.
+    :query str compression: The compression to use for the files in the
+        archive, either ``deflate`` (the default) or ``store``. Files that are
+        already compressed are always stored.
+
+    :raises APIException: If the submission with given id does not exist.
+        (OBJECT_ID_NOT_FOUND)
+    :raises APIException: If the given compression is not valid.
+        (INVALID_PARAM)
+    :raises PermissionException: If there is no logged in user. (NOT_LOGGED_IN)
+    :raises PermissionException: If the submission does not belong to the
+        current user and the user can not view files in the attached course.
+        (INCORRECT_PERMISSION)
+    """
+    work = helpers.get_or_404(models.Work, submission_id)
+
+    if not work.has_as_author(current_user):
+        auth.ensure_permission(
+            CPerm.can_see_others_work, work.assignment.course_id
+        )
+
+    exclude_owner = models.File.get_exclude_owner(
+        request.args.get('owner'),
+        work.assignment.course_id,
+    )
+    auth.ensure_can_view_files(work, exclude_owner == FileOwner.student)
+
+    compression = zip_stream.get_compression(
+        request.args.get('compression', 'deflate')
+    )
+
+    # Make sure the submission exists before we start streaming.
+    entries = zip_stream.get_work_entries(work, exclude_owner)
+    first_entry = next(entries)
+
+    return zip_stream.make_response(
+        zip_stream.stream_zip(
+            itertools.chain([first_entry], entries),
+            compression=compression,
+        ),
+        _get_zip_output_name(work),
+    )
+
+
 @api.route('/submissions/<int:submission_id>', methods=['DELETE'])
 def delete_submission(submission_id: int) -> EmptyResponse:
     """Delete a submission and all its files.
@@ -665,23 +695,28 @@ def create_new_file(submission_id: int) -> JSONResponse[t.Mapping[str, t.Any]]:
         models.File,
         models.File.work_id == submission_id,
         models.File.fileowner != exclude_owner,
-        models.File.name == patharr[0],
+        models.File.path == patharr[0],
         t.cast(DbColumn[int], models.File.parent_id).is_(None),
     )
 
-    code = None
-    end_idx = 0
-    for idx, part in enumerate(patharr[1:]):
-        code = models.File.query.filter(
+    # Find the longest existing prefix of the given path with a single query.
+    existing = {
+        f.path: f
+        for f in models.File.query.filter(
+            models.File.work_id == submission_id,
             models.File.fileowner != exclude_owner,
-            models.File.name == part,
-            models.File.parent == parent,
-        ).first()
-        end_idx = idx + 1
+            t.cast(DbColumn[str], models.File.path).in_(
+                ['/'.join(patharr[:idx + 1]) for idx in range(1, len(patharr))]
+            ),
+        )
+    }
+    code = None
+    end_idx = 1
+    while end_idx < len(patharr):
+        code = existing.get('/'.join(patharr[:end_idx + 1]))
         if code is None:
             break
         parent = code
-    else:
         end_idx += 1
 
     def _is_last(idx: int) -> bool:
@@ -695,7 +730,6 @@ def create_new_file(submission_id: int) -> JSONResponse[t.Mapping[str, t.Any]]:
             400,
         )
 
-    filename: t.Optional[str]
     parts = patharr[end_idx:]
 
     if set(parts) & psef.files.SPECIAL_FILENAMES:
@@ -709,23 +743,21 @@ def create_new_file(submission_id: int) -> JSONResponse[t.Mapping[str, t.Any]]:
         )
 
     for idx, part in enumerate(parts):
-        if _is_last(idx) and not create_dir:
-            is_dir = False
-            d_filename, filename = psef.files.random_file_path()
-            with open(d_filename, 'wb') as f:
-                f.write(request.get_data(as_text=False))
-        else:
-            is_dir, filename = True, None
+        is_dir = not _is_last(idx) or create_dir
         code = models.File(
             work_id=submission_id,
             name=part,
-            filename=filename,
             is_directory=is_dir,
             parent=parent,
             fileowner=new_owner,
         )
+        if not is_dir:
+            code.set_contents(
+                blob_store.store_bytes(request.get_data(as_text=False))
+            )
         db.session.add(code)
         parent = code
+    work.invalidate_file_tree()
     db.session.commit()
 
     assert code is not None
@@ -808,4 +840,7 @@ def get_dir_contents(
             APICodes.OBJECT_WRONG_TYPE, 400
         )
 
-    return jsonify(file.list_contents(exclude_owner))
+    tree = file.list_contents(exclude_owner)
+    # Persist the file tree cache if it was created.
+    db.session.commit()
+    return jsonify(tree)
@@ -0,0 +1,296 @@
+"""
+This module implements the creation of zip archives as a stream of chunks.
+
+The archive is never written to disk: the files are read directly from the
+upload directory and the compressed data is yielded as soon as it is
+available, so the memory needed to create an archive does not depend on the
+size of the submissions in it.
+
+SPDX-License-Identifier: AGPL-3.0-only
+"""
+import os
+import time
+import typing as t
+import zipfile
+import unicodedata
+
+import werkzeug
+from flask import Response, stream_with_context
+from werkzeug.urls import url_quote
+
+from . import models, helpers, blob_store
+from .exceptions import APICodes, APIException
+
+_CHUNK_SIZE = 2 ** 16
+
+#: Files with these extensions are already compressed, so they are always
+#: stored in the archive without compressing them again.
+STORE_ONLY_EXTENSIONS = frozenset(
+    [
+        '.7z',
+        '.bz2',
+        '.docx',
+        '.gif',
+        '.gz',
+        '.jar',
+        '.jpeg',
+        '.jpg',
+        '.mp3',
+        '.mp4',
+        '.pdf',
+        '.png',
+        '.pptx',
+        '.tgz',
+        '.xlsx',
+        '.xz',
+        '.zip',
+    ]
+)
+
+
+_COMPRESSIONS = {
+    'deflate': zipfile.ZIP_DEFLATED,
+    'store': zipfile.ZIP_STORED,
+}
+
+
+def get_compression(name: str) -> int:
+    """Get the zip compression method with the given name.
+
+    :param name: The name of the compression, either ``deflate`` or
+        ``store``.
+    :returns: The compression method that can be passed to
+        :func:`stream_zip`.
+
+    :raises APIException: If the given compression does not exist.
+        (INVALID_PARAM)
+    """
+    try:
+        return _COMPRESSIONS[name]
+    except KeyError:
+        raise APIException(
+            'The given compression is not valid',
+            f'The compression "{name}" is not one of: '
+            f'{", ".join(_COMPRESSIONS)}',
+            APICodes.INVALID_PARAM,
+            400,
+        )
+
+
+class ZipEntry(t.NamedTuple):
+    """A single entry in a streamed zip archive.
+
+    :ivar name: The name of the entry in the archive, the name of a directory
+        should end with a ``/``.
+    :ivar filename: The name of the file in the :mod:`.blob_store` which
+        contains the contents of this entry.
+    :ivar data: The contents of this entry, used when ``filename`` is
+        ``None``. If both are ``None`` this entry is a directory.
+    """
+    name: str
+    filename: t.Optional[str] = None
+    data: t.Optional[bytes] = None
+
+    @property
+    def is_directory(self) -> bool:
+        """Is this entry a directory.
+        """
+        return self.filename is None and self.data is None
+
+
+class _StreamBuffer:
+    """A write only, non seekable, file like object that keeps the data
+    written to it until it is drained.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: t.List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        """Get and remove all data written to this buffer.
+        """
+        res = b''.join(self._chunks)
+        self._chunks = []
+        return res
+
+
+def _get_compression(name: str, compression: int) -> int:
+    if os.path.splitext(name)[1].lower() in STORE_ONLY_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return compression
+
+
+def stream_zip(
+    entries: t.Iterable[ZipEntry],
+    compression: int = zipfile.ZIP_DEFLATED,
+) -> t.Iterator[bytes]:
+    """Create a zip archive with the given entries as a stream of chunks.
+
+    :param entries: The entries to put in the archive, they are only iterated
+        once and only when the archive is consumed.
+    :param compression: The compression to use for the files in the archive,
+        this should be ``zipfile.ZIP_DEFLATED`` or ``zipfile.ZIP_STORED``.
+        Files that are already compressed are never compressed again.
+    :returns: An iterator producing the archive in chunks.
+    """
+    buf = _StreamBuffer()
+    with zipfile.ZipFile(
+        t.cast(t.IO[bytes], buf),
+        'w',
+        compression=compression,
+        allowZip64=True,
+    ) as zipf:
+        for entry in entries:
+            if entry.is_directory:
+                info = zipfile.ZipInfo(entry.name.rstrip('/') + '/')
+                info.external_attr = 0o40775 << 16 | 0x10
+                zipf.writestr(info, b'')
+            elif entry.filename is None:
+                assert entry.data is not None
+                info = zipfile.ZipInfo(
+                    entry.name,
+                    date_time=time.localtime()[:6],
+                )
+                info.external_attr = 0o644 << 16
+                info.compress_type = _get_compression(entry.name, compression)
+                zipf.writestr(info, entry.data)
+            else:
+                path = blob_store.get_path(entry.filename)
+                info = zipfile.ZipInfo.from_file(path, entry.name)
+                info.external_attr = 0o644 << 16
+                info.compress_type = _get_compression(entry.name, compression)
+                with open(path, 'rb') as src, zipf.open(info, 'w') as dst:
+                    for chunk in iter(lambda: src.read(_CHUNK_SIZE), b''):
+                        dst.write(chunk)
+                        data = buf.drain()
+                        if data:
+                            yield data
+
+            data = buf.drain()
+            if data:
+                yield data
+
+    yield buf.drain()
+
+
+def get_work_entries(
+    work: models.Work,
+    exclude_owner: models.FileOwner,
+    prefix: str = '',
+) -> t.Iterator[ZipEntry]:
+    """Get the entries for all the files of the given submission.
+
+    The top level directory of the submission is always included, other
+    directories are only included when they are empty as the path of their
+    children already implies their existence.
+
+    :param work: The submission to get the entries for.
+    :param exclude_owner: The owner of the files that should be excluded.
+    :param prefix: The path inside the archive in which the submission should
+        be placed.
+    :returns: An iterator producing the entries of the submission.
+    """
+    root = helpers.filter_single_or_404(
+        models.File,
+        models.File.work_id == work.id,
+        t.cast(models.DbColumn[int], models.File.parent_id).is_(None),
+        models.File.fileowner != exclude_owner,
+    )
+    cache = work.get_file_children_mapping(exclude_owner)
+
+    def __get_entries(
+        f: models.File,
+        parent: str,
+        is_root: bool = False,
+    ) -> t.Iterator[ZipEntry]:
+        name = f'{parent}{f.name}'
+        if f.is_directory:
+            children = cache[f.id]
+            if is_root or not children:
+                yield ZipEntry(name=f'{name}/')
+            for child in children:
+                yield from __get_entries(child, f'{name}/')
+        else:
+            yield ZipEntry(name=name, filename=f.filename)
+
+    yield from __get_entries(root, prefix, True)
+
+
+def get_submission_dir_name(work: models.Work) -> str:
+    """Get the name of the directory of the given submission in an archive
+    with multiple submissions.
+
+    :param work: The submission to get the directory name for.
+    :returns: A name that is unique within the assignment of the submission.
+    """
+    return f'{work.user.name.replace("/", "_")} - {work.id}'
+
+
+def get_assignment_entries(
+    submissions: t.Iterable[models.Work],
+    exclude_owner: models.FileOwner,
+    include_feedback: bool,
+    on_submission_done: t.Callable[[models.Work], None] = lambda _: None,
+) -> t.Iterator[ZipEntry]:
+    """Get the entries for all files of the given submissions.
+
+    Every submission is placed in its own directory, as given by
+    :func:`get_submission_dir_name`. Submissions are processed one at a time,
+    so the memory needed does not depend on the amount of submissions.
+
+    :param submissions: The submissions to get the entries for.
+    :param exclude_owner: The owner of the files that should be excluded.
+    :param include_feedback: Add a ``feedback.txt`` file with the feedback of
+        each submission, see :meth:`.models.Work.get_feedback_text`.
+    :param on_submission_done: Function called with each submission after all
+        its entries have been produced.
+    :returns: An iterator producing the entries of all submissions.
+    """
+    for work in submissions:
+        prefix = f'{get_submission_dir_name(work)}/'
+        yield from get_work_entries(work, exclude_owner, prefix)
+        if include_feedback:
+            yield ZipEntry(
+                name=f'{prefix}feedback.txt',
+                data=work.get_feedback_text().encode('utf-8'),
+            )
+        on_submission_done(work)
+
+
+def make_response(
+    chunks: t.Iterable[bytes],
+    output_name: str,
+) -> werkzeug.wrappers.Response:
+    """Create a response that streams the given zip archive as an attachment.
+
+    :param chunks: The archive, probably as produced by :func:`stream_zip`.
+    :param output_name: The name the user should see for the downloaded file.
+    :returns: A streaming response with the archive.
+    """
+    try:
+        output_name.encode('latin-1')
+    except UnicodeEncodeError:
+        filenames = {
+            'filename':
+                unicodedata.normalize('NFKD', output_name).encode(
+                    'latin-1', 'ignore'
+                ).decode('latin-1'),
+            'filename*': f"UTF-8''{url_quote(output_name)}",
+        }
+    else:
+        filenames = {'filename': output_name}
+
+    res = Response(
+        stream_with_context(chunks),
+        mimetype='application/zip',
+        direct_passthrough=True,
+    )
+    res.headers.add('Content-Disposition', 'attachment', **filenames)
+    return res
@@ -5,7 +5,9 @@ import copy
 import json
 import uuid
 import random
+import hashlib
 import tarfile
+import zipfile
 import datetime
 import tempfile
 import dataclasses
@@ -2027,6 +2029,49 @@ def test_upload_blackboard_zip(
     ).all(), 'Nobody should be done'
 
 
+def test_upload_blackboard_zip_workers(
+    test_client, logged_in, assignment, teacher_user, app, monkeypatch,
+    stubmailer
+):
+    filename = (
+        f'{os.path.dirname(__file__)}/'
+        f'../test_data/test_blackboard/correct.tar.gz'
+    )
+
+    def strip_ids(tree):
+        if 'entries' not in tree:
+            return tree['name']
+        return (tree['name'], sorted(map(strip_ids, tree['entries']), key=str))
+
+    def upload():
+        test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submissions/',
+            204,
+            real_data={'file': (filename, 'bb.tar.gz')},
+        )
+        subs = test_client.req(
+            'get', f'/api/v1/assignments/{assignment.id}/submissions/', 200
+        )
+        return {
+            sub['user']['username']: strip_ids(
+                test_client.req(
+                    'get', f'/api/v1/submissions/{sub["id"]}/files/', 200
+                )
+            )
+            for sub in subs
+        }
+
+    with logged_in(teacher_user):
+        monkeypatch.setitem(app.config, 'BLACKBOARD_ZIP_WORKERS', 1)
+        serial = upload()
+        monkeypatch.setitem(app.config, 'BLACKBOARD_ZIP_WORKERS', 4)
+        parallel = upload()
+
+    assert serial
+    assert serial == parallel
+
+
 @pytest.mark.parametrize('with_works', [False], indirect=True)
 def test_assigning_after_uploading(
     test_client, logged_in, assignment, error_template, teacher_user
@@ -4327,6 +4372,292 @@ def test_setting_cgignore(
         )
 
 
+def test_cgignore_parse_cache(assignment, session):
+    assignment.cgignore = psef.ignore.IgnoreFilterManager(['*.py'])
+    session.commit()
+
+    first = assignment.cgignore
+    assert first is assignment.cgignore
+    assert first.export() == '*.py'
+
+    assignment.cgignore = psef.ignore.IgnoreFilterManager(['*.java'])
+    session.commit()
+    assert assignment.cgignore is not first
+    assert assignment.cgignore.export() == '*.java'
+
+
+def test_async_upload(
+    test_client, logged_in, assignment, teacher_user, error_template,
+    student_user, monkeypatch_celery
+):
+    def upload(handle_ignore):
+        return test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submission',
+            202,
+            query={'async': 'true', 'ignored_files': handle_ignore},
+            real_data={
+                'file':
+                    (
+                        get_submission_archive('multiple_file_archive.zip'),
+                        'test.zip',
+                    )
+            },
+            result={
+                'id': str,
+                'state': 'starting',
+                'work_id': None,
+                'error': None,
+                'created_at': str,
+                'assignment_id': assignment.id,
+            },
+        )
+
+    with logged_in(teacher_user):
+        test_client.req(
+            'patch',
+            f'/api/v1/assignments/{assignment.id}',
+            200,
+            data={'ignore': '*'},
+        )
+
+        up = upload('error')
+        up = test_client.req(
+            'get',
+            f'/api/v1/assignments/{assignment.id}/uploads/{up["id"]}',
+            200,
+            result={
+                'id': up['id'],
+                'state': 'failed',
+                'work_id': None,
+                'error': {
+                    'code': 'INVALID_FILE_IN_ARCHIVE',
+                    'message': str,
+                    'description': str,
+                    'invalid_files': list,
+                    '__allow_extra__': True,
+                },
+                'created_at': up['created_at'],
+                'assignment_id': assignment.id,
+            },
+        )
+        assert up['error']['invalid_files']
+
+        up = upload('keep')
+        up = test_client.req(
+            'get',
+            f'/api/v1/assignments/{assignment.id}/uploads/{up["id"]}',
+            200,
+            result={
+                'id': up['id'],
+                'state': 'done',
+                'work_id': int,
+                'error': None,
+                'created_at': up['created_at'],
+                'assignment_id': assignment.id,
+            },
+        )
+        work = m.Work.query.get(up['work_id'])
+        assert work.user == teacher_user
+        assert work.created_at.isoformat() == up['created_at']
+
+    with logged_in(student_user):
+        test_client.req(
+            'get',
+            f'/api/v1/assignments/{assignment.id}/uploads/{up["id"]}',
+            404,
+            result=error_template,
+        )
+
+
+def test_chunked_upload(
+    test_client, logged_in, assignment, teacher_user, error_template,
+    student_user
+):
+    with open(get_submission_archive('multiple_file_archive.zip'), 'rb') as f:
+        data = f.read()
+    half = len(data) // 2
+
+    with logged_in(teacher_user):
+        upload = test_client.req(
+            'post',
+            '/api/v1/files/chunked/',
+            201,
+            data={'filename': 'test.zip'},
+            result={
+                'id': str,
+                'filename': 'test.zip',
+                'size': 0,
+                'finalized': False,
+                'created_at': str,
+            },
+        )
+        url = f'/api/v1/files/chunked/{upload["id"]}'
+
+        test_client.req(
+            'put', url, 200, query={'offset': 0}, real_data=data[:half]
+        )
+        # A chunk that does not start at the end of the upload is rejected,
+        # and the current size is returned so the upload can be resumed.
+        res = test_client.req(
+            'put',
+            url,
+            400,
+            query={'offset': 0},
+            real_data=data[half:],
+            result=error_template,
+        )
+        assert res['size'] == half
+        test_client.req(
+            'put', url, 200, query={'offset': half}, real_data=data[half:]
+        )
+
+        test_client.req(
+            'post',
+            f'{url}/finalize',
+            400,
+            data={'size': len(data) + 1},
+            result=error_template,
+        )
+        test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submission',
+            400,
+            query={'chunked_upload': upload['id']},
+            result=error_template,
+        )
+        test_client.req(
+            'post',
+            f'{url}/finalize',
+            200,
+            data={'size': len(data)},
+            result={
+                'id': upload['id'],
+                'filename': 'test.zip',
+                'size': len(data),
+                'finalized': True,
+                'created_at': str,
+            },
+        )
+        test_client.req(
+            'put',
+            url,
+            400,
+            query={'offset': len(data)},
+            real_data=b'a',
+            result=error_template,
+        )
+
+    with logged_in(student_user):
+        test_client.req('get', url, 404, result=error_template)
+
+    with logged_in(teacher_user):
+        work = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submission',
+            201,
+            query={'chunked_upload': upload['id']},
+        )
+        res = test_client.req(
+            'get',
+            f'/api/v1/submissions/{work["id"]}/files/',
+            200,
+        )
+        assert res['name'] == 'test.zip'
+
+        # The upload is deleted after it has been used.
+        test_client.req('get', url, 404, result=error_template)
+
+
+def test_delta_upload(
+    test_client, logged_in, assignment, teacher_user, error_template
+):
+    def get_manifest(files):
+        return [
+            {
+                'path': path,
+                'hash': hashlib.sha256(data).hexdigest(),
+                'size': len(data),
+            } for path, data in files.items()
+        ]
+
+    def upload(files, send):
+        manifest = get_manifest(files)
+        data = {'manifest': json.dumps(manifest)}
+        for entry in manifest:
+            if entry['path'] in send:
+                data[entry['hash']] = (
+                    io.BytesIO(files[entry['path']]), entry['path']
+                )
+        return test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submission/delta',
+            201,
+            real_data=data,
+        )
+
+    def get_contents(work):
+        res = test_client.req(
+            'get', f'/api/v1/submissions/{work["id"]}/files/', 200
+        )
+        return {
+            f['name']: test_client.get(f'/api/v1/code/{f["id"]}').get_data()
+            for f in res['entries']
+        }
+
+    first = {'a.py': b'print("a")\n', 'b.py': b'print("b")\n'}
+    second = {**first, 'b.py': b'print("b2")\n'}
+
+    with logged_in(teacher_user):
+        res = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submission/manifest',
+            200,
+            data={'files': get_manifest(first)},
+        )
+        assert res['known'] == []
+        assert len(res['missing']) == 2
+
+        work = upload(first, send={'a.py', 'b.py'})
+        assert get_contents(work) == first
+
+        res = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submission/manifest',
+            200,
+            data={'files': get_manifest(second)},
+        )
+        assert res['known'] == [hashlib.sha256(first['a.py']).hexdigest()]
+        assert res['missing'] == [hashlib.sha256(second['b.py']).hexdigest()]
+
+        # Not sending a file that is not known results in an error with the
+        # missing hashes.
+        res = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submission/delta',
+            400,
+            real_data={'manifest': json.dumps(get_manifest(second))},
+            result=error_template,
+        )
+        assert res['missing'] == [hashlib.sha256(second['b.py']).hexdigest()]
+
+        # The contents of an uploaded file should match its hash.
+        manifest = get_manifest(second)
+        test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submission/delta',
+            400,
+            real_data={
+                'manifest': json.dumps(manifest),
+                manifest[1]['hash']: (io.BytesIO(b'wrong'), 'b.py'),
+            },
+            result=error_template,
+        )
+
+        work = upload(second, send={'b.py'})
+        assert get_contents(work) == second
+
+
 def test_upload_files_with_duplicate_filenames(
     test_client, logged_in, assignment, error_template, teacher_user
 ):
@@ -4373,7 +4704,7 @@ def test_upload_files_with_duplicate_filenames(
             }
         )
 
-        test_client.req(
+        tree = test_client.req(
             'get',
             f'/api/v1/submissions/{res["id"]}/files/',
             200,
@@ -4429,3 +4760,234 @@ def test_upload_files_with_duplicate_filenames(
                 'name': 'top',
             }
         )
+
+    def get_diskname(entry):
+        return m.File.query.get(entry['id']).get_diskname()
+
+    entries = tree['entries']
+    # Files with the same contents should share their contents on disk.
+    assert os.path.samefile(
+        get_diskname(entries[0]['entries'][0]),
+        get_diskname(entries[3]['entries'][0]),
+    )
+    assert os.path.samefile(
+        get_diskname(entries[2]),
+        get_diskname(entries[4]),
+    )
+    assert not os.path.samefile(
+        get_diskname(entries[0]['entries'][0]),
+        get_diskname(entries[4]),
+    )
+
+
+@pytest.mark.parametrize(
+    'filename', ['../test_submissions/multiple_dir_archive.zip'],
+    indirect=True
+)
+@pytest.mark.parametrize('feedback', [True, False])
+def test_export_submissions(
+    test_client, logged_in, assignment_real_works, error_template, ta_user,
+    student_user, feedback
+):
+    assignment, work = assignment_real_works
+    subs = assignment.get_all_latest_submissions().all()
+    assert len(subs) == 3
+
+    def get_expected(names):
+        res = set()
+        for sub in subs:
+            prefix = f'{sub.user.name} - {sub.id}/multiple_dir_archive.zip/'
+            res.add(prefix)
+            res.update(f'{prefix}{name}' for name in names)
+            if feedback:
+                res.add(f'{sub.user.name} - {sub.id}/feedback.txt')
+        return res
+
+    expected = get_expected(
+        [
+            'dir/single_file_work',
+            'dir/single_file_work_copy',
+            'dir2/single_file_work',
+            'dir2/single_file_work_copy',
+        ]
+    )
+
+    with logged_in(ta_user):
+        res = test_client.get(
+            f'/api/v1/assignments/{assignment.id}/submissions/export',
+            query_string={'owner': 'student', 'feedback': feedback},
+        )
+        assert res.status_code == 200
+        zfile = zipfile.ZipFile(io.BytesIO(res.get_data()))
+        assert set(f.filename for f in zfile.infolist()) == expected
+
+        export = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/exports/',
+            201,
+            data={'owner': 'student', 'feedback': feedback},
+            result={
+                'id': str,
+                'state': 'starting',
+                'submissions_done': 0,
+                'submissions_total': 3,
+                'name': None,
+                'output_name': f'{assignment.name}-submissions.zip',
+                'created_at': str,
+                'assignment_id': assignment.id,
+            }
+        )
+        export = test_client.req(
+            'get',
+            f'/api/v1/assignments/{assignment.id}/exports/{export["id"]}',
+            200,
+            result={
+                'id': export['id'],
+                'state': 'done',
+                'submissions_done': 3,
+                'submissions_total': 3,
+                'name': str,
+                'output_name': f'{assignment.name}-submissions.zip',
+                'created_at': str,
+                'assignment_id': assignment.id,
+            }
+        )
+        res = test_client.get(f'/api/v1/files/{export["name"]}')
+        assert res.status_code == 200
+        zfile = zipfile.ZipFile(io.BytesIO(res.get_data()))
+        assert set(f.filename for f in zfile.infolist()) == expected
+
+    with logged_in(student_user):
+        test_client.req(
+            'get',
+            f'/api/v1/assignments/{assignment.id}/submissions/export',
+            403,
+            result=error_template,
+        )
+        test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/exports/',
+            403,
+            data={},
+            result=error_template,
+        )
+        test_client.req(
+            'get',
+            f'/api/v1/assignments/{assignment.id}/exports/{export["id"]}',
+            404,
+            result=error_template,
+        )
+
+
+def test_upload_inserts_file_tree(
+    test_client, logged_in, assignment, teacher_user
+):
+    with logged_in(teacher_user):
+        res = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submission',
+            201,
+            real_data={
+                'file':
+                    (
+                        get_submission_archive('nested_dir_archive.tar.gz'),
+                        'nested.tar.gz',
+                    ),
+                'other': (io.BytesIO(b'a file'), 'a_file.txt'),
+            },
+        )
+
+    files = m.File.query.filter_by(work_id=res['id']).all()
+    by_id = {f.id: f for f in files}
+    tops = [f for f in files if f.parent_id is None]
+    assert len(tops) == 1
+    assert tops[0].is_directory
+    assert sum(not f.is_directory for f in files) > 1
+    for f in files:
+        assert f.is_directory == (f.filename is None)
+        if f.parent_id is not None:
+            parent = by_id[f.parent_id]
+            assert parent.is_directory
+            assert f.path == f'{parent.path}/{f.name}'
+
+
+def test_upload_inserts_large_file_tree(
+    test_client, logged_in, assignment, teacher_user
+):
+    # Enough files for multiple insert chunks, in nested directories.
+    expected = {f'root_{i}.txt' for i in range(50)}
+    for i in range(5):
+        for j in range(6):
+            for k in range(15):
+                expected.add(f'dir_{i}/sub_{j}/file_{k}.txt')
+            expected.add(f'dir_{i}/sub_{j}/deeper/last.txt')
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as zfile:
+        for path in sorted(expected):
+            zfile.writestr(path, path)
+    data.seek(0)
+
+    with logged_in(teacher_user):
+        res = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submission',
+            201,
+            real_data={'file': (data, 'large.zip')},
+        )
+
+    files = m.File.query.filter_by(work_id=res['id']).all()
+    by_id = {f.id: f for f in files}
+    tops = [f for f in files if f.parent_id is None]
+    assert len(tops) == 1
+    root = tops[0]
+    assert root.is_directory
+    assert root.path == root.name
+
+    found = set()
+    for f in files:
+        assert f.is_directory == (f.filename is None)
+        if f.parent_id is None:
+            continue
+        parent = by_id[f.parent_id]
+        assert parent.is_directory
+        assert f.path == f'{parent.path}/{f.name}'
+        if not f.is_directory:
+            rel_path = f.path[len(root.path) + 1:]
+            found.add(rel_path)
+            with open(f.get_diskname(), 'rb') as disk_file:
+                assert disk_file.read() == rel_path.encode()
+
+    assert found == expected
+    assert len(expected) > 500
+    assert sum(f.is_directory for f in files) == 1 + 5 + 5 * 6 * 2
+
+
+def test_upload_stores_file_sizes(
+    test_client, logged_in, assignment, teacher_user
+):
+    with logged_in(teacher_user):
+        res = test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/submission',
+            201,
+            real_data={
+                'file':
+                    (
+                        get_submission_archive('multiple_file_archive.zip'),
+                        'files.zip',
+                    ),
+                'empty': (io.BytesIO(b''), 'empty.txt'),
+            },
+        )
+
+    work = m.Work.query.get(res['id'])
+    files = m.File.query.filter_by(work_id=work.id, is_directory=False).all()
+    assert files
+    for f in files:
+        with open(f.get_diskname(), 'rb') as disk_file:
+            content = disk_file.read()
+        assert f.size == len(content)
+        assert f.digest == hashlib.sha256(content).hexdigest()
+    assert any(f.size == 0 for f in files)
+    assert work.total_file_size == sum(f.size for f in files)
+    assert work.file_count == len(files)
@@ -0,0 +1,90 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+import io
+import os
+import uuid
+
+import pytest
+
+import manage
+import psef.blob_store as b
+
+
+def get_blob_path(digest):
+    return os.path.join(b.get_blob_dir(), digest[:2], digest)
+
+
+@pytest.mark.parametrize('method', ['bytes', 'stream', 'file'])
+def test_store_deduplicates(app, method, tmpdir):
+    data = f'Unique content {uuid.uuid4()}'.encode()
+
+    def store():
+        if method == 'bytes':
+            return b.store_bytes(data)
+        elif method == 'stream':
+            return b.store_stream(io.BytesIO(data))
+        path = os.path.join(str(tmpdir), str(uuid.uuid4()))
+        with open(path, 'wb') as f:
+            f.write(data)
+        res = b.store_file(path)
+        assert not os.path.exists(path)
+        return res
+
+    first = store()
+    second = store()
+
+    assert first.digest == second.digest == b.hash_file(
+        b.get_path(first.filename)
+    )
+    assert first.size == second.size == len(data)
+    assert first.filename != second.filename
+
+    # Both references share the same blob on disk.
+    blob_path = get_blob_path(first.digest)
+    for stored in [first, second]:
+        path = b.get_path(stored.filename)
+        assert os.path.samefile(path, blob_path)
+        with open(path, 'rb') as f:
+            assert f.read() == data
+    assert os.stat(blob_path).st_nlink == 3
+
+    b.release(first.filename)
+    b.release(second.filename)
+    b.collect_garbage()
+    assert not os.path.exists(blob_path)
+
+
+def test_blob_kept_while_referenced(app, capsys):
+    data = f'Unique content {uuid.uuid4()}'.encode()
+    stored = b.store_bytes(data)
+    linked = b.link(stored.filename)
+    blob_path = get_blob_path(stored.digest)
+
+    assert linked != stored.filename
+    assert b.get_digest(linked) == stored.digest
+    assert os.stat(blob_path).st_nlink == 3
+
+    b.release(stored.filename)
+    assert not os.path.exists(b.get_path(stored.filename))
+    manage.collect_blobs()
+    assert 'unreferenced blobs' in capsys.readouterr().out
+
+    # The blob should survive as long as any reference to it exists.
+    assert os.path.isfile(blob_path)
+    with open(b.get_path(linked), 'rb') as f:
+        assert f.read() == data
+
+    # A new reference to content that is still stored should use the same
+    # blob.
+    again = b.store_bytes(data)
+    assert os.path.samefile(b.get_path(again.filename), blob_path)
+
+    b.release(linked)
+    manage.collect_blobs()
+    assert os.path.isfile(blob_path)
+
+    b.release(again.filename)
+    manage.collect_blobs()
+    out = capsys.readouterr().out
+    assert not os.path.exists(blob_path)
+    assert out.splitlines()[-1].startswith('Removed ')
+    assert out.splitlines()[-1] != 'Removed 0 unreferenced blobs'
@@ -146,6 +146,43 @@ def test_get_code_plaintext(
                 res.get_data()
 
 
+@pytest.mark.parametrize('filename', ['test_flake8.tar.gz'], indirect=True)
+def test_get_code_conditional_and_range(
+    assignment_real_works, test_client, ta_user, logged_in
+):
+    assignment, work = assignment_real_works
+    content = 'def a(b):\n\tprint ( 5 )\n'
+
+    with logged_in(ta_user):
+        res = test_client.req(
+            'get',
+            f'/api/v1/submissions/{work["id"]}/files/',
+            200,
+        )
+        url = f'/api/v1/code/{res["entries"][0]["id"]}'
+
+        res = test_client.get(url)
+        assert res.status_code == 200
+        assert res.get_data(as_text=True) == content
+        assert res.headers['Accept-Ranges'] == 'bytes'
+        etag, weak = res.get_etag()
+        assert etag
+        assert not weak
+
+        res = test_client.get(url, headers={'If-None-Match': f'"{etag}"'})
+        assert res.status_code == 304
+        assert res.get_data() == b''
+
+        res = test_client.get(url, headers={'If-None-Match': '"other"'})
+        assert res.status_code == 200
+        assert res.get_data(as_text=True) == content
+
+        res = test_client.get(url, headers={'Range': 'bytes=4-8'})
+        assert res.status_code == 206
+        assert res.get_data(as_text=True) == content[4:9]
+        assert res.headers['Content-Range'] == f'bytes 4-8/{len(content)}'
+
+
 @pytest.mark.parametrize(
     'filename', ['../test_submissions/single_dir_archive.zip']
 )
@@ -861,6 +898,26 @@ def test_rename_code(
         assert files['entries'][0]['name'] == 'dir2'
         assert len(files['entries'][1]['entries']) == 2
         assert files['entries'][1]['entries'][0]['id'] == code_id
+        # The paths of the children of a renamed directory should be updated
+        assert test_client.req(
+            'get',
+            f'/api/v1/submissions/{work_id}/files/',
+            200,
+            query={
+                'path': f'/multiple_dir_archive{extension}/dir3/NEW_NAME',
+                'owner': 'auto',
+            },
+        )['id'] == code_id
+        test_client.req(
+            'get',
+            f'/api/v1/submissions/{work_id}/files/',
+            404,
+            query={
+                'path': f'/multiple_dir_archive{extension}/dir/NEW_NAME',
+                'owner': 'auto',
+            },
+            result=error_template,
+        )
 
         added_file = adjust_code(
             create_file(f'/multiple_dir_archive{extension}/dir3/sub_dir/file'),
@@ -1,6 +1,10 @@
 # SPDX-License-Identifier: AGPL-3.0-only
+import os
+
 import pytest
 
+import psef
+import psef.models as m
 from helpers import create_marker
 
 perm_error = create_marker(pytest.mark.perm_error)
@@ -79,3 +83,125 @@ def test_get_code_with_head(student_user, test_client, request, logged_in):
 
         res = test_client.get(f'/api/v1/files/{fname}')
         assert res.status_code == 404
+
+
+def test_extract_tree_totals(tmpdir):
+    base_dir = os.path.realpath(str(tmpdir))
+
+    def make_file(name, size):
+        with open(os.path.join(base_dir, name), 'w') as f:
+            f.write('a' * size)
+        return psef.files.ExtractFileTreeFile(
+            name=name, parent=None, disk_name=name, size=size, digest=None
+        )
+
+    def make_dir(name):
+        return psef.files.ExtractFileTreeDirectory(
+            name=name, values=[], parent=None
+        )
+
+    tree = psef.files.ExtractFileTree(name='top', values=[], parent=None)
+    sub = make_dir('sub')
+    tree.add_child(sub)
+    tree.add_child(make_file('a', 1))
+
+    to_delete = make_dir('to_delete')
+    for i in range(5):
+        to_delete.add_child(make_file(f'del_{i}', 10))
+    nested = make_dir('nested')
+    nested.add_child(make_file('nested_file', 100))
+    to_delete.add_child(nested)
+    assert to_delete.get_size() == 150
+    assert to_delete.get_file_count() == 6
+
+    sub.add_child(to_delete)
+    sub.add_child(make_file('b', 1000))
+    assert sub.get_size() == 1150
+    assert sub.get_file_count() == 7
+    assert tree.get_size() == 1151
+    assert tree.get_file_count() == 8
+
+    # Forgetting a child updates all parents, but does not delete the file.
+    b = sub.values[-1]
+    sub.forget_child(b)
+    assert b.parent is None
+    assert os.path.isfile(os.path.join(base_dir, 'b'))
+    assert sub.get_size() == 150
+    assert sub.get_file_count() == 6
+    assert tree.get_size() == 151
+    assert tree.get_file_count() == 7
+
+    # All children of a directory should be deleted, not only some of them.
+    to_delete.delete(base_dir)
+    assert to_delete.parent is None
+    assert to_delete.values == []
+    assert nested.values == []
+    assert to_delete.get_size() == 0
+    assert to_delete.get_file_count() == 0
+    assert sub.values == []
+    assert sub.get_size() == 0
+    assert sub.get_file_count() == 0
+    assert tree.get_size() == 1
+    assert tree.get_file_count() == 1
+    assert sorted(os.listdir(base_dir)) == ['a', 'b']
+
+    tree.add_child(b)
+    assert tree.get_size() == 1001
+    assert tree.get_file_count() == 2
+
+
+def test_create_virtual_course_with_single_file(session):
+    tree = psef.files.ExtractFileTree(name='archive', values=[], parent=None)
+    tree.add_child(
+        psef.files.ExtractFileTreeFile(
+            name='single.py',
+            parent=None,
+            disk_name='disk_single',
+            size=10,
+            digest=None,
+        )
+    )
+    student_dir = psef.files.ExtractFileTreeDirectory(
+        name='student', values=[], parent=None
+    )
+    student_dir.add_child(
+        psef.files.ExtractFileTreeFile(
+            name='code.py',
+            parent=None,
+            disk_name='disk_code',
+            size=5,
+            digest=None,
+        )
+    )
+    tree.add_child(student_dir)
+
+    course = m.Course.create_virtual_course(tree)
+    session.add(course)
+    session.flush()
+
+    assert course.virtual
+    assig, = course.assignments
+    works = {w.user.name: w for w in assig.submissions}
+    assert sorted(works) == ['Virtual - single.py', 'Virtual - student']
+
+    single = works['Virtual - single.py']
+    assert single.file_count == 1
+    assert single.total_file_size == 10
+    files = m.File.query.filter_by(work_id=single.id).all()
+    assert sorted((f.name, f.is_directory) for f in files) == [
+        ('single.py', False),
+        ('top', True),
+    ]
+    top = next(f for f in files if f.is_directory)
+    single_file = next(f for f in files if not f.is_directory)
+    assert single_file.parent_id == top.id
+    assert single_file.filename == 'disk_single'
+
+    student = works['Virtual - student']
+    assert student.file_count == 1
+    assert student.total_file_size == 5
+    files = m.File.query.filter_by(work_id=student.id).all()
+    assert sorted((f.name, f.is_directory) for f in files) == [
+        ('code.py', False),
+        ('student', True),
+    ]
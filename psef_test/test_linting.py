@@ -2,9 +2,11 @@
 """Here be dragons, watch out!
 """
 import os
+import sys
 import copy
 import time
 import datetime
+import threading
 from random import shuffle
 
 import pytest
@@ -448,6 +450,214 @@ def test_linters_permissions(
             )
 
 
+@pytest.mark.parametrize('filename', ['test_flake8.tar.gz'], indirect=True)
+@pytest.mark.parametrize('batch_crashes', [True, False])
+def test_linters_in_batch(
+    teacher_user, test_client, logged_in, assignment_real_works, session,
+    monkeypatch_celery, monkeypatch, batch_crashes
+):
+    assignment, _ = assignment_real_works
+    calls = {'run': 0, 'run_batch': 0}
+
+    def counting(name):
+        orig = getattr(psef.linters.Flake8, name)
+
+        def inner(*args, **kwargs):
+            calls[name] += 1
+            if name == 'run_batch' and batch_crashes:
+                raise psef.linters.LinterCrash
+            return orig(*args, **kwargs)
+
+        return inner
+
+    monkeypatch.setattr(psef.linters.Flake8, 'run', counting('run'))
+    monkeypatch.setattr(
+        psef.linters.Flake8, 'run_batch', counting('run_batch')
+    )
+
+    with logged_in(teacher_user):
+        test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/linter',
+            200,
+            data={
+                'name': 'Flake8',
+                'cfg': ''
+            },
+        )
+
+    assert calls['run_batch'] == 1
+    assert calls['run'] == (3 if batch_crashes else 0)
+
+    insts = session.query(m.LinterInstance).all()
+    assert len(insts) == 3
+    for inst in insts:
+        assert inst.state == m.LinterState.done
+        if batch_crashes:
+            assert 'linted together' not in inst.stdout
+        else:
+            # The output of a batch contains the files of other submissions
+            assert inst.stdout == psef.linters._BATCHED_OUTPUT_NOTE
+            assert inst.stderr == ''
+        codes = sorted(c.linter_code for c in inst.comments)
+        assert codes == sorted(['W191', 'E117', 'E211', 'E201', 'E202'])
+        assert all(c.file.work_id == inst.work_id for c in inst.comments)
+
+
+@pytest.mark.parametrize('filename', ['test_pylint.tar.gz'], indirect=True)
+@pytest.mark.parametrize('workers', [1, 3])
+def test_linters_in_parallel(
+    teacher_user, test_client, logged_in, assignment_real_works, session,
+    monkeypatch_celery, monkeypatch, app, workers
+):
+    assignment, _ = assignment_real_works
+    monkeypatch.setitem(app.config, 'LINTER_WORKERS', workers)
+    # All works can only pass this barrier if they are linted at the same time
+    barrier = threading.Barrier(3, timeout=30)
+    orig_run = psef.linters.Pylint.run
+
+    def run(*args, **kwargs):
+        if workers == 3:
+            barrier.wait()
+        return orig_run(*args, **kwargs)
+
+    monkeypatch.setattr(psef.linters.Pylint, 'run', run)
+
+    with logged_in(teacher_user):
+        test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/linter',
+            200,
+            data={
+                'name': 'Pylint',
+                'cfg': ''
+            },
+        )
+
+    insts = session.query(m.LinterInstance).all()
+    assert len(insts) == 3
+    comments = []
+    for inst in insts:
+        assert inst.state == m.LinterState.done
+        assert inst.stdout
+        comments.append(
+            sorted((c.line, c.linter_code) for c in inst.comments)
+        )
+    assert comments[0]
+    assert all(c == comments[0] for c in comments)
+
+
+@pytest.mark.parametrize(
+    'filename,linter,cfg', [
+        ('test_flake8.tar.gz', 'Flake8', ''),
+        ('test_pylint.tar.gz', 'Pylint', ''),
+    ],
+    indirect=['filename']
+)
+def test_linter_result_cache(
+    teacher_user, test_client, logged_in, assignment_real_works, session,
+    monkeypatch_celery, monkeypatch, linter, cfg
+):
+    assignment, _ = assignment_real_works
+
+    def get_comments():
+        insts = session.query(m.LinterInstance).all()
+        assert len(insts) == 3
+        assert all(inst.state == m.LinterState.done for inst in insts)
+        return sorted(
+            (c.file_id, c.line, c.linter_code, c.comment)
+            for inst in insts for c in inst.comments
+        )
+
+    def run_linter(cfg):
+        with logged_in(teacher_user):
+            return test_client.req(
+                'post',
+                f'/api/v1/assignments/{assignment.id}/linter',
+                200,
+                data={
+                    'name': linter,
+                    'cfg': cfg,
+                },
+            )['id']
+
+    linter_id = run_linter(cfg)
+    comments = get_comments()
+    assert comments
+    assert session.query(m.LinterResultCache).count() > 0
+
+    with logged_in(teacher_user):
+        test_client.req('delete', f'/api/v1/linters/{linter_id}', 204)
+
+    def crash(*_, **__):
+        raise psef.linters.LinterCrash
+
+    cls = psef.linters.get_linter_by_name(linter)
+    monkeypatch.setattr(cls, 'run', crash)
+    monkeypatch.setattr(cls, 'run_batch', crash)
+
+    # Everything is cached, so the linter should not run at all.
+    linter_id = run_linter(cfg)
+    assert get_comments() == comments
+
+    with logged_in(teacher_user):
+        test_client.req('delete', f'/api/v1/linters/{linter_id}', 204)
+
+    # A different config is not cached
+    run_linter(cfg + '\n')
+    insts = session.query(m.LinterInstance).all()
+    assert all(inst.state == m.LinterState.crashed for inst in insts)
+
+
+@pytest.mark.parametrize('filename', ['test_flake8.tar.gz'], indirect=True)
+def test_replace_linter_comments(
+    teacher_user, test_client, logged_in, assignment_real_works, session,
+    monkeypatch_celery
+):
+    assignment, single_work = assignment_real_works
+
+    with logged_in(teacher_user):
+        test_client.req(
+            'post',
+            f'/api/v1/assignments/{assignment.id}/linter',
+            200,
+            data={
+                'name': 'Flake8',
+                'cfg': ''
+            },
+        )
+
+    inst = session.query(m.LinterInstance).filter_by(
+        work_id=single_work['id']
+    ).one()
+    file_id = inst.comments[0].file_id
+    inst_id = inst.id
+    other_comments = session.query(m.LinterComment).filter(
+        m.LinterComment.linter_id != inst_id
+    ).count()
+    assert other_comments > 0
+
+    inst.replace_comments(
+        {
+            file_id: {
+                line: [('C1', f'msg {line}'), ('C2', 'other')]
+                for line in range(1250)
+            }
+        }
+    )
+    session.commit()
+
+    comments = session.query(m.LinterComment).filter_by(linter_id=inst_id)
+    assert comments.count() == 2500
+    assert all(c.file_id == file_id for c in comments)
+    assert comments.filter_by(line=1249, linter_code='C1').one().comment == (
+        'msg 1249'
+    )
+    assert session.query(m.LinterComment).filter(
+        m.LinterComment.linter_id != inst_id
+    ).count() == other_comments
+
+
 @pytest.mark.parametrize('with_works', [True], indirect=True)
 def test_whitespace_linter(
     teacher_user, test_client, assignment, logged_in, monkeypatch
@@ -808,3 +1018,52 @@ def test_detail_of_linter(
                             ) == (inst['state'] == 'crashed')
 
         assert pylint_seen
+
+
+def test_linter_daemon(app, monkeypatch, tmpdir):
+    monkeypatch.setitem(app.config, 'LINTER_DAEMON_START_TIMEOUT', 5)
+    server = tmpdir.join('server.py')
+    server.write(
+        'import sys, socket\n'
+        'sock = socket.socket(socket.AF_UNIX)\n'
+        'sock.bind(sys.argv[1])\n'
+        'sock.listen(5)\n'
+        'while True:\n'
+        '    sock.accept()[0].close()\n'
+    )
+    program = ['echo', 'program', '{files}']
+
+    daemon = psef.linter_daemon.get_daemon(
+        'test_daemon',
+        [sys.executable, str(server), '{socket}'],
+        ['echo', 'daemon', '{files}'],
+    )
+    assert daemon is psef.linter_daemon.get_daemon(
+        'test_daemon', ['a'], ['b']
+    )
+    try:
+        out = psef.linter_daemon.run_program(program, daemon, files='a')
+        assert out.stdout == 'daemon a\n'
+        assert daemon.is_healthy()
+
+        # A crashed daemon should be restarted for the next job
+        daemon._proc.kill()
+        daemon._proc.wait()
+        assert not daemon.is_healthy()
+        out = psef.linter_daemon.run_program(program, daemon, files='b')
+        assert out.stdout == 'daemon b\n'
+        assert daemon.restarts == 1
+    finally:
+        daemon.stop()
+    assert not daemon.is_healthy()
+
+    broken = psef.linter_daemon.LinterDaemon(
+        'broken', [sys.executable, '-c', 'pass'], ['echo', 'daemon']
+    )
+    out = psef.linter_daemon.run_program(program, broken, files='c')
+    assert out.stdout == 'program c\n'
+    assert not broken.is_healthy()
+
+    assert psef.linter_daemon.get_daemon('disabled', [], ['echo']) is None
+    out = psef.linter_daemon.run_program(program, None, files='d')
+    assert out.stdout == 'program d\n'
@@ -1,6 +1,7 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 import io
 import os
+import json
 import zipfile
 import datetime
 
@@ -8,6 +9,7 @@ import pytest
 from pytest import approx
 
 import psef.models as m
+import psef.models.work
 from helpers import create_marker
 
 http_error = create_marker(pytest.mark.http_error)
@@ -915,6 +917,63 @@ def test_get_dir_contents(
             )
 
 
+def test_dir_contents_cache(
+    test_client, logged_in, student_user, assignment_real_works, session
+):
+    assignment, work = assignment_real_works
+    work_id = work['id']
+
+    def get_tree():
+        res = test_client.req(
+            'get', f'/api/v1/submissions/{work_id}/files/', 200
+        )
+        return res, [e['name'] for e in res['entries']]
+
+    with logged_in(student_user):
+        tree, names = get_tree()
+        assert names == ['single_file_work', 'single_file_work_copy']
+        assert get_tree()[0] == tree
+
+        stored = m.FileTreeCache.query.filter_by(work_id=work_id).all()
+        assert len(stored) == 1
+        assert json.loads(stored[0].tree) == tree
+
+        # The stored tree is used if this process did not cache the tree.
+        psef.models.work._FILE_TREES.clear()
+        stored[0].tree = json.dumps({**tree, 'entries': []})
+        session.commit()
+        assert get_tree()[1] == []
+        stored[0].tree = json.dumps(tree)
+        session.commit()
+
+        new_file = test_client.req(
+            'post',
+            f'/api/v1/submissions/{work_id}/files/',
+            200,
+            query={'path': '/single_dir_archive.zip/new_file'},
+            real_data='NEW_FILE',
+        )
+        assert get_tree()[1] == [
+            'new_file', 'single_file_work', 'single_file_work_copy'
+        ]
+
+        test_client.req(
+            'patch',
+            f'/api/v1/code/{new_file["id"]}',
+            200,
+            query={
+                'operation': 'rename',
+                'new_path': '/single_dir_archive.zip/renamed',
+            },
+        )
+        assert get_tree()[1] == [
+            'renamed', 'single_file_work', 'single_file_work_copy'
+        ]
+
+        test_client.req('delete', f'/api/v1/code/{new_file["id"]}', 204)
+        assert get_tree()[1] == ['single_file_work', 'single_file_work_copy']
+
+
 @pytest.mark.parametrize('user_type', ['student'])
 @pytest.mark.parametrize(
     'named_user, get_own', [
@@ -1067,6 +1126,57 @@ def test_get_teacher_zip_file(
     }
 
 
+@pytest.mark.parametrize(
+    'filename', ['../test_submissions/multiple_dir_archive.zip'],
+    indirect=True
+)
+@pytest.mark.parametrize('compression', ['deflate', 'store', None])
+def test_stream_zip_file(
+    test_client, logged_in, assignment_real_works, error_template, ta_user,
+    compression
+):
+    assignment, work = assignment_real_works
+    work_id = work['id']
+
+    with logged_in(ta_user):
+        query = {'owner': 'student'}
+        if compression is not None:
+            query['compression'] = compression
+        res = test_client.get(
+            f'/api/v1/submissions/{work_id}/zip',
+            query_string=query,
+        )
+
+        assert res.status_code == 200
+        assert res.mimetype == 'application/zip'
+        assert 'attachment' in res.headers['Content-Disposition']
+        zfiles = zipfile.ZipFile(io.BytesIO(res.get_data()))
+        assert zfiles.testzip() is None
+        infos = zfiles.infolist()
+        assert set(f.filename for f in infos) == {
+            'multiple_dir_archive.zip/',
+            'multiple_dir_archive.zip/dir/single_file_work',
+            'multiple_dir_archive.zip/dir/single_file_work_copy',
+            'multiple_dir_archive.zip/dir2/single_file_work',
+            'multiple_dir_archive.zip/dir2/single_file_work_copy',
+        }
+        expected_compression = (
+            zipfile.ZIP_STORED
+            if compression == 'store' else zipfile.ZIP_DEFLATED
+        )
+        for info in infos:
+            if not info.is_dir():
+                assert info.compress_type == expected_compression
+
+        test_client.req(
+            'get',
+            f'/api/v1/submissions/{work_id}/zip',
+            400,
+            query={'compression': 'lzma'},
+            result=error_template,
+        )
+
+
 @pytest.mark.parametrize(
     'named_user', [
         'Thomas Schaper',